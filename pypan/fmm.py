@@ -0,0 +1,315 @@
+"""Approximation of vortex ring panel influences using a multipole expansion over an octree of panels, stored in sparse matrices rather than as a dense influence matrix."""
+
+import numpy as np
+import scipy.sparse as sp
+
+from pypan.octree import Octree
+from pypan.helpers import OneLineProgress
+
+
+def _get_multi_indices(P):
+    # Returns a list of all 3D multi-indices of degree P or less, sorted by degree
+
+    indices = []
+    for n in range(P+1):
+        for i in range(n, -1, -1):
+            for j in range(n-i, -1, -1):
+                indices.append((i, j, n-i-j))
+    return indices
+
+
+def get_near_field_influences(mesh, source_tree, target_tree, near, normals=None, mu=None, prog=None):
+    # Determines the exact influence of the panels of the mesh in nearby clusters of the source tree on the points of the target tree. If normals are given, returns the sparse matrix of normal influences. Otherwise, returns the velocity induced by the doublet strengths mu.
+
+    # Sort pairs by target leaf
+    near = near[np.argsort(near[:,0], kind='stable')]
+    targets, first = np.unique(near[:,0], return_index=True)
+    last = np.append(first[1:], len(near))
+
+    rows = []
+    cols = []
+    data = []
+    v = np.zeros((target_tree.N, 3))
+    for t, i0, i1 in zip(targets, first, last):
+
+        # Get all panels near this target leaf
+        points = target_tree.get_points_in_node(t)
+        panels = np.concatenate([source_tree.get_points_in_node(s) for s in near[i0:i1,1]])
+        inf = mesh.get_ring_influences(target_tree.points[points], panels=panels)
+
+        # Store
+        if normals is not None:
+            rows.append(np.repeat(points, len(panels)).astype(np.int32))
+            cols.append(np.tile(panels, len(points)).astype(np.int32))
+            data.append(np.einsum('ijk,ik->ij', inf, normals[points]).flatten())
+        else:
+            v[points] += np.einsum('ijk,j', inf, mu[panels])
+
+        if prog is not None:
+            prog.display()
+
+    if normals is None:
+        return v
+    return sp.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(target_tree.N, mesh.N))
+
+
+class FMMInfluence:
+    """Approximates the influence of the vortex ring panels of a mesh using a multipole expansion over an octree of panels. Nearby influences are calculated exactly. The near-field influences, cluster moments, and far-field influences are stored as sparse matrices, requiring O(N log N) memory.
+
+    Parameters
+    ----------
+    mesh : Mesh
+        Mesh whose panel influences are to be approximated.
+
+    order : int, optional
+        Order of the multipole expansion. An order of 0 treats each cluster of panels as a point doublet. Defaults to 2.
+
+    theta : float, optional
+        Opening criterion. Clusters are considered well separated if the sum of their radii is less than theta times the distance between their centers. Smaller values are more accurate but more expensive. Defaults to 0.5.
+
+    leaf_size : int, optional
+        Maximum number of panels in the smallest clusters. Defaults to 32.
+
+    verbose : bool, optional
+    """
+
+    def __init__(self, mesh, **kwargs):
+
+        # Get kwargs
+        self._mesh = mesh
+        self._order = kwargs.get("order", 2)
+        self._theta = kwargs.get("theta", 0.5)
+        self._leaf_size = kwargs.get("leaf_size", 32)
+        verbose = kwargs.get("verbose", False)
+
+        # Get vector area and size of each panel; far from the panel, it acts as a point doublet with strength proportional to its vector area
+        self._N_panels = mesh.N
+        self._a = np.zeros((self._N_panels, 3))
+        extents = np.zeros(self._N_panels)
+        for i, panel in enumerate(mesh.panels):
+            self._a[i] = 0.5*np.sum(np.cross(np.roll(panel.vertices, 1, axis=0), panel.vertices), axis=0)
+            extents[i] = np.max(np.linalg.norm(panel.vertices-mesh.cp[i][np.newaxis,:], axis=1))
+
+        # Cluster panels
+        self._tree = Octree(mesh.cp, extents, leaf_size=self._leaf_size)
+
+        # Get multi-indices for the Taylor expansion; the moments include terms up to order+1 and the velocity requires one more derivative
+        self._multi_indices = _get_multi_indices(self._order+2)
+        index_map = { k : i for i, k in enumerate(self._multi_indices) }
+        self._moment_indices = [k for k in self._multi_indices if 0 < sum(k) <= self._order+1]
+        self._N_moments = len(self._moment_indices)
+
+        # Determine the Taylor coefficient and factor required for each moment and velocity component
+        self._shift_ind = np.zeros((self._N_moments, 3), dtype=int)
+        self._shift_fac = np.zeros((self._N_moments, 3))
+        for m, k in enumerate(self._moment_indices):
+            for l in range(3):
+                k_shift = list(k)
+                k_shift[l] += 1
+                self._shift_ind[m,l] = index_map[tuple(k_shift)]
+                self._shift_fac[m,l] = k[l]+1
+
+        # Determine indices of lower-degree coefficients used in the recurrence relation
+        self._recurrence = []
+        for k in self._multi_indices[1:]:
+            first = []
+            second = []
+            for i in range(3):
+                if k[i] > 0:
+                    k_prev = list(k)
+                    k_prev[i] -= 1
+                    first.append((i, index_map[tuple(k_prev)]))
+                if k[i] > 1:
+                    k_prev[i] -= 1
+                    second.append(index_map[tuple(k_prev)])
+            self._recurrence.append((sum(k), first, second))
+
+        # Get matrix mapping doublet strengths to cluster moments
+        self._moment_matrix = self._get_moment_matrix()
+
+        # Get near- and far-field influence matrices for the control points
+        near, far = self._tree.get_interactions(self._tree, self._theta)
+        if verbose:
+            print()
+            prog = OneLineProgress(len(np.unique(near[:,0]))+1, msg="Calculating near-field panel influences")
+        self._near_matrix = get_near_field_influences(mesh, self._tree, self._tree, near, normals=mesh.n, prog=prog if verbose else None)
+        self._far_matrix = self._get_far_field(self._tree, far, normals=mesh.n)
+        if verbose:
+            prog.display()
+
+        # Display statistics
+        if verbose:
+            print()
+            print("    Multipole Parameters:")
+            print("        Octree levels: {0}".format(self._tree.N_levels))
+            print("        Octree leaves: {0}".format(np.sum(self._tree.is_leaf)))
+            print("        Expansion order: {0}".format(self._order))
+            print("        Opening criterion: {0}".format(self._theta))
+            print("        Near-field fraction: {0}".format(self._near_matrix.nnz/self._N_panels**2))
+            print("        Stored entries relative to dense: {0}".format((self._near_matrix.nnz+self._far_matrix.nnz+self._moment_matrix.nnz)/self._N_panels**2))
+
+
+    def _get_moment_matrix(self):
+        # Determines the matrix mapping the panel doublet strengths to the multipole moments of each cluster; the first index is the cluster and moment, the second is the panel
+
+        # Get displacement of each panel from the center of each cluster it belongs to
+        nodes, panels = self._tree.get_node_point_pairs()
+        d = self._mesh.cp[panels]-self._tree.centers[nodes]
+
+        # Determine the contribution of each panel to each moment
+        data = np.zeros((self._N_moments, len(panels)))
+        for m, k in enumerate(self._moment_indices):
+            for i in range(3):
+                if k[i] > 0:
+                    p = list(k)
+                    p[i] -= 1
+                    data[m] += k[i]*self._a[panels,i]*d[:,0]**p[0]*d[:,1]**p[1]*d[:,2]**p[2]
+
+        rows = nodes[np.newaxis,:]*self._N_moments+np.arange(self._N_moments)[:,np.newaxis]
+        return sp.csr_matrix((data.flatten(), (rows.flatten(), np.tile(panels, self._N_moments))), shape=(self._tree.N_nodes*self._N_moments, self._N_panels))
+
+
+    def _get_taylor_coefficients(self, r):
+        # Determines the Taylor coefficients of 1/|r| (the derivatives divided by the factorial of the multi-index) for each displacement vector
+
+        R2 = np.sum(r*r, axis=1)
+        a = np.zeros((len(r), len(self._multi_indices)))
+        a[:,0] = 1.0/np.sqrt(R2)
+        for j, (n, first, second) in enumerate(self._recurrence):
+            for i, k_prev in first:
+                a[:,j+1] += (2*n-1)*r[:,i]*a[:,k_prev]
+            for k_prev in second:
+                a[:,j+1] -= (n-1)*a[:,k_prev]
+            a[:,j+1] /= n*R2
+
+        return a
+
+
+    def _expand_far_pairs(self, target_tree, far):
+        # Expands pairs of well-separated clusters into blocks of (target point, source cluster) pairs
+
+        counts = target_tree.stop[far[:,0]]-target_tree.start[far[:,0]]
+        offsets = np.cumsum(counts)-counts
+        N_block = 2**16
+        for i in range(0, np.sum(counts), N_block):
+
+            # Get clusters which have points in this block
+            first = np.searchsorted(offsets, i, side='right')-1
+            last = np.searchsorted(offsets, i+N_block, side='left')
+            block = far[first:last]
+            block_counts = counts[first:last]
+            block_offsets = offsets[first:last]
+
+            # Get points
+            positions = np.arange(np.sum(block_counts))-np.repeat(np.cumsum(block_counts)-block_counts, block_counts)+np.repeat(target_tree.start[block[:,0]], block_counts)
+            points = target_tree.indices[positions]
+            sources = np.repeat(block[:,1], block_counts)
+
+            # Trim to block
+            keep = slice(max(0, i-block_offsets[0]), min(len(points), i+N_block-block_offsets[0]))
+            yield points[keep], sources[keep]
+
+
+    def _get_far_field(self, target_tree, far, normals):
+        # Determines the sparse matrix mapping cluster moments to the normal velocity at the target points
+
+        rows = []
+        cols = []
+        data = []
+        for points, sources in self._expand_far_pairs(target_tree, far):
+
+            # Get Taylor coefficients
+            a = self._get_taylor_coefficients(target_tree.points[points]-self._tree.centers[sources])
+
+            # Determine influence of each moment on the normal velocity
+            coefs = np.zeros((len(points), self._N_moments))
+            for l in range(3):
+                coefs += self._shift_fac[np.newaxis,:,l]*a[:,self._shift_ind[:,l]]*normals[points,l,np.newaxis]
+
+            rows.append(np.repeat(points, self._N_moments).astype(np.int32))
+            cols.append((sources[:,np.newaxis]*self._N_moments+np.arange(self._N_moments)[np.newaxis,:]).flatten().astype(np.int32))
+            data.append(0.25/np.pi*coefs.flatten())
+
+        if len(rows) == 0:
+            return sp.csr_matrix((target_tree.N, self._tree.N_nodes*self._N_moments))
+        return sp.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(target_tree.N, self._tree.N_nodes*self._N_moments))
+
+
+    def get_near_field_matrix(self):
+        """Returns the exact normal influence of nearby panels on each control point, which is a sparse approximation of the full normal influence matrix.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Near-field normal influence matrix; the first index is the influenced panel and the second is the influencing panel.
+        """
+
+        return self._near_matrix
+
+
+    def get_normal_influence(self, mu):
+        """Determines the velocity normal to each panel at its control point induced by the panels with the given doublet strengths.
+
+        Parameters
+        ----------
+        mu : ndarray
+            Doublet strength of each panel.
+
+        Returns
+        -------
+        ndarray
+            Normal velocity at each control point.
+        """
+
+        return self._near_matrix.dot(mu)+self._far_matrix.dot(self._moment_matrix.dot(mu))
+
+
+    def get_transposed_normal_influence(self, v):
+        """Applies the transpose of the approximate normal influence matrix given by get_normal_influence() to the given vector.
+
+        Parameters
+        ----------
+        v : ndarray
+            Vector with one entry for each control point.
+
+        Returns
+        -------
+        ndarray
+            Vector with one entry for each panel.
+        """
+
+        return self._near_matrix.T.dot(v)+self._moment_matrix.T.dot(self._far_matrix.T.dot(v))
+
+
+    def get_velocities(self, points, mu):
+        """Determines the velocity induced at arbitrary points by the panels with the given doublet strengths.
+
+        Parameters
+        ----------
+        points : ndarray
+            Array of points at which to calculate the velocity.
+
+        mu : ndarray
+            Doublet strength of each panel.
+
+        Returns
+        -------
+        ndarray
+            Velocity at each point.
+        """
+
+        # Find interactions with the panel clusters
+        target_tree = Octree(points, leaf_size=self._leaf_size)
+        near, far = self._tree.get_interactions(target_tree, self._theta)
+
+        # Near field
+        v = get_near_field_influences(self._mesh, self._tree, target_tree, near, mu=mu)
+
+        # Far field
+        moments = self._moment_matrix.dot(mu).reshape((self._tree.N_nodes, self._N_moments))
+        for p, s in self._expand_far_pairs(target_tree, far):
+            a = self._get_taylor_coefficients(points[p]-self._tree.centers[s])
+            for l in range(3):
+                v[:,l] += 0.25/np.pi*np.bincount(p, weights=np.sum(moments[s]*self._shift_fac[np.newaxis,:,l]*a[:,self._shift_ind[:,l]], axis=1), minlength=len(points))
+
+        return v
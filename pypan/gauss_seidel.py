@@ -1,116 +1,241 @@
+import os
+import warnings
 import multiprocessing as mp
 import numpy as np
+import scipy.linalg as sl
+
+from multiprocessing import shared_memory
+
+
+def _get_diagonal_factors(A, blocks):
+    # Determines the LU decomposition of each diagonal block of A
+
+    return [sl.lu_factor(A[I,I]) for I in blocks]
+
+
+def _sweep(A, b, x, blocks, factors, omega):
+    # Performs one block successive over-relaxation sweep through the given blocks of rows, updating x in place
+
+    for I, factor in zip(blocks, factors):
+        r = b[I]-np.matmul(A[I], x)+np.matmul(A[I,I], x[I])
+        x[I] = (1.0-omega)*x[I]+omega*sl.lu_solve(factor, r)
 
 
 def gauss_seidel(A, b, **kwargs):
-    # Uses the Gauss-Seidel method to solve A*x=b
+    # Uses the block symmetric successive over-relaxation method to solve A*x=b. Each iteration sweeps forward then backward through blocks of rows, solving exactly for the unknowns of each block using the LU decomposition of its diagonal block, so all the work is done by matrix-vector products. With a relaxation factor of 1, this is the symmetric block Gauss-Seidel method. Iteration stops when the residual norm relative to that of b is below the tolerance. Poorly conditioned systems, such as the normal equations of a closed mesh, converge too slowly to be solved.
 
     # Get kwargs
     tolerance = kwargs.get("gs_convergence", 1e-10)
     max_iterations = kwargs.get("gs_max_iterations", 10000)
+    omega = kwargs.get("gs_relaxation", 1.0)
+    N_block = kwargs.get("gs_block_size", 256)
     verbose = kwargs.get("verbose", False)
-    
+
     # Initial guess
-    x = np.zeros_like(b, dtype=np.double)
+    b_shape = b.shape
+    b = b.flatten()
+    x0 = kwargs.get("gs_initial_guess", None)
+    x = np.zeros_like(b, dtype=np.double) if x0 is None else np.array(x0, dtype=np.double).flatten()
+
+    # Get blocks and factor diagonal blocks
+    blocks = [slice(i, min(i+N_block, len(b))) for i in range(0, len(b), N_block)]
+    factors = _get_diagonal_factors(A, blocks)
+    b_norm = np.linalg.norm(b)
+    if b_norm == 0.0:
+        b_norm = 1.0
 
     if verbose:
         print()
         print("Running Gauss-Seidel")
-        print("{0:<20}{1:<20}".format("Iteration", "Error"))
-    
-    #Iterate
+        print("{0:<20}{1:<20}".format("Iteration", "Residual"))
+
+    # Iterate
+    err = np.inf
     for k in range(max_iterations):
-        
-        x_old  = x.copy()
 
-        #Loop over rows
-        for i in range(A.shape[0]):
-            x[i] = (b[i] - np.dot(A[i,:i], x[:i]) - np.dot(A[i,(i+1):], x_old[(i+1):])) / A[i ,i]
+        # Forward and backward sweeps
+        _sweep(A, b, x, blocks, factors, omega)
+        _sweep(A, b, x, blocks[::-1], factors[::-1], omega)
 
-        # Check error
-        err = np.max(np.abs((x - x_old)/np.max(np.abs(x))))
+        # Check residual
+        err = np.linalg.norm(b-np.matmul(A, x))/b_norm
 
         # Print progress on every twentieth iteration
         if verbose and k%20 == 0:
             print("{0:<20}{1:<20.5e}".format(k, err))
-            
-        #Stop condition 
+
+        # Stop condition
         if err < tolerance:
             break
-            
-    return x
 
+    if err >= tolerance:
+        warnings.warn("Gauss-Seidel did not converge to a relative residual of {0} in {1} iterations. The final relative residual is {2:e}.".format(tolerance, max_iterations, err))
 
-def gauss_seidel_segment(args):
-    # Does Gauss-Seidel iterations on the specified slice of the problem A*x=b
+    return x.reshape(b_shape)
 
-    A, b, x, i_min, i_max, iterations = args
-    
-    # Iterate
-    for k in range(iterations):
-        
-        # Loop over rows in the assigned slice
-        for i in range(i_min, i_max):
-            x[i] = (b[i] - np.dot(A[i,:i], x[:i]) - np.dot(A[i,(i+1):], x[(i+1):])) / A[i ,i]
 
-    return x
-            
+def _is_stagnant(history, window):
+    # Determines whether the residual has failed to fall by at least 1% over the last given number of iterations
 
-def gauss_seidel_multiprocess(A, b, **kwargs):
-    # Uses the Gauss-Seidel method to solve A*x=b with multiple processes
+    return len(history) > window and min(history[-window:]) > 0.99*min(history[:-window])
 
-    # Get kwargs
-    tolerance = kwargs.get("gs_convergence", 1e-10)
-    max_iterations = kwargs.get("gs_max_iterations", 10000)
-    verbose = kwargs.get("verbose", False)
 
-    # Options
-    sub_iterations = 1
-    processes = os.cpu_count()
-    processes = 4
+def _gauss_seidel_worker(connection, A_name, x_name, x_new_name, N, b, rows, omega, N_block):
+    # Does symmetric Gauss-Seidel iterations on the given segment of rows of A*x=b whenever requested, holding the unknowns outside the segment fixed at the current estimate, and writes the result to the new estimate. The diagonal blocks of the segment are factored once, as the segment always belongs to this process. Stops when sent None.
 
-    # Create slices of the problem for each process to tackle
-    N = b.size
-    N_per_process = N//processes
-    
-    # Do one initial iteration
-    x = np.zeros_like(b)
+    # Attach to the system matrix and solution vectors in shared memory
+    shms = [shared_memory.SharedMemory(name=name) for name in [A_name, x_name, x_new_name]]
+    A = np.ndarray((N, N), dtype=np.double, buffer=shms[0].buf)
+    x_shared = np.ndarray(N, dtype=np.double, buffer=shms[1].buf)
+    x_new = np.ndarray(N, dtype=np.double, buffer=shms[2].buf)
 
-    # Create arg list
-    arg_list = []
-    for i in range(processes):
-        arg_list.append((A, b, x, i*N_per_process, (i+1)*N_per_process, sub_iterations))
+    # Get blocks of this segment and factor their diagonal blocks
+    blocks = [slice(i, min(i+N_block, rows.stop)) for i in range(rows.start, rows.stop, N_block)]
+    factors = _get_diagonal_factors(A, blocks)
+    connection.send(True)
 
-    if verbose:
-        print()
-        print("Running Gauss-Seidel")
-        print("{0:<20}{1:<20}".format("Iteration", "Error"))
+    # Iterate whenever requested
+    while True:
+        iterations = connection.recv()
+        if iterations is None:
+            break
+        x = np.array(x_shared)
+        for k in range(iterations):
+            _sweep(A, b, x, blocks, factors, omega)
+            _sweep(A, b, x, blocks[::-1], factors[::-1], omega)
+        x_new[rows] = x[rows]
+        connection.send(True)
 
-    # Create pool
-    with mp.Pool(processes) as pool:
-    
-        #Iterate
-        for k in range(max_iterations//sub_iterations):
+    # Release shared memory; the arrays must be deleted first as they reference it
+    A = x_shared = x_new = None
+    for shm in shms:
+        shm.close()
 
-            # Store previous x vector
-            x_old = np.copy(x)
 
-            # Send off subprocesses
-            results = pool.map(gauss_seidel_segment, arg_list)
+def _receive(process, connection, timeout=1.0):
+    # Waits for a message from the given worker process, raising an error if the process exits without sending one
+
+    while not connection.poll(timeout):
+        if process.exitcode is not None:
+            break
+    try:
+        return connection.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError("A parallel Gauss-Seidel worker process exited unexpectedly with exit code {0}.".format(process.exitcode))
+
+
+def gauss_seidel_multiprocess(A, b, **kwargs):
+    # Uses the block Jacobi method with symmetric Gauss-Seidel inner iterations on one segment of rows per process to solve A*x=b, where A is symmetric positive definite and diagonally dominant
+
+    # Get kwargs
+    tolerance = kwargs.get("gs_convergence", 1e-10)
+    max_iterations = kwargs.get("gs_max_iterations", 10000)
+    omega = kwargs.get("gs_relaxation", 1.0)
+    N_block = kwargs.get("gs_block_size", 256)
+    n_workers = kwargs.get("gs_n_workers", os.cpu_count())
+    sub_iterations = kwargs.get("gs_inner_iterations", 1)
+    stagnation_window = kwargs.get("gs_stagnation_window", 100)
+    verbose = kwargs.get("verbose", False)
 
-            # Reconstruct x
-            for i, result in enumerate(results):
-                x[arg_list[i][3]:arg_list[i][4]] = result[arg_list[i][3]:arg_list[i][4]]
+    # Create segments of the problem for each process to tackle
+    b_shape = b.shape
+    b = np.array(b, dtype=np.double).flatten()
+    N = len(b)
+    bounds = np.linspace(0, N, min(n_workers, N)+1).astype(int)
+    segments = [slice(bounds[i], bounds[i+1]) for i in range(len(bounds)-1)]
+
+    # Put the system matrix and solution vectors in shared memory
+    shms = [shared_memory.SharedMemory(create=True, size=size*np.dtype(np.double).itemsize) for size in [N*N, N, N]]
+    processes = []
+    try:
+        A_shared = np.ndarray((N, N), dtype=np.double, buffer=shms[0].buf)
+        A_shared[:] = A
+        x = np.ndarray(N, dtype=np.double, buffer=shms[1].buf)
+        x_new = np.ndarray(N, dtype=np.double, buffer=shms[2].buf)
+
+        # Initial guess
+        x0 = kwargs.get("gs_initial_guess", None)
+        x[:] = 0.0 if x0 is None else np.array(x0, dtype=np.double).flatten()
+        b_norm = np.linalg.norm(b)
+        if b_norm == 0.0:
+            b_norm = 1.0
+        r = b-np.matmul(A_shared, x)
+        err = np.linalg.norm(r)/b_norm
+        history = [err]
+
+        if verbose:
+            print()
+            print("Running Gauss-Seidel")
+            print("{0:<20}{1:<20}".format("Iteration", "Residual"))
+
+        # Start one process for each segment
+        for segment in segments:
+            connection, worker_connection = mp.Pipe()
+            process = mp.Process(target=_gauss_seidel_worker, args=(worker_connection, shms[0].name, shms[1].name, shms[2].name, N, b, segment, omega, N_block))
+            process.start()
+            processes.append((process, connection))
+
+            # Only the worker should hold its end of the pipe, so that the pipe is closed if the worker exits
+            worker_connection.close()
+        for process, connection in processes:
+            _receive(process, connection)
+
+        # Iterate
+        stalled = False
+        for k in range(max_iterations):
+
+            # Stop condition
+            if err < tolerance:
+                break
 
-            # Check error
-            err = np.max(np.abs((x - x_old)/np.max(np.abs(x))))
+            # Send off subprocesses
+            for process, connection in processes:
+                connection.send(sub_iterations)
+            for process, connection in processes:
+                _receive(process, connection)
+
+            # Combine segments, choosing the length of the update to minimize the error in the norm of A
+            d = x_new-x
+            Ad = np.matmul(A_shared, d)
+            d_r = np.inner(d, r)
+            d_Ad = np.inner(d, Ad)
+            if not d_r > 0.0 or not d_Ad > 0.0:
+                stalled = True
+                break
+            theta = d_r/d_Ad
+            x += theta*d
+            r -= theta*Ad
+            err = np.linalg.norm(r)/b_norm
+            history.append(err)
 
             # Print progress on every outer iteration
             if verbose:
-                print("{0:<20}{1:<20.5e}".format(k*sub_iterations, err))
+                print("{0:<20}{1:<20.5e}".format(k, err))
 
-            #Stop condition 
-            if err < tolerance:
+            # Check for stagnation
+            if _is_stagnant(history, stagnation_window):
+                stalled = True
                 break
 
-        return np.array(x)
\ No newline at end of file
+        result = np.copy(x).reshape(b_shape)
+
+        if err >= tolerance:
+            if stalled:
+                warnings.warn("Parallel Gauss-Seidel did not converge to a relative residual of {0}, as the updates stopped reducing the residual after {1} iterations. The final relative residual is {2:e}.".format(tolerance, len(history)-1, err))
+            else:
+                warnings.warn("Parallel Gauss-Seidel did not converge to a relative residual of {0} in {1} iterations. The final relative residual is {2:e}.".format(tolerance, max_iterations, err))
+
+    # Stop processes and release shared memory; the arrays must be deleted first as they reference it
+    finally:
+        for process, connection in processes:
+            if process.is_alive():
+                connection.send(None)
+            process.join()
+            connection.close()
+        A_shared = x = x_new = None
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return result
@@ -0,0 +1,506 @@
+"""Hierarchical matrix (H-matrix) approximation of the vortex ring panel normal influence matrix."""
+
+import numpy as np
+import scipy.linalg as sl
+
+from pypan.octree import Octree
+from pypan.fmm import get_near_field_influences
+from pypan.helpers import OneLineProgress
+
+
+def truncate(U, V, tolerance):
+    """Recompresses the low-rank matrix UV* to the lowest rank approximating it to the given relative accuracy (in the 2-norm), using QR decompositions of U and V and the singular value decomposition of the product of their triangular factors.
+
+    Parameters
+    ----------
+    U : ndarray
+        Left factor.
+
+    V : ndarray
+        Right factor.
+
+    tolerance : float
+        Singular values smaller than this fraction of the largest are discarded.
+
+    Returns
+    -------
+    U : ndarray
+        Recompressed left factor.
+
+    V : ndarray
+        Recompressed right factor.
+    """
+
+    Q_U, R_U = sl.qr(U, mode='economic')
+    Q_V, R_V = sl.qr(V, mode='economic')
+    W, s, Zt = sl.svd(np.matmul(R_U, R_V.T))
+    rank = np.sum(s > tolerance*s[0]) if len(s) > 0 and s[0] > 0.0 else 0
+    return np.matmul(Q_U, W[:,:rank]*s[np.newaxis,:rank]), np.matmul(Q_V, Zt[:rank].T)
+
+
+class HMatrix:
+    """Approximates the normal influence matrix of the vortex ring panels of a mesh as a hierarchical matrix. The panels are clustered in an octree. Blocks of the matrix coupling well-separated clusters are stored in low-rank form, found by adaptive cross approximation (ACA) with partial pivoting, which only requires calculating a few rows and columns of each block. Blocks coupling nearby clusters are calculated exactly and stored in a sparse matrix. Memory and assembly time scale as O(N log N).
+
+    Parameters
+    ----------
+    mesh : Mesh
+        Mesh whose panel influences are to be approximated.
+
+    tolerance : float, optional
+        Relative accuracy (in the Frobenius norm) to which each low-rank block is approximated. Defaults to 1e-6.
+
+    theta : float, optional
+        Admissibility criterion. Clusters are considered well separated if the sum of their radii is less than theta times the distance between their centers. Defaults to 1.0.
+
+    leaf_size : int, optional
+        Maximum number of panels in the smallest clusters. Defaults to 32.
+
+    verbose : bool, optional
+    """
+
+    def __init__(self, mesh, **kwargs):
+
+        # Get kwargs
+        self._mesh = mesh
+        self._tolerance = kwargs.get("tolerance", 1e-6)
+        self._theta = kwargs.get("theta", 1.0)
+        self._leaf_size = kwargs.get("leaf_size", 32)
+        verbose = kwargs.get("verbose", False)
+        self._N_panels = mesh.N
+
+        # Get panel vertices, repeating the last vertex of triangular panels so all panels may be treated as quadrilaterals
+        self._panel_vertices = np.zeros((self._N_panels, 4, 3))
+        extents = np.zeros(self._N_panels)
+        for i, panel in enumerate(mesh.panels):
+            self._panel_vertices[i,:panel.N] = panel.vertices
+            self._panel_vertices[i,panel.N:] = panel.vertices[-1]
+            extents[i] = np.max(np.linalg.norm(panel.vertices-mesh.cp[i][np.newaxis,:], axis=1))
+
+        # Cluster panels and determine which blocks are admissible
+        self._tree = Octree(mesh.cp, extents, leaf_size=self._leaf_size)
+        near, far = self._tree.get_interactions(self._tree, self._theta)
+
+        # Small blocks are cheaper to calculate exactly, so they are stored with the near field
+        sizes = (self._tree.stop-self._tree.start)
+        small = sizes[far[:,0]]*sizes[far[:,1]] <= 2*self._leaf_size**2
+        near = np.concatenate((near, far[small]))
+        far = far[~small]
+
+        if verbose:
+            print()
+            prog = OneLineProgress(len(far)+1, msg="Calculating hierarchical panel influence matrix")
+
+        # Get near-field blocks
+        self._near_matrix = get_near_field_influences(mesh, self._tree, self._tree, near, normals=mesh.n)
+        if verbose:
+            prog.display()
+
+        # Get low-rank blocks; the cluster pair of each is kept for factoring
+        self._far = far
+        self._blocks = []
+        for t, s in far:
+            rows = self._tree.get_points_in_node(t)
+            cols = self._tree.get_points_in_node(s)
+            U, V = self._get_low_rank_block(rows, cols)
+            self._blocks.append((rows, cols, U, V))
+            if verbose:
+                prog.display()
+
+        # Display statistics
+        if verbose:
+            ranks = np.array([block[2].shape[1] for block in self._blocks if block[3] is not None])
+            N_stored = self._near_matrix.nnz+sum([block[2].size+(block[3].size if block[3] is not None else 0) for block in self._blocks])
+            print()
+            print("    Hierarchical Matrix Parameters:")
+            print("        Octree levels: {0}".format(self._tree.N_levels))
+            print("        Dense blocks: {0}".format(len(near)+len(self._blocks)-len(ranks)))
+            print("        Low-rank blocks: {0}".format(len(ranks)))
+            if len(ranks) > 0:
+                print("        Maximum block rank: {0}".format(np.max(ranks)))
+                print("        Average block rank: {0}".format(np.average(ranks)))
+            print("        Stored entries relative to dense: {0}".format(N_stored/self._N_panels**2))
+
+
+    def _get_entries(self, rows, cols):
+        # Calculates the normal influence of the given panels on the control points of the given panels; first index is the row, second is the column
+
+        # Determine displacement vectors to each vertex; the first index is the row, the second is the column, and the third is the vertex
+        x = self._mesh.cp[rows,0][:,np.newaxis,np.newaxis]-self._panel_vertices[cols,:,0][np.newaxis,:,:]
+        y = self._mesh.cp[rows,1][:,np.newaxis,np.newaxis]-self._panel_vertices[cols,:,1][np.newaxis,:,:]
+        z = self._mesh.cp[rows,2][:,np.newaxis,np.newaxis]-self._panel_vertices[cols,:,2][np.newaxis,:,:]
+        r_mag = np.sqrt(x*x+y*y+z*z)
+
+        # Get displacements to the previous vertex, such that each edge runs from the previous vertex to the current one
+        prev = [3, 0, 1, 2]
+        x0, y0, z0, r0_mag = x[:,:,prev], y[:,:,prev], z[:,:,prev], r_mag[:,:,prev]
+
+        # Calculate influence of each edge
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_r = r0_mag*r_mag
+            n = (r0_mag+r_mag)/(r_r*(r_r+x0*x+y0*y+z0*z))
+        n[~np.isfinite(n)] = 0.0
+
+        # Sum edges and take normal component
+        n_r = self._mesh.n[rows][:,:,np.newaxis,np.newaxis]
+        return 0.25/np.pi*np.sum(((y0*z-z0*y)*n_r[:,0]+(z0*x-x0*z)*n_r[:,1]+(x0*y-y0*x)*n_r[:,2])*n, axis=2)
+
+
+    def _get_low_rank_block(self, rows, cols):
+        # Approximates the block of the normal influence matrix coupling the given panels as UV* using adaptive cross approximation with partial pivoting; if this would not save memory, the block is returned as U with V=None
+
+        m = len(rows)
+        n = len(cols)
+
+        # Initialize storage; the approximation does not save memory beyond this rank
+        max_rank = m*n//(m+n)+1
+        U = np.zeros((m, max_rank))
+        V = np.zeros((n, max_rank))
+        used_rows = np.zeros(m, dtype=bool)
+        norm2 = 0.0
+        i = 0
+        k = 0
+        while k < max_rank:
+
+            # Get residual of the pivot row
+            used_rows[i] = True
+            v = self._get_entries(rows[i:i+1], cols)[0]-np.matmul(V[:,:k], U[i,:k])
+
+            # Find pivot column
+            j = np.argmax(np.abs(v))
+            if v[j] == 0.0:
+                if np.all(used_rows):
+                    break
+                i = np.argmin(used_rows)
+                continue
+            v /= v[j]
+
+            # Get residual of the pivot column
+            u = self._get_entries(rows, cols[j:j+1])[:,0]-np.matmul(U[:,:k], V[j,:k])
+
+            # Update estimate of the Frobenius norm of the approximation
+            uv_norm2 = np.inner(u, u)*np.inner(v, v)
+            norm2 += 2.0*np.inner(np.matmul(u, U[:,:k]), np.matmul(v, V[:,:k]))+uv_norm2
+            U[:,k] = u
+            V[:,k] = v
+            k += 1
+
+            # Check convergence
+            if uv_norm2 <= self._tolerance**2*norm2:
+                break
+
+            # Next pivot row
+            u_abs = np.abs(u)
+            u_abs[used_rows] = -1.0
+            i = np.argmax(u_abs)
+
+        # Store dense if the approximation would not save memory
+        if k*(m+n) >= m*n:
+            return self._get_entries(rows, cols), None
+
+        # The block is zero
+        if k == 0:
+            return np.zeros((m,1)), np.zeros((n,1))
+
+        # Recompress to the lowest rank giving the required accuracy
+        return truncate(U[:,:k], V[:,:k], self._tolerance)
+
+
+    def get_near_field_matrix(self):
+        """Returns the exact normal influence of nearby panels on each control point, which is a sparse approximation of the full normal influence matrix.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Near-field normal influence matrix; the first index is the influenced panel and the second is the influencing panel.
+        """
+
+        return self._near_matrix
+
+
+    def get_normal_influence(self, mu):
+        """Determines the velocity normal to each panel at its control point induced by the panels with the given doublet strengths.
+
+        Parameters
+        ----------
+        mu : ndarray
+            Doublet strength of each panel.
+
+        Returns
+        -------
+        ndarray
+            Normal velocity at each control point.
+        """
+
+        v = self._near_matrix.dot(mu)
+        for rows, cols, U, V in self._blocks:
+            if V is None:
+                v[rows] += np.matmul(U, mu[cols])
+            else:
+                v[rows] += np.matmul(U, np.matmul(V.T, mu[cols]))
+        return v
+
+
+    def get_transposed_normal_influence(self, v):
+        """Applies the transpose of the normal influence matrix to the given vector. As each low-rank block is stored as UV*, its transpose is VU*, so this is as accurate as get_normal_influence().
+
+        Parameters
+        ----------
+        v : ndarray
+            Vector with one entry for each control point.
+
+        Returns
+        -------
+        ndarray
+            Vector with one entry for each panel.
+        """
+
+        mu = self._near_matrix.T.dot(v)
+        for rows, cols, U, V in self._blocks:
+            if V is None:
+                mu[cols] += np.matmul(U.T, v[rows])
+            else:
+                mu[cols] += np.matmul(V, np.matmul(U.T, v[rows]))
+        return mu
+
+
+    def get_lu(self, shift=0.0):
+        """Determines an approximate LU factorization (H-LU) of the normal influence matrix plus shift times a matrix of ones. The normal influence matrix of a closed body is singular, as a constant doublet strength induces no velocity, so a shift is required to factor it.
+
+        Parameters
+        ----------
+        shift : float, optional
+            Multiple of the matrix of ones to add. Defaults to 0.
+
+        Returns
+        -------
+        HLU
+            The factorization.
+        """
+
+        return HLU(self, shift)
+
+
+class HLU:
+    """Approximate LU factorization of a hierarchical matrix plus a multiple of the matrix of ones, found by block elimination in hierarchically off-diagonal low-rank form with truncation to the tolerance of the hierarchical matrix.
+
+    Parameters
+    ----------
+    H : HMatrix
+        Hierarchical matrix to factor.
+
+    shift : float
+        Multiple of the matrix of ones to add.
+    """
+
+    def __init__(self, H, shift):
+
+        self._tree = H._tree
+        self._tolerance = H._tolerance
+        self._N = H._N_panels
+        tree = self._tree
+
+        # Get parent of each cluster
+        self._parent = -np.ones(tree.N_nodes, dtype=int)
+        nodes, slots = np.nonzero(tree.children >= 0)
+        self._parent[tree.children[nodes,slots]] = nodes
+
+        # Get blocks coupling the children of each cluster; the first index is the row, the second is the column, and each block is stored as UV*
+        near = H._near_matrix[tree.indices][:,tree.indices].tocsr()
+        self._blocks = {}
+        for t in np.nonzero(~tree.is_leaf)[0]:
+            children = self._get_children(t)
+            for a in children:
+                for b in children:
+                    if a != b:
+                        self._blocks[(a,b)] = self._get_near_block(near, a, b, shift)
+
+        # Add the low-rank blocks of the hierarchical matrix to the blocks containing them
+        pieces = {}
+        for (t, s), (rows, cols, U, V) in zip(H._far, H._blocks):
+            a, b = self._get_containing_block(t, s)
+            if V is None:
+                V = np.zeros((len(cols), len(cols)))
+                V[np.arange(len(cols)),np.arange(len(cols))] = 1.0
+            U_a = np.zeros((tree.stop[a]-tree.start[a], U.shape[1]))
+            V_b = np.zeros((tree.stop[b]-tree.start[b], V.shape[1]))
+            U_a[tree.start[t]-tree.start[a]:tree.stop[t]-tree.start[a]] = U
+            V_b[tree.start[s]-tree.start[b]:tree.stop[s]-tree.start[b]] = V
+            pieces.setdefault((a,b), []).append((U_a, V_b))
+        for key, block_pieces in pieces.items():
+            for U, V in block_pieces:
+                self._add_to_block(key, U, V)
+
+        # Get dense diagonal blocks of the leaves
+        self._diagonal = {}
+        for t in np.nonzero(tree.is_leaf)[0]:
+            self._diagonal[t] = near[tree.start[t]:tree.stop[t],tree.start[t]:tree.stop[t]].toarray()+shift
+
+        # Factor
+        self._factor(0)
+
+
+    def _get_children(self, t):
+        # Returns the children of the given cluster, in the order of their points
+
+        return [c for c in self._tree.children[t] if c >= 0]
+
+
+    def _get_containing_block(self, t, s):
+        # Determines the block of children of a common cluster which contains the coupling of the given clusters; they must not be nested
+
+        level = self._tree.level
+        while level[t] > level[s]:
+            t = self._parent[t]
+        while level[s] > level[t]:
+            s = self._parent[s]
+        while self._parent[t] != self._parent[s]:
+            t = self._parent[t]
+            s = self._parent[s]
+        return t, s
+
+
+    def _get_near_block(self, near, a, b, shift):
+        # Returns the near-field entries coupling clusters a and b, plus the shift, as a low-rank block; the near-field entries are stored as their nonzero columns
+
+        tree = self._tree
+        block = near[tree.start[a]:tree.stop[a],tree.start[b]:tree.stop[b]].tocsc()
+        cols = np.nonzero(np.diff(block.indptr))[0]
+        U = np.zeros((block.shape[0], len(cols)+1))
+        V = np.zeros((block.shape[1], len(cols)+1))
+        U[:,:-1] = block[:,cols].toarray()
+        V[cols,np.arange(len(cols))] = 1.0
+        U[:,-1] = shift
+        V[:,-1] = 1.0
+        return truncate(U, V, self._tolerance)
+
+
+    def _add_to_block(self, key, X, Y):
+        # Adds XY* to the given low-rank block, truncating the result
+
+        U, V = self._blocks[key]
+        self._blocks[key] = truncate(np.concatenate((U, X), axis=1), np.concatenate((V, Y), axis=1), self._tolerance)
+
+
+    def _add_to_cluster(self, t, X, Y):
+        # Adds XY* to the diagonal block of the given cluster; X and Y have one row for each point in the cluster
+
+        tree = self._tree
+        if tree.is_leaf[t]:
+            self._diagonal[t] += np.matmul(X, Y.T)
+            return
+
+        for a in self._get_children(t):
+            I_a = slice(tree.start[a]-tree.start[t], tree.stop[a]-tree.start[t])
+            for b in self._get_children(t):
+                I_b = slice(tree.start[b]-tree.start[t], tree.stop[b]-tree.start[t])
+                if a == b:
+                    self._add_to_cluster(a, X[I_a], Y[I_a])
+                else:
+                    self._add_to_block((a,b), X[I_a], Y[I_b])
+
+
+    def _factor(self, t):
+        # Factors the diagonal block of the given cluster by block Gaussian elimination of its children. Afterwards, each block below the diagonal holds the corresponding block of the Schur complement at the point its row was eliminated, and each block above the diagonal holds that block premultiplied by the inverse of the diagonal block of its row.
+
+        if self._tree.is_leaf[t]:
+            self._diagonal[t] = sl.lu_factor(self._diagonal[t])
+            return
+
+        children = self._get_children(t)
+        for i, a in enumerate(children):
+            self._factor(a)
+
+            # Scale the blocks of this row
+            for b in children[i+1:]:
+                U, V = self._blocks[(a,b)]
+                self._blocks[(a,b)] = (self._solve_cluster(a, U), V)
+
+            # Update the remaining blocks with the Schur complement
+            for b in children[i+1:]:
+                U_ba, V_ba = self._blocks[(b,a)]
+                for c in children[i+1:]:
+                    U_ac, V_ac = self._blocks[(a,c)]
+                    X = -np.matmul(U_ba, np.matmul(V_ba.T, U_ac))
+                    if b == c:
+                        self._add_to_cluster(b, X, V_ac)
+                    else:
+                        self._add_to_block((b,c), X, V_ac)
+
+
+    def _solve_cluster(self, t, b):
+        # Solves the system with the factored diagonal block of the given cluster for the given right-hand side, which may have several columns
+
+        tree = self._tree
+        if tree.is_leaf[t]:
+            return sl.lu_solve(self._diagonal[t], b)
+
+        # Forward elimination
+        children = self._get_children(t)
+        x = np.array(b, dtype=np.float64)
+        slices = [slice(tree.start[a]-tree.start[t], tree.stop[a]-tree.start[t]) for a in children]
+        for i, a in enumerate(children):
+            for j, c in enumerate(children[:i]):
+                U, V = self._blocks[(a,c)]
+                x[slices[i]] -= np.matmul(U, np.matmul(V.T, x[slices[j]]))
+            x[slices[i]] = self._solve_cluster(a, x[slices[i]])
+
+        # Back substitution
+        for i in range(len(children)-2, -1, -1):
+            for j in range(i+1, len(children)):
+                U, V = self._blocks[(children[i],children[j])]
+                x[slices[i]] -= np.matmul(U, np.matmul(V.T, x[slices[j]]))
+
+        return x
+
+
+    def _solve_cluster_transposed(self, t, b):
+        # Solves the system with the transpose of the factored diagonal block of the given cluster for the given right-hand side
+
+        tree = self._tree
+        if tree.is_leaf[t]:
+            return sl.lu_solve(self._diagonal[t], b, trans=1)
+
+        # Forward elimination with the transpose of the scaled upper blocks
+        children = self._get_children(t)
+        x = np.array(b, dtype=np.float64)
+        slices = [slice(tree.start[a]-tree.start[t], tree.stop[a]-tree.start[t]) for a in children]
+        for i in range(1, len(children)):
+            for j in range(i):
+                U, V = self._blocks[(children[j],children[i])]
+                x[slices[i]] -= np.matmul(V, np.matmul(U.T, x[slices[j]]))
+
+        # Back substitution with the transpose of the lower blocks
+        for i in range(len(children)-1, -1, -1):
+            for j in range(i+1, len(children)):
+                U, V = self._blocks[(children[j],children[i])]
+                x[slices[i]] -= np.matmul(V, np.matmul(U.T, x[slices[j]]))
+            x[slices[i]] = self._solve_cluster_transposed(children[i], x[slices[i]])
+
+        return x
+
+
+    def solve(self, b, trans=False):
+        """Solves the factored system for the given right-hand side.
+
+        Parameters
+        ----------
+        b : ndarray
+            Right-hand side, with one row for each panel. May have several columns.
+
+        trans : bool, optional
+            Whether to solve the transposed system instead. Defaults to False.
+
+        Returns
+        -------
+        ndarray
+            Solution.
+        """
+
+        # Solve in the order of the points in the octree
+        if trans:
+            x_tree = self._solve_cluster_transposed(0, b[self._tree.indices])
+        else:
+            x_tree = self._solve_cluster(0, b[self._tree.indices])
+        x = np.empty_like(x_tree)
+        x[self._tree.indices] = x_tree
+        return x
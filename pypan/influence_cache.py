@@ -0,0 +1,178 @@
+"""Persistent on-disk cache of panel influence matrices, allowing repeated runs on the same mesh to skip calculating them."""
+
+import os
+import time
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+class InfluenceCache:
+    """A directory of cached arrays, each stored as a .npy file named by its key. Arrays are loaded by memory-mapping. Several processes may share the same directory, as files are written atomically. Whenever an array is stored, files which are too old are removed, followed by the least recently used files until the total size of the cache is within the limit.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to store the cache. Created if it does not exist.
+
+    max_size : float, optional
+        Maximum total size of the cache in MB. Defaults to no limit.
+
+    max_age : float, optional
+        Maximum time (in days) since a file was last used before it is removed. Defaults to no limit.
+
+    verbose : bool, optional
+    """
+
+    def __init__(self, directory, **kwargs):
+
+        # Get kwargs
+        self._directory = directory
+        self._max_size = kwargs.get("max_size", None)
+        self._max_age = kwargs.get("max_age", None)
+        self._verbose = kwargs.get("verbose", False)
+        os.makedirs(self._directory, exist_ok=True)
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_key(self, *args):
+        """Creates a key from the given values.
+
+        Parameters
+        ----------
+        args
+            Values which identify the array. Each is converted to a string.
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-256 digest of the values.
+        """
+
+        return hashlib.sha256("_".join([str(arg) for arg in args]).encode()).hexdigest()
+
+
+    def _get_filename(self, key):
+        # Returns the file in which the array with the given key is stored
+        return os.path.join(self._directory, key+".npy")
+
+
+    def load(self, key):
+        """Loads the array with the given key from the cache. If found, old files are then removed as necessary.
+
+        Parameters
+        ----------
+        key : str
+            Key of the array.
+
+        Returns
+        -------
+        numpy.memmap or None
+            The array, memory-mapped copy-on-write so that changes are not written back to the cache. None if the array is not in the cache.
+        """
+
+        filename = self._get_filename(key)
+        try:
+            array = np.load(filename, mmap_mode='c')
+        except (OSError, ValueError):
+            self.misses += 1
+            if self._verbose:
+                print()
+                print("    Cache miss for {0}".format(key))
+            return None
+
+        # Mark as recently used
+        os.utime(filename)
+        self.hits += 1
+        if self._verbose:
+            print()
+            print("    Cache hit for {0} ({1} MB)".format(key, os.path.getsize(filename)/2**20))
+
+        self.evict(keep=key)
+        return array
+
+
+    def store(self, key, array):
+        """Stores the array in the cache under the given key, then removes old files as necessary.
+
+        Parameters
+        ----------
+        key : str
+            Key of the array.
+
+        array : ndarray
+            Array to store.
+        """
+
+        # Write to a temporary file first so other processes never see a partial file
+        handle, temp_filename = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                np.save(temp_file, array)
+            os.replace(temp_filename, self._get_filename(key))
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+
+        if self._verbose:
+            print()
+            print("    Stored {0} in cache ({1} MB)".format(key, os.path.getsize(self._get_filename(key))/2**20))
+
+        self.evict(keep=key)
+
+
+    def evict(self, keep=None):
+        """Removes files which are older than the maximum age, then the least recently used files until the cache is smaller than the maximum size.
+
+        Parameters
+        ----------
+        keep : str, optional
+            Key of an array which should not be removed, regardless of size.
+
+        Returns
+        -------
+        int
+            Number of files removed.
+        """
+
+        # Get cached files, oldest first
+        files = []
+        for name in os.listdir(self._directory):
+            if name.endswith(".npy"):
+                filename = os.path.join(self._directory, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, filename))
+        files.sort()
+        total_size = sum([f[1] for f in files])
+
+        # Remove old and excess files
+        now = time.time()
+        keep_filename = self._get_filename(keep) if keep is not None else None
+        N_removed = 0
+        for mtime, size, filename in files:
+            if filename == keep_filename:
+                continue
+            too_old = self._max_age is not None and now-mtime > self._max_age*86400.0
+            too_big = self._max_size is not None and total_size > self._max_size*2**20
+            if not (too_old or too_big):
+                continue
+
+            # Another process may have removed it already
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total_size -= size
+            N_removed += 1
+
+        if self._verbose and N_removed > 0:
+            print("    Evicted {0} files from cache".format(N_removed))
+
+        return N_removed
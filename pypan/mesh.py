@@ -3,16 +3,18 @@ import stl
 import warnings
 import copy
 import os
+import hashlib
 
 import numpy as np
+import scipy.sparse as sp
 import pyvista as pv
 import matplotlib.pyplot as plt
 
 from mpl_toolkits.mplot3d import Axes3D
 
-from pypan.pp_math import vec_cross, vec_inner, vec_norm, norm, inner
+from pypan.pp_math import vec_cross, vec_inner, vec_norm, norm, inner, mirror_xz
 from pypan.helpers import OneLineProgress
-from pypan.panels import Tri, Quad
+from pypan.panels import Tri, Quad, get_ring_influences, get_far_field_ring_influences, get_panel_edges
 from pypan.wake import Wake, StraightFixedWake, FullStreamlineWake, VelocityRelaxedWake, MarchingStreamlineWake
 from pypan.kutta_edges import KuttaEdge
 from pypan.vertices import Vertex
@@ -44,6 +46,9 @@ class Mesh:
 
     gradient_fit_type : str, optional
         The type of basis functions to use for least-squares estimation of gradients. May be 'linear' or 'quad'. Defaults to 'quad' (recommended).
+
+    symmetric : bool, optional
+        Whether the mesh is half of a geometry which is symmetric about the xz plane. If True, the mesh file should contain only the half of the geometry on one side of the xz plane, and the other half is included implicitly as the mirror image of the panels, Kutta edges, and wake. This halves the number of unknowns, but the flow must also be symmetric (no sideslip, roll rate, or yaw rate). Forces and moments are given for the full geometry. Only supported by the VortexRingSolver with the 'dense' matrix type. Defaults to False.
     """
 
     def __init__(self, **kwargs):
@@ -54,6 +59,7 @@ class Mesh:
         self._verbose = kwargs.get("verbose", False)
         self.CG = np.array(kwargs.get("CG", [0.0, 0.0, 0.0]))
         self._gradient_type = kwargs.get('gradient_fit_type', 'quad')
+        self.symmetric = kwargs.get('symmetric', False)
 
         # Load mesh
         if self._verbose:
@@ -64,6 +70,12 @@ class Mesh:
             end_time = time.time()
             print("Finished. Time: {0} s.".format(end_time-start_time), flush=True)
 
+        # Check the mesh is a half model
+        if self.symmetric:
+            tol = 1e-10*np.max(np.abs(self.vertices))
+            if not (np.all(self.vertices[:,1] >= -tol) or np.all(self.vertices[:,1] <= tol)):
+                raise IOError("A symmetric mesh must lie entirely on one side of the xz plane.")
+
         # Display mesh information
         if self._verbose:
             print("\nMesh Parameters:")
@@ -71,6 +83,8 @@ class Mesh:
             print("    # vertices: {0}".format(self.vertices.shape[0]))
             print("    Max panel size: {0}".format(np.max(self.dA)))
             print("    Min panel size: {0}".format(np.min(self.dA)))
+            if self.symmetric:
+                print("    Mirrored about the xz plane")
 
         # Determine panel adjacency mapping
         self._determine_panel_adjacency_mapping(**kwargs)
@@ -116,6 +130,201 @@ class Mesh:
         for i, vertex in enumerate(self.vertices):
             self.vertex_objects[i] = Vertex(vertex, self.N_vert)
 
+        # Determine edges for vectorized influence calculations
+        self._determine_panel_edges()
+        self._determine_far_field_data()
+
+
+    def _determine_panel_edges(self):
+        # Determines the unique edges of the mesh and the mapping from edges to panels, which allows panel influences to be calculated for the whole mesh at once
+
+        # Get the vertices of all panels and which panel each belongs to
+        N_panel_verts = np.array([panel.N for panel in self.panels])
+        panel_ind = np.repeat(np.arange(self.N), N_panel_verts)
+        self._edge_vertices, vertex_ind = np.unique(np.concatenate([panel.vertices for panel in self.panels]), return_inverse=True, axis=0)
+        vertex_ind = vertex_ind.flatten()
+
+        # Determine the previous vertex around each panel, such that each edge runs from the previous vertex to the current one
+        first = np.cumsum(N_panel_verts)-N_panel_verts
+        prev_ind = np.arange(len(vertex_ind))-1
+        prev_ind[first] += N_panel_verts
+        start_ind = vertex_ind[prev_ind]
+
+        # Determine unique edges, ignoring direction
+        lower = np.minimum(start_ind, vertex_ind)
+        upper = np.maximum(start_ind, vertex_ind)
+        sign = np.where(start_ind==lower, 1.0, -1.0)
+        self._edges, edge_ind = np.unique(np.stack((lower, upper), axis=1), return_inverse=True, axis=0)
+
+        # Create mapping
+        self._edge_panel_map = sp.csr_matrix((sign, (panel_ind, edge_ind.flatten())), shape=(self.N, len(self._edges)))
+
+        # Determine which edge vertex and which panels each mesh vertex belongs to, so that moving a vertex only requires updating these
+        mesh_vertex_ind = np.concatenate([ind[1:] for ind in self._panel_vertex_indices]).astype(int)
+        self._vertex_edge_vertex = -np.ones(self.N_vert, dtype=int)
+        self._vertex_edge_vertex[mesh_vertex_ind] = vertex_ind
+        self._edge_vertex_counts = np.bincount(self._vertex_edge_vertex[self._vertex_edge_vertex >= 0], minlength=len(self._edge_vertices))
+        self._vertex_panel_map = sp.csr_matrix((np.ones(len(panel_ind)), (mesh_vertex_ind, panel_ind)), shape=(self.N_vert, self.N))
+
+
+    def _determine_far_field_data(self, panels=None):
+        # Determines the area centroid, vector area, and diameter of each panel, which are needed to approximate distant panels as point doublets; if panels are given, only these are updated
+
+        if panels is None:
+            self._area_centroids = np.zeros((self.N, 3))
+            self._vector_areas = np.zeros((self.N, 3))
+            self._panel_diameters = np.zeros(self.N)
+            panels = range(self.N)
+
+        for i in panels:
+            panel = self.panels[i]
+
+            # Split into triangles sharing the first vertex
+            v0 = panel.vertices[0]
+            a = 0.5*vec_cross(panel.vertices[1:-1]-v0, panel.vertices[2:]-v0)
+            A = vec_norm(a)
+
+            # Get properties
+            self._vector_areas[i] = np.sum(a, axis=0)
+            self._area_centroids[i] = v0+np.sum(A[:,np.newaxis]*(panel.vertices[1:-1]+panel.vertices[2:]-2.0*v0), axis=0)/(3.0*np.sum(A))
+            self._panel_diameters[i] = np.max(vec_norm(panel.vertices[:,np.newaxis,:]-panel.vertices[np.newaxis,:,:]))
+
+
+    def get_far_field_data(self):
+        """Returns the arrays describing each panel as a point doublet, as used to approximate the influence of distant panels.
+
+        Returns
+        -------
+        centroids : ndarray
+            Area centroid of each panel.
+
+        vector_areas : ndarray
+            Area times normal vector of each panel.
+
+        diameters : ndarray
+            Largest distance between any two vertices of each panel.
+        """
+        return self._area_centroids, self._vector_areas, self._panel_diameters
+
+
+    def get_hash(self):
+        """Returns a hash of the mesh geometry, which identifies meshes with identical panel influences (e.g. for caching).
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-256 digest of the vertices, panel connectivity, panel control points and normals, and symmetry.
+        """
+
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(self.vertices, dtype=np.float64).tobytes())
+        h.update(np.concatenate([np.array(ind, dtype=np.int64) for ind in self._panel_vertex_indices]).tobytes())
+
+        # Control points and normals may be given in the mesh file rather than calculated from the vertices
+        h.update(np.ascontiguousarray(self.cp, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(self.n, dtype=np.float64).tobytes())
+
+        # The mirror image also affects the influences
+        if self.symmetric:
+            h.update(b"symmetric")
+        return h.hexdigest()
+
+
+    def get_edge_data(self):
+        """Returns the arrays describing the unique edges of the mesh, as used for vectorized panel influence calculations.
+
+        Returns
+        -------
+        vertices : ndarray
+            Array of vertices defining the edges.
+
+        edges : ndarray
+            Array of vertex index pairs defining each edge.
+
+        edge_panel_map : scipy.sparse.csr_matrix
+            Sparse matrix mapping edges to panels. See pypan.panels.get_ring_influences().
+        """
+        return self._edge_vertices, self._edges, self._edge_panel_map
+
+
+    def get_ring_influences(self, points, panels=None):
+        """Determines the velocity induced at the given points by each panel in the mesh, assuming a vortex ring model and a unit positive vortex strength. For a symmetric mesh, this includes the influence of the mirror image of each panel.
+
+        Parameters
+        ----------
+        points : ndarray
+            An array of points where the first index is the point index and the second index is the coordinate.
+
+        panels : slice or ndarray, optional
+            Indices of the panels for which to calculate the influence. Defaults to all panels.
+
+        Returns
+        -------
+        ndarray
+            The velocity vector induced at each point by each panel. The first index is the point index, the second is the panel index, and the third is the velocity component.
+        """
+
+        # Get only the edges belonging to the specified panels
+        if panels is None:
+            edges, edge_panel_map = self._edges, self._edge_panel_map
+        else:
+            edges, edge_panel_map = get_panel_edges(self._edges, self._edge_panel_map, panels)
+
+        # The influence of the mirror image of a panel is the mirror of the panel's influence at the mirrored point
+        v = get_ring_influences(points, self._edge_vertices, edges, edge_panel_map)
+        if self.symmetric:
+            v += mirror_xz(get_ring_influences(mirror_xz(points), self._edge_vertices, edges, edge_panel_map))
+        return v
+
+
+    def get_far_field_ring_influences(self, points, ratio, normals=None, panels=None):
+        """Determines the velocity induced at the given points by each panel in the mesh, assuming a vortex ring model and a unit positive vortex strength. The influence of a panel on a point further from it than the given multiple of its diameter is approximated as that of a point doublet, which is much faster. The relative error of this approximation decreases as the square of the ratio. For a symmetric mesh, this includes the influence of the mirror image of each panel.
+
+        Parameters
+        ----------
+        points : ndarray
+            An array of points where the first index is the point index and the second index is the coordinate. These should be close together.
+
+        ratio : float
+            Ratio of distance to panel diameter beyond which panels are approximated as point doublets.
+
+        normals : ndarray, optional
+            Unit vector at each point. If given, only the component of the velocity in this direction is returned.
+
+        panels : slice or ndarray, optional
+            Indices of the panels for which to calculate the influence. Defaults to all panels.
+
+        Returns
+        -------
+        v : ndarray
+            The velocity vector induced at each point by each panel. The first index is the point index, the second is the panel index, and the third is the velocity component. If normals are given, the third index is omitted.
+
+        near : ndarray
+            Whether each influence was calculated exactly. The first index is the point index and the second is the panel index.
+        """
+
+        # Get only the edges and far-field data belonging to the specified panels
+        if panels is None:
+            edges, edge_panel_map = self._edges, self._edge_panel_map
+            far_field_data = self.get_far_field_data()
+        else:
+            edges, edge_panel_map = get_panel_edges(self._edges, self._edge_panel_map, panels)
+            far_field_data = [data[panels] for data in self.get_far_field_data()]
+
+        # Without mirror images, the normal component can be found directly
+        if not self.symmetric:
+            return get_far_field_ring_influences(points, self._edge_vertices, edges, edge_panel_map, *far_field_data, ratio, normals=normals)
+
+        # Add influences of the mirror images
+        v, near = get_far_field_ring_influences(points, self._edge_vertices, edges, edge_panel_map, *far_field_data, ratio)
+        v_mirror, near_mirror = get_far_field_ring_influences(mirror_xz(points), self._edge_vertices, edges, edge_panel_map, *far_field_data, ratio)
+        v += mirror_xz(v_mirror)
+        near = near | near_mirror
+
+        if normals is not None:
+            return np.einsum('ijk,ik->ij', v, normals), near
+        return v, near
+
 
     def _load_stl(self, stl_file, multi_file):
         # Loads mesh from an stl file
@@ -499,7 +708,7 @@ class Mesh:
 
         # Get parameters
         theta_K = np.radians(kwargs.get("kutta_angle", 90.0))
-        C_theta = np.cos(theta_K)
+        self._C_theta = np.cos(theta_K)
         self._check_freestream = kwargs.get("check_freestream", True)
 
         # Look for adjacent panels where the angle between their normals is greater than the Kutta angle
@@ -517,7 +726,7 @@ class Mesh:
                         continue
 
                     # Check angle
-                    if inner(self.n[i], self.n[j])<=C_theta:
+                    if inner(self.n[i], self.n[j])<=self._C_theta:
                         self._potential_kutta_panels.append([i,j])
 
                 if self._verbose:
@@ -619,12 +828,41 @@ class Mesh:
         if self._verbose:
             print("    Found {0} Kutta edges.".format(self.N_edges))
 
+        # The panel neighbors and least-squares matrices only need to be determined again if the Kutta edges have changed
+        kutta_panels = [edge.panel_indices for edge in self._kutta_edges]
+        if kutta_panels != getattr(self, "_kutta_panels", None):
+            self._kutta_panels = kutta_panels
+            self._determine_gradient_neighbors()
+
+            # Set up least-squares matrices
+            self._set_up_lst_sq()
+
+        # Initialize wake
+        if self.N_edges>0:
+            if self._wake_type == "fixed":
+                self.wake = StraightFixedWake(kutta_edges=self._kutta_edges, symmetric=self.symmetric, **self._wake_kwargs)
+            elif self._wake_type == "full_streamline":
+                self.wake = FullStreamlineWake(kutta_edges=self._kutta_edges, symmetric=self.symmetric, **self._wake_kwargs)
+            elif self._wake_type == "relaxed":
+                self.wake = VelocityRelaxedWake(kutta_edges=self._kutta_edges, symmetric=self.symmetric, **self._wake_kwargs)
+            elif self._wake_type == "marching_streamline":
+                self.wake = MarchingStreamlineWake(kutta_edges=self._kutta_edges, symmetric=self.symmetric, **self._wake_kwargs)
+            else:
+                raise IOError("{0} is not a valid wake type.".format(self._wake_type))
+
+
+    def _determine_gradient_neighbors(self):
+        # Determines the neighbors of each panel used for calculating gradients, which are those not across a Kutta edge
+
         if self._verbose:
             print()
             prog = OneLineProgress(self.N, msg="Locating panels for gradient calculation")
 
         # Store touching and abutting panels not across Kutta edge
         for i, panel in enumerate(self.panels):
+            panel.touching_panels_not_across_kutta_edge = []
+            panel.abutting_panels_not_across_kutta_edge = []
+            panel.second_abutting_panels_not_across_kutta_edge = []
 
             # Loop through panels touching this one
             for j in panel.touching_panels:
@@ -658,44 +896,25 @@ class Mesh:
                     if k not in panel.second_abutting_panels_not_across_kutta_edge and k!=i:
                         panel.second_abutting_panels_not_across_kutta_edge.append(k)
 
-        # Set up least-squares matrices
-        self._set_up_lst_sq()
-
-        # Initialize wake
-        if self.N_edges>0:
-            if self._wake_type == "fixed":
-                self.wake = StraightFixedWake(kutta_edges=self._kutta_edges, **self._wake_kwargs)
-            elif self._wake_type == "full_streamline":
-                self.wake = FullStreamlineWake(kutta_edges=self._kutta_edges, **self._wake_kwargs)
-            elif self._wake_type == "relaxed":
-                self.wake = VelocityRelaxedWake(kutta_edges=self._kutta_edges, **self._wake_kwargs)
-            elif self._wake_type == "marching_streamline":
-                self.wake = MarchingStreamlineWake(kutta_edges=self._kutta_edges, **self._wake_kwargs)
-            else:
-                raise IOError("{0} is not a valid wake type.".format(self._wake_type))
 
+    def _set_up_lst_sq(self, panels=None):
+        # Determines the A matrix to least-squares estimation of the gradient. Must be called after kutta edges are determined. If panels are given, only the matrices for these panels are updated.
 
-    def _set_up_lst_sq(self):
-        # Determines the A matrix to least-squares estimation of the gradient. Must be called after kutta edges are determined.
+        # Initialize
+        if panels is None:
+            self.A_lsq = [None]*self.N
+            panels = range(self.N)
 
         if self._verbose:
             print()
-            prog = OneLineProgress(self.N, msg="Calculating least-squares matrices")
-
-        # Initialize
-        self.A_lsq = []
+            prog = OneLineProgress(len(panels), msg="Calculating least-squares matrices")
 
         # Loop through panels
-        for i, panel in enumerate(self.panels):
-
-            # Determine which neighbors to use
-            if self._gradient_type=='quad':
-                neighbors = panel.second_abutting_panels_not_across_kutta_edge
-            else:
-                neighbors = panel.touching_panels_not_across_kutta_edge
+        for i in panels:
+            panel = self.panels[i]
 
             # Get centroids of neighboring panels in local panel coordinates
-            dp = np.einsum('ij,kj->ki', panel.A_t, self.cp[neighbors]-self.cp[i][np.newaxis,:])
+            dp = np.einsum('ij,kj->ki', panel.A_t, self.cp[self._get_gradient_neighbors(i)]-self.cp[i][np.newaxis,:])
 
             # Get basis functions
             dx = dp[:,0][:,np.newaxis]
@@ -708,12 +927,20 @@ class Mesh:
                 A = dp
 
             # Store
-            self.A_lsq.append(A)
+            self.A_lsq[i] = A
 
             if self._verbose:
                 prog.display()
 
 
+    def _get_gradient_neighbors(self, i):
+        # Returns the neighbors of the given panel used to calculate the gradient
+
+        if self._gradient_type=='quad':
+            return self.panels[i].second_abutting_panels_not_across_kutta_edge
+        return self.panels[i].touching_panels_not_across_kutta_edge
+
+
     def set_wake(self, **kwargs):
         """Sets up a wake for this mesh.
 
@@ -750,6 +977,9 @@ class Mesh:
         corrector_iterations : int, optional
             How many times to correct the streamline (velocity) prediction for each segment within a streamline wake (not "relaxed" or "fixed"). Defaults to 1.
 
+        chunk_memory : float, optional
+            Approximate amount of memory (in MB) to use for the temporary arrays when calculating the influence of the filaments of an iterative wake. Defaults to 256. Not used for type "fixed".
+
         K : float
             Time stepping factor for shifting the filament vertices based on the local induced velocity and distance from the trailing edge. Only required for type "relaxed".
         """
@@ -905,6 +1135,88 @@ class Mesh:
             print("Mesh successfully written to '{0}'.".format(filename))
 
 
+    def move_vertices(self, vertex_indices, positions):
+        """Moves the given vertices of the mesh (e.g. to deflect a control surface), updating only the panels which use them. The connectivity of the mesh is unchanged. If the Kutta edges have already been found, the potential Kutta edges and the least-squares gradient matrices are updated for the moved panels and their neighbors. The solver should be updated as well; see VortexRingSolver.move_vertices().
+
+        Parameters
+        ----------
+        vertex_indices : ndarray
+            Indices of the vertices to move, as in Mesh.vertices.
+
+        positions : ndarray
+            New position of each vertex.
+
+        Returns
+        -------
+        ndarray
+            Indices of the panels which moved.
+        """
+
+        # Update vertices
+        vertex_indices = np.atleast_1d(vertex_indices)
+        self.vertices[vertex_indices] = positions
+        for i in vertex_indices:
+            self.vertex_objects[i].r = np.copy(self.vertices[i])
+
+        # Determine which panels use these vertices
+        panels = np.unique(self._vertex_panel_map[vertex_indices].indices)
+        if len(panels) == 0:
+            return panels
+        is_moved = np.zeros(self.N, dtype=bool)
+        is_moved[panels] = True
+
+        # Replace panel objects, keeping their adjacency
+        for i in panels:
+            old_panel = self.panels[i]
+            vertices = self.vertices[self._panel_vertex_indices[i][1:]]
+            if old_panel.N == 3:
+                panel = Tri(v0=vertices[0], v1=vertices[1], v2=vertices[2])
+            else:
+                panel = Quad(v0=vertices[0], v1=vertices[1], v2=vertices[2], v3=vertices[3])
+            for attr in ["touching_panels", "abutting_panels", "touching_panels_not_across_kutta_edge", "abutting_panels_not_across_kutta_edge", "second_abutting_panels_not_across_kutta_edge"]:
+                setattr(panel, attr, getattr(old_panel, attr))
+            self.panels[i] = panel
+
+            # Update panel information
+            self.n[i], self.dA[i], self.cp[i] = panel.get_info()
+            self.r_CG[i] = self.cp[i]-self.CG
+
+        # Update data for vectorized influence calculations
+        self._update_edge_vertices(vertex_indices)
+        self._determine_far_field_data(panels=panels)
+
+        # Check whether the moved panels now meet the Kutta angle
+        if hasattr(self, "_potential_kutta_panels"):
+            self._potential_kutta_panels = [[i,j] for i,j in self._potential_kutta_panels if not (is_moved[i] or is_moved[j])]
+            with np.errstate(invalid='ignore'):
+                for i in panels:
+                    for j in self.panels[i].abutting_panels:
+                        if (j > i or not is_moved[j]) and inner(self.n[i], self.n[j])<=self._C_theta:
+                            self._potential_kutta_panels.append([min(i,j), max(i,j)])
+
+        # Update the least-squares matrices of the moved panels and any panels using them as neighbors; a panel is a neighbor of each of its neighbors
+        if hasattr(self, "A_lsq"):
+            affected = np.unique(np.concatenate([panels]+[np.array(self._get_gradient_neighbors(i), dtype=int) for i in panels]))
+            self._set_up_lst_sq(panels=affected)
+
+        return panels
+
+
+    def _update_edge_vertices(self, vertex_indices):
+        # Moves the edge vertices of the given mesh vertices to their new positions. The edges are unchanged unless an edge vertex is shared with a mesh vertex which did not move to the same position, in which case the edges are redetermined.
+
+        # Get edge vertices of the moved mesh vertices which are used by panels
+        vertex_indices = np.unique(vertex_indices)
+        vertex_indices = vertex_indices[self._vertex_edge_vertex[vertex_indices] >= 0]
+        edge_vertex_ind = self._vertex_edge_vertex[vertex_indices]
+        edge_vertices, counts = np.unique(edge_vertex_ind, return_counts=True)
+
+        # Move edge vertices, checking that all mesh vertices sharing each moved to the same position
+        self._edge_vertices[edge_vertex_ind] = self.vertices[vertex_indices]
+        if np.any(counts != self._edge_vertex_counts[edge_vertices]) or np.any(self._edge_vertices[edge_vertex_ind] != self.vertices[vertex_indices]):
+            self._determine_panel_edges()
+
+
     def get_vtk_data(self):
         """Returns a list of vertices and a list of indices referencing each panel to its vertices in the first list.
         """
@@ -931,14 +1243,8 @@ class Mesh:
         # Loop through panels
         for i, panel in enumerate(self.panels):
 
-            # Determine which neighbors to use
-            if self._gradient_type=='quad':
-                neighbors = panel.second_abutting_panels_not_across_kutta_edge
-            else:
-                neighbors = panel.touching_panels_not_across_kutta_edge
-
             # Get delta phi
-            b = phi[neighbors]-phi[i]
+            b = phi[self._get_gradient_neighbors(i)]-phi[i]
 
             # Solve
             A = self.A_lsq[i]
@@ -0,0 +1,125 @@
+"""Routines for solving least-squares systems stored in single precision to double-precision accuracy."""
+
+import warnings
+
+import numpy as np
+import scipy.linalg as sl
+
+from pypan.out_of_core import get_blocks
+
+
+def qr_factor(A):
+    # Determines the upper-triangular factor R of the single-precision matrix A=QR; Q is not stored
+
+    return np.ascontiguousarray(sl.qr(A, mode='r', check_finite=False)[0][:A.shape[1]])
+
+
+def _matvec(A, x, N_block):
+    # Calculates Ax in double precision, only upcasting a block of rows of A at a time
+
+    y = np.zeros(A.shape[0])
+    for I in get_blocks(A.shape[0], N_block):
+        y[I] = np.matmul(A[I].astype(np.float64), x)
+    return y
+
+
+def _rmatvec(A, y, N_block):
+    # Calculates (A*)y in double precision, only upcasting a block of rows of A at a time
+
+    x = np.zeros(A.shape[1])
+    for I in get_blocks(A.shape[0], N_block):
+        x += np.matmul(A[I].astype(np.float64).T, y[I])
+    return x
+
+
+def _solve_R(R, y, N_block, trans=False):
+    # Solves Rx=y (or (R*)x=y) by blocked substitution in double precision, only upcasting a block of rows of R at a time
+
+    N = R.shape[0]
+    x = np.array(y, dtype=np.float64)
+
+    # Forward substitution with R*
+    if trans:
+        for J in get_blocks(N, N_block):
+            R_J = R[J].astype(np.float64)
+            x[J] = sl.solve_triangular(R_J[:,J], x[J], trans='T', check_finite=False)
+            x[J.stop:] -= np.matmul(R_J[:,J.stop:].T, x[J])
+
+    # Back substitution with R
+    else:
+        for J in reversed(get_blocks(N, N_block)):
+            R_J = R[J].astype(np.float64)
+            x[J] = sl.solve_triangular(R_J[:,J], x[J]-np.matmul(R_J[:,J.stop:], x[J.stop:]), check_finite=False)
+
+    return x
+
+
+def refine_least_squares(A, b, R, tolerance=1e-12, max_iterations=50):
+    """Solves the least-squares problem min||Ax-b|| to double precision where the triangular factor R is that of A rounded to single precision. All residuals are calculated in double precision and the solution is refined using the conjugate gradient method on the normal equations (CGLS), preconditioned by R. Since R is an approximate factor of A, only a few iterations are required. The accuracy of the solution is limited by the precision in which A is stored.
+
+    Parameters
+    ----------
+    A : ndarray
+        System matrix, used to calculate the residuals. Should be stored in double precision (e.g. memory-mapped) for a double-precision solution; a single-precision matrix is upcast a block at a time.
+
+    b : ndarray
+        Right-hand side vector.
+
+    R : ndarray
+        Single-precision upper-triangular factor of A rounded to single precision, as given by qr_factor().
+
+    tolerance : float, optional
+        Convergence threshold on the relative normal-equations residual ||(A*)(b-Ax)||/||(A*)b||. Defaults to 1e-12.
+
+    max_iterations : int, optional
+        Maximum number of refinement iterations. A warning is issued if the tolerance is not reached. Defaults to 50.
+
+    Returns
+    -------
+    ndarray
+        Solution vector.
+
+    list
+        Relative normal-equations residual after each iteration, beginning with the initial single-precision solution.
+    """
+
+    # Limit temporary double-precision arrays to about 8 MB
+    N_block = max(1, 2**20//A.shape[1])
+
+    # Initial solution from the single-precision factor
+    b = np.array(b, dtype=np.float64).flatten()
+    Atb = _rmatvec(A, b, N_block)
+    x = _solve_R(R, _solve_R(R, Atb, N_block, trans=True), N_block)
+    r = b-_matvec(A, x, N_block)
+    g = _rmatvec(A, r, N_block)
+    Atb_norm = np.linalg.norm(Atb)
+    history = [np.linalg.norm(g)/Atb_norm]
+
+    # Refine
+    s = _solve_R(R, g, N_block, trans=True)
+    p = np.copy(s)
+    gamma = np.inner(s, s)
+    for i in range(max_iterations):
+        if history[-1] < tolerance:
+            break
+
+        # Update solution and residual
+        t = _solve_R(R, p, N_block)
+        q = _matvec(A, t, N_block)
+        alpha = gamma/np.inner(q, q)
+        x += alpha*t
+        r -= alpha*q
+
+        # Update search direction
+        g = _rmatvec(A, r, N_block)
+        s = _solve_R(R, g, N_block, trans=True)
+        gamma_new = np.inner(s, s)
+        p = s+gamma_new/gamma*p
+        gamma = gamma_new
+
+        history.append(np.linalg.norm(g)/Atb_norm)
+
+    if history[-1] >= tolerance:
+        warnings.warn("Mixed-precision refinement did not converge to a relative residual of {0} in {1} iterations. The final relative residual is {2:e}.".format(tolerance, max_iterations, history[-1]))
+
+    return x, history
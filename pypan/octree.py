@@ -0,0 +1,175 @@
+"""Defines an octree for hierarchically clustering panels and points."""
+
+import numpy as np
+
+
+class Octree:
+    """An octree which recursively divides a set of points into clusters. Each point may have a finite extent (e.g. the size of the panel it represents), which is included in the radius of each cluster.
+
+    Parameters
+    ----------
+    points : ndarray
+        Array of points to cluster.
+
+    extents : ndarray, optional
+        Radius of the object represented by each point. Defaults to zero for all points.
+
+    leaf_size : int, optional
+        Maximum number of points in a cluster which is not subdivided further. Defaults to 32.
+    """
+
+    def __init__(self, points, extents=None, leaf_size=32):
+
+        # Store points
+        self.points = points
+        self.N = len(points)
+        if extents is None:
+            extents = np.zeros(self.N)
+        self._leaf_size = leaf_size
+
+        # Initialize storage; nodes are stored by index and each contains the points indices[start:stop]
+        self.indices = np.arange(self.N)
+        start = [0]
+        stop = [self.N]
+        level = [0]
+        children = [[]]
+        cell_centers = [0.5*(np.max(points, axis=0)+np.min(points, axis=0))]
+        cell_half_widths = [0.5*np.max(np.max(points, axis=0)-np.min(points, axis=0))]
+
+        # Subdivide nodes until each leaf is small enough
+        i = 0
+        while i < len(start):
+            ind = self.indices[start[i]:stop[i]]
+            if len(ind) > leaf_size and np.max(np.ptp(points[ind], axis=0)) > 0.0:
+
+                # Sort points by octant
+                octant = np.dot((points[ind] > cell_centers[i][np.newaxis,:]).astype(int), [4, 2, 1])
+                order = np.argsort(octant, kind='stable')
+                self.indices[start[i]:stop[i]] = ind[order]
+                counts = np.bincount(octant, minlength=8)
+
+                # Create children
+                offset = start[i]
+                for j in range(8):
+                    if counts[j] > 0:
+                        children[i].append(len(start))
+                        start.append(offset)
+                        stop.append(offset+counts[j])
+                        level.append(level[i]+1)
+                        children.append([])
+                        cell_half_widths.append(0.5*cell_half_widths[i])
+                        cell_centers.append(cell_centers[i]+cell_half_widths[-1]*(2.0*np.array([j//4, (j//2)%2, j%2])-1.0))
+                        offset += counts[j]
+
+            i += 1
+
+        # Store node data
+        self.N_nodes = len(start)
+        self.start = np.array(start)
+        self.stop = np.array(stop)
+        self.level = np.array(level)
+        self.N_levels = np.max(self.level)+1
+        self.is_leaf = np.array([len(c)==0 for c in children])
+        self.children = -np.ones((self.N_nodes, 8), dtype=int)
+        for i, c in enumerate(children):
+            self.children[i,:len(c)] = c
+
+        # Determine centers and radii of the clusters from the points they contain
+        self.centers = np.zeros((self.N_nodes, 3))
+        self.radii = np.zeros(self.N_nodes)
+        for i in range(self.N_nodes):
+            ind = self.indices[self.start[i]:self.stop[i]]
+            self.centers[i] = 0.5*(np.max(points[ind], axis=0)+np.min(points[ind], axis=0))
+            self.radii[i] = np.max(np.linalg.norm(points[ind]-self.centers[i][np.newaxis,:], axis=1)+extents[ind])
+
+
+    def get_points_in_node(self, node):
+        """Returns the indices of the points contained in the given node.
+
+        Parameters
+        ----------
+        node : int
+            Node index.
+
+        Returns
+        -------
+        ndarray
+            Point indices.
+        """
+
+        return self.indices[self.start[node]:self.stop[node]]
+
+
+    def get_node_point_pairs(self):
+        """Returns every pair of node and point contained in that node.
+
+        Returns
+        -------
+        nodes : ndarray
+            Node indices.
+
+        points : ndarray
+            Point indices.
+        """
+
+        counts = self.stop-self.start
+        nodes = np.repeat(np.arange(self.N_nodes), counts)
+        positions = np.arange(np.sum(counts))-np.repeat(np.cumsum(counts)-counts, counts)+np.repeat(self.start, counts)
+        return nodes, self.indices[positions]
+
+
+    def get_interactions(self, target_tree, theta):
+        """Determines which clusters of this (source) tree are well separated from each cluster of the target tree, using a dual traversal of the two trees. Two clusters are well separated if the sum of their radii is less than theta times the distance between their centers.
+
+        Parameters
+        ----------
+        target_tree : Octree
+            Tree containing the target points. May be this tree.
+
+        theta : float
+            Opening criterion. Smaller values separate fewer clusters.
+
+        Returns
+        -------
+        near : ndarray
+            Array of (target leaf, source leaf) node index pairs which are not well separated.
+
+        far : ndarray
+            Array of (target node, source node) node index pairs which are well separated.
+        """
+
+        # Start from the roots
+        pairs = np.zeros((1,2), dtype=int)
+        near = []
+        far = []
+        while len(pairs) > 0:
+            t = pairs[:,0]
+            s = pairs[:,1]
+
+            # Check separation
+            d = np.linalg.norm(target_tree.centers[t]-self.centers[s], axis=1)
+            separated = target_tree.radii[t]+self.radii[s] < theta*d
+            far.append(pairs[separated])
+
+            # Store pairs of leaves which are not separated
+            t_leaf = target_tree.is_leaf[t]
+            s_leaf = self.is_leaf[s]
+            both_leaves = ~separated & t_leaf & s_leaf
+            near.append(pairs[both_leaves])
+
+            # Split the larger of the remaining clusters (or whichever is not a leaf)
+            split = ~separated & ~both_leaves
+            split_source = split & ~s_leaf & (t_leaf | (self.radii[s] >= target_tree.radii[t]))
+            split_target = split & ~split_source
+
+            # Get new pairs from the children
+            new_pairs = []
+            for which, tree, mask in [(1, self, split_source), (0, target_tree, split_target)]:
+                children = tree.children[pairs[mask,which]]
+                valid = children >= 0
+                new = np.repeat(pairs[mask], 8, axis=0)[valid.flatten()]
+                new[:,which] = children[valid]
+                new_pairs.append(new)
+            pairs = np.concatenate(new_pairs)
+
+        return np.concatenate(near), np.concatenate(far)
@@ -0,0 +1,96 @@
+"""Blocked linear algebra routines for matrices too large to be held in memory (e.g. stored in a numpy.memmap)."""
+
+import numpy as np
+import scipy.linalg as sl
+
+from pypan.helpers import OneLineProgress
+
+
+def get_blocks(N, N_block):
+    # Divides N rows or columns into contiguous blocks of at most N_block
+    return [slice(i, min(i+N_block, N)) for i in range(0, N, N_block)]
+
+
+def normal_equations(A, b, C, N_block, verbose=False):
+    # Forms the lower triangle of C=(A*)A and returns (A*)b, loading at most a block of rows and a block of columns of A at a time
+
+    N = A.shape[1]
+    blocks = get_blocks(N, N_block)
+
+    if verbose:
+        print()
+        prog = OneLineProgress(len(blocks), msg="    Forming normal equations")
+
+    # Loop through block columns of C
+    Atb = np.zeros(N)
+    for J in blocks:
+
+        # Accumulate over block rows of A
+        C_J = np.zeros((N-J.start, J.stop-J.start))
+        for I in get_blocks(A.shape[0], N_block):
+            A_I = np.array(A[I])
+            C_J += np.matmul(A_I[:,J.start:].T, A_I[:,J])
+            Atb[J] += np.matmul(A_I[:,J].T, b[I])
+
+        # Store
+        C[J.start:,J] = C_J
+        if verbose:
+            prog.display()
+
+    return Atb
+
+
+def cholesky(C, N_block, verbose=False):
+    # Overwrites the lower triangle of the symmetric positive definite matrix C with its Cholesky factor L using a left-looking blocked algorithm; only two block columns are in memory at once
+
+    N = C.shape[0]
+    blocks = get_blocks(N, N_block)
+
+    if verbose:
+        print()
+        prog = OneLineProgress(len(blocks), msg="    Factoring normal equations")
+
+    # Loop through block columns
+    for j, J in enumerate(blocks):
+
+        # Update using previously factored block columns
+        C_J = np.array(C[J.start:,J])
+        for K in blocks[:j]:
+            L_K = np.array(C[J.start:,K])
+            C_J -= np.matmul(L_K, L_K[:J.stop-J.start].T)
+
+        # Factor diagonal block
+        L_JJ = sl.cholesky(C_J[:J.stop-J.start], lower=True)
+        C_J[:J.stop-J.start] = L_JJ
+
+        # Determine off-diagonal blocks
+        if J.stop < N:
+            C_J[J.stop-J.start:] = sl.solve_triangular(L_JJ, C_J[J.stop-J.start:].T, lower=True).T
+
+        # Store
+        C[J.start:,J] = C_J
+        if verbose:
+            prog.display()
+
+
+def cholesky_solve(L, b, N_block):
+    # Solves (L)(L*)x=b where the lower triangle of L holds a Cholesky factor from cholesky()
+
+    N = L.shape[0]
+    blocks = get_blocks(N, N_block)
+
+    # Forward substitution
+    y = np.array(b, dtype=np.float64).flatten()
+    for J in blocks:
+        L_J = np.array(L[J.start:,J])
+        y[J] = sl.solve_triangular(L_J[:J.stop-J.start], y[J], lower=True)
+        y[J.stop:] -= np.matmul(L_J[J.stop-J.start:], y[J])
+
+    # Back substitution
+    x = y
+    for J in reversed(blocks):
+        L_J = np.array(L[J.start:,J])
+        x[J] -= np.matmul(L_J[J.stop-J.start:].T, x[J.stop:])
+        x[J] = sl.solve_triangular(L_J[:J.stop-J.start], x[J], lower=True, trans='T')
+
+    return x
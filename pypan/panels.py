@@ -223,4 +223,194 @@ class Tri(Panel):
 
     def _calc_area(self):
         # Calculates the panel area
-        return 0.5*norm(cross(self.vertices[1]-self.vertices[0], self.vertices[2]-self.vertices[0]))
\ No newline at end of file
+        return 0.5*norm(cross(self.vertices[1]-self.vertices[0], self.vertices[2]-self.vertices[0]))
+
+
+def get_ring_influences(points, vertices, edges, edge_panel_map):
+    """Determines the velocity vector induced at arbitrary points by each of a set of panels, assuming a vortex ring (0th order) model and a unit positive vortex strength. This is the vectorized equivalent of calling Panel.get_ring_influence() for each panel. The influence of each unique edge is calculated once and then summed into the panels it bounds.
+
+    Parameters
+    ----------
+    points : ndarray
+        An array of points where the first index is the point index and the second index is the coordinate.
+
+    vertices : ndarray
+        An array of the vertices defining the edges.
+
+    edges : ndarray
+        An array of vertex index pairs where the first index is the edge index and the second index is the start (0) or end (1) vertex.
+
+    edge_panel_map : scipy.sparse.csr_matrix
+        Sparse matrix where the first index is the panel index and the second index is the edge index. An entry is 1 if the panel is traversed along the edge from its start to its end vertex and -1 if traversed in the opposite direction.
+
+    Returns
+    -------
+    ndarray
+        The velocity vector induced at each point by each panel. The first index is the point index, the second is the panel index, and the third is the velocity component.
+    """
+
+    # Determine displacement vectors to each vertex
+    x = points[:,0,np.newaxis]-vertices[np.newaxis,:,0]
+    y = points[:,1,np.newaxis]-vertices[np.newaxis,:,1]
+    z = points[:,2,np.newaxis]-vertices[np.newaxis,:,2]
+    r_mag = np.sqrt(x*x+y*y+z*z)
+
+    # Gather displacements for the start and end of each edge
+    i0 = edges[:,0]
+    i1 = edges[:,1]
+    x0, y0, z0, r0_mag = x[:,i0], y[:,i0], z[:,i0], r_mag[:,i0]
+    x1, y1, z1, r1_mag = x[:,i1], y[:,i1], z[:,i1], r_mag[:,i1]
+
+    # Calculate influence magnitude of each edge
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_r = r0_mag*r1_mag
+        n = (r0_mag+r1_mag)/(r_r*(r_r+x0*x1+y0*y1+z0*z1))
+        n = np.nan_to_num(n, copy=False)
+
+    # Sum edge influences into panels
+    v = np.empty((points.shape[0], edge_panel_map.shape[0], 3))
+    v[:,:,0] = edge_panel_map.dot(((y0*z1-z0*y1)*n).T).T
+    v[:,:,1] = edge_panel_map.dot(((z0*x1-x0*z1)*n).T).T
+    v[:,:,2] = edge_panel_map.dot(((x0*y1-y0*x1)*n).T).T
+
+    return 0.25/np.pi*v
+
+
+def get_panel_edges(edges, edge_panel_map, panels):
+    """Selects only the edges bounding the given panels, so that the influence of a subset of panels may be calculated using get_ring_influences().
+
+    Parameters
+    ----------
+    edges : ndarray
+        An array of vertex index pairs defining each edge.
+
+    edge_panel_map : scipy.sparse.csr_matrix
+        Sparse matrix mapping edges to panels. See get_ring_influences().
+
+    panels : slice or ndarray
+        Indices of the panels.
+
+    Returns
+    -------
+    edges : ndarray
+        Vertex index pairs defining the edges of the given panels.
+
+    edge_panel_map : scipy.sparse.csr_matrix
+        Sparse matrix mapping these edges to the given panels.
+    """
+
+    edge_panel_map = edge_panel_map[panels]
+    edge_ind = np.unique(edge_panel_map.indices)
+    return edges[edge_ind], edge_panel_map[:,edge_ind]
+
+
+def get_point_doublet_influences(points, centroids, vector_areas, normals=None):
+    """Determines the velocity vector induced at arbitrary points by each of a set of panels, approximating each panel as a point doublet at its area centroid. This is the far-field limit of get_ring_influences(); the relative error is of the order of the square of the ratio of panel diameter to distance.
+
+    Parameters
+    ----------
+    points : ndarray
+        An array of points where the first index is the point index and the second index is the coordinate.
+
+    centroids : ndarray
+        Area centroid of each panel.
+
+    vector_areas : ndarray
+        Area times normal vector of each panel.
+
+    normals : ndarray, optional
+        Unit vector at each point. If given, only the component of the velocity in this direction is returned.
+
+    Returns
+    -------
+    ndarray
+        The velocity vector induced at each point by each panel. The first index is the point index, the second is the panel index, and the third is the velocity component. If normals are given, the third index is omitted.
+    """
+
+    # Determine distances using matrix products, which is much faster than forming displacement vectors
+    r2 = np.matmul(points, -2.0*centroids.T)
+    r2 += np.sum(centroids*centroids, axis=1)[np.newaxis,:]
+    r2 += np.sum(points*points, axis=1)[:,np.newaxis]
+
+    # The velocity is (3(a.r)r/r^2-a)/(4 pi r^3), where a is the vector area; this is singular at the centroid
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = r2*np.sqrt(r2)
+        np.divide(0.25/np.pi, c, out=c)
+        f = np.matmul(points, vector_areas.T)
+        f -= np.sum(vector_areas*centroids, axis=1)[np.newaxis,:]
+        f *= 3.0
+        f /= r2
+        f *= c
+
+        # Normal component only
+        if normals is not None:
+            r_n = np.sum(points*normals, axis=1)[:,np.newaxis]-np.matmul(normals, centroids.T)
+            return f*r_n-c*np.matmul(normals, vector_areas.T)
+
+        v = np.empty(r2.shape+(3,))
+        for i in range(3):
+            v[:,:,i] = f*(points[:,i,np.newaxis]-centroids[np.newaxis,:,i])-c*vector_areas[np.newaxis,:,i]
+    return v
+
+
+def get_far_field_ring_influences(points, vertices, edges, edge_panel_map, centroids, vector_areas, diameters, ratio, normals=None):
+    """Determines the velocity vector induced at arbitrary points by each of a set of panels, assuming a vortex ring (0th order) model and a unit positive vortex strength. Panels further from a point than the given multiple of their diameter are approximated as point doublets (see get_point_doublet_influences()).
+
+    Parameters
+    ----------
+    points : ndarray
+        An array of points where the first index is the point index and the second index is the coordinate.
+
+    vertices : ndarray
+        An array of the vertices defining the edges.
+
+    edges : ndarray
+        An array of vertex index pairs defining each edge.
+
+    edge_panel_map : scipy.sparse.csr_matrix
+        Sparse matrix mapping edges to panels. See get_ring_influences().
+
+    centroids : ndarray
+        Area centroid of each panel.
+
+    vector_areas : ndarray
+        Area times normal vector of each panel.
+
+    diameters : ndarray
+        Diameter of each panel.
+
+    ratio : float
+        Ratio of distance to diameter beyond which panels are approximated as point doublets.
+
+    normals : ndarray, optional
+        Unit vector at each point. If given, only the component of the velocity in this direction is returned.
+
+    Returns
+    -------
+    v : ndarray
+        The velocity vector induced at each point by each panel. The first index is the point index, the second is the panel index, and the third is the velocity component. If normals are given, the third index is omitted.
+
+    near : ndarray
+        Whether each influence was calculated exactly. The first index is the point index and the second is the panel index.
+    """
+
+    # Get far-field influences
+    v = get_point_doublet_influences(points, centroids, vector_areas, normals=normals)
+
+    # Determine which panels are near each point
+    r2 = np.matmul(points, -2.0*centroids.T)
+    r2 += np.sum(centroids*centroids, axis=1)[np.newaxis,:]
+    r2 += np.sum(points*points, axis=1)[:,np.newaxis]
+    near = r2 <= (ratio*diameters[np.newaxis,:])**2
+
+    # Replace with exact influences for the points near each panel
+    columns = np.nonzero(np.any(near, axis=0))[0]
+    if len(columns) > 0:
+        v_near = get_ring_influences(points, vertices, *get_panel_edges(edges, edge_panel_map, columns))
+        if normals is not None:
+            v_near = np.einsum('ijk,ik->ij', v_near, normals)
+            v[:,columns] = np.where(near[:,columns], v_near, v[:,columns])
+        else:
+            v[:,columns] = np.where(near[:,columns,np.newaxis], v_near, v[:,columns])
+
+    return v, near
@@ -17,6 +17,13 @@ def norm(x):
     return m.sqrt(x[0]*x[0]+x[1]*x[1]+x[2]*x[2])
 
 
+def mirror_xz(x):
+    """Reflects the last dimension of x across the xz plane."""
+    x_mirror = np.array(x, dtype=float)
+    x_mirror[...,1] *= -1.0
+    return x_mirror
+
+
 def dist(x, y):
     """Calculates the Euclidean distance between x and y."""
     return norm([x[0]-y[0], x[1]-y[1], x[2]-y[2]])
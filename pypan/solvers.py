@@ -101,24 +101,9 @@ class Solver:
             if hasattr(self, "_mu"):
                 print("SCALARS doublet_strength float 1", file=export_handle)
                 print("LOOKUP_TABLE default", file=export_handle)
-                for i in range(self._mesh.wake.N):
 
-                    # Determine strength of filament
-                    mu = 0
-
-                    # Add for outbound panels
-                    outbound_panels = self._mesh.wake.outbound_panels[i]
-                    if len(outbound_panels)>0:
-                        mu -= self._mu[outbound_panels[0]]
-                        mu += self._mu[outbound_panels[1]]
-
-                    # Add for inbound panels
-                    inbound_panels = self._mesh.wake.inbound_panels[i]
-                    if len(inbound_panels)>0:
-                        mu += self._mu[inbound_panels[0]]
-                        mu -= self._mu[inbound_panels[1]]
-
-                    # Print out
+                # Each segment of a filament has the strength of the filament
+                for mu in self._mesh.wake.get_filament_strengths(self._mu):
                     for i in range(self._mesh.wake.N_segments):
                         print("{0:<20.12}".format(mu), file=export_handle)
 
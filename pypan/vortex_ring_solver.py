@@ -1,29 +1,116 @@
 import time
-import copy
+import inspect
+import os
+import tempfile
+import warnings
 
 import numpy as np
+import scipy.linalg as sl
+import scipy.linalg.lapack as lapack
+import scipy.sparse as sp
+import scipy.sparse.linalg as spl
 import multiprocessing as mp
 import matplotlib.pyplot as plt
 
+from multiprocessing import shared_memory
+
 from pypan.solvers import Solver
-from pypan.pp_math import norm, vec_norm, vec_inner, vec_cross, inner
-from pypan.gauss_seidel import gauss_seidel, gauss_seidel_multiprocess
+from pypan.pp_math import norm, vec_norm, vec_inner, vec_cross, inner, mirror_xz
+from pypan.gauss_seidel import gauss_seidel
+from pypan.out_of_core import get_blocks, normal_equations, cholesky, cholesky_solve
+from pypan.mixed_precision import qr_factor, refine_least_squares
+from pypan.fmm import FMMInfluence
+from pypan.hmatrix import HMatrix
+from pypan.influence_cache import InfluenceCache
 from pypan.helpers import OneLineProgress
+from pypan.panels import get_ring_influences, get_far_field_ring_influences, get_panel_edges
 from pypan.wake import StraightFixedWake, MarchingStreamlineWake, FullStreamlineWake, VelocityRelaxedWake
 
 
-def get_panel_influences(args):
-    """Calculates the influence of each panel on each point."""
+# Keyword argument giving the relative tolerance of GMRES, which was "tol" before SciPy 1.12
+_GMRES_TOLERANCE = "rtol" if "rtol" in inspect.signature(spl.gmres).parameters else "tol"
 
-    # Initialize storage
-    panels, points = args
-    inf_mat = np.zeros((len(points), len(panels), 3))
-    
-    # Loop through panels
-    for i, panel in enumerate(panels):
-        inf_mat[:,i,:] = panel.get_ring_influence(points)
 
-    return inf_mat
+def _gmres(A, b, tolerance, **kwargs):
+    # Solves Ax=b using GMRES to the given tolerance on the residual relative to b, for any supported version of SciPy
+
+    return spl.gmres(A, b, atol=0.0, **{_GMRES_TOLERANCE : tolerance}, **kwargs)
+
+
+# Data shared with each worker process when calculating the panel influence matrix in parallel
+_worker_data = {}
+
+
+def _init_influence_worker(shm_name, filename, shape, dtype, normal_filename, cp, n, far_field, symmetric, vertices, edges, edge_panel_map):
+    # Attaches a worker process to the shared influence matrix (either in shared memory or memory-mapped from a file) and stores the mesh data it needs; if normal_filename is given, the normal influences are also written in double precision to that file. far_field is None or the far-field data of the mesh followed by the distance ratio, and symmetric is whether the mirror images of the panels are included
+
+    if filename is not None:
+        _worker_data["inf_mat"] = np.memmap(filename, dtype=dtype, mode='r+', shape=shape)
+    else:
+        _worker_data["shm"] = shared_memory.SharedMemory(name=shm_name)
+        _worker_data["inf_mat"] = np.ndarray(shape, dtype=dtype, buffer=_worker_data["shm"].buf)
+    _worker_data["normal_inf_mat"] = None if normal_filename is None else np.memmap(normal_filename, dtype=np.float64, mode='r+', shape=shape[:2])
+    _worker_data["cp"] = cp
+    _worker_data["n"] = n
+    _worker_data["far_field"] = far_field
+    _worker_data["symmetric"] = symmetric
+    _worker_data["vertices"] = vertices
+    _worker_data["edges"] = edges
+    _worker_data["edge_panel_map"] = edge_panel_map
+
+
+def _calc_panel_influence_columns(columns):
+    # Calculates the influence of the given block of panels on all control points and writes it directly into the shared influence matrix; returns the number of influences calculated exactly
+
+    # Get only the edges belonging to these panels
+    edges, edge_panel_map = get_panel_edges(_worker_data["edges"], _worker_data["edge_panel_map"], columns)
+
+    # Loop through blocks of control points
+    cp = _worker_data["cp"]
+    n = _worker_data["n"]
+    far_field = _worker_data["far_field"]
+    symmetric = _worker_data["symmetric"]
+    inf_mat = _worker_data["inf_mat"]
+    normal_inf_mat = _worker_data["normal_inf_mat"]
+    N_block = max(1, 2**17//(columns.stop-columns.start))
+    N_exact = 0
+    for i in range(0, len(cp), N_block):
+        rows = slice(i, min(i+N_block, len(cp)))
+
+        # Store only the normal component for a 2D matrix
+        if far_field is not None and not symmetric and normal_inf_mat is None:
+            centroids, vector_areas, diameters, ratio = far_field
+            inf, near = get_far_field_ring_influences(cp[rows], _worker_data["vertices"], edges, edge_panel_map, centroids[columns], vector_areas[columns], diameters[columns], ratio, normals=n[rows] if inf_mat.ndim == 2 else None)
+            inf_mat[rows,columns] = inf
+            N_exact += np.sum(near)
+            continue
+
+        # Get influences; the influence of the mirror image of a panel is the mirror of the panel's influence at the mirrored point
+        if far_field is not None:
+            centroids, vector_areas, diameters, ratio = far_field
+            inf, near = get_far_field_ring_influences(cp[rows], _worker_data["vertices"], edges, edge_panel_map, centroids[columns], vector_areas[columns], diameters[columns], ratio)
+            inf_mirror, near_mirror = get_far_field_ring_influences(mirror_xz(cp[rows]), _worker_data["vertices"], edges, edge_panel_map, centroids[columns], vector_areas[columns], diameters[columns], ratio)
+            inf += mirror_xz(inf_mirror)
+            N_exact += np.sum(near | near_mirror)
+        else:
+            inf = get_ring_influences(cp[rows], _worker_data["vertices"], edges, edge_panel_map)
+            if symmetric:
+                inf += mirror_xz(get_ring_influences(mirror_xz(cp[rows]), _worker_data["vertices"], edges, edge_panel_map))
+            N_exact += (rows.stop-rows.start)*(columns.stop-columns.start)
+
+        if inf_mat.ndim == 2:
+            inf_mat[rows,columns] = np.einsum('ijk,ik->ij', inf, n[rows])
+        else:
+            inf_mat[rows,columns] = inf
+        if normal_inf_mat is not None:
+            normal_inf_mat[rows,columns] = np.einsum('ijk,ik->ij', inf, n[rows])
+
+    # Make sure results are written to disk
+    for matrix in [inf_mat, normal_inf_mat]:
+        if isinstance(matrix, np.memmap):
+            matrix.flush()
+
+    return N_exact
 
 
 class VortexRingSolver(Solver):
@@ -34,41 +121,1030 @@ class VortexRingSolver(Solver):
     mesh : Mesh
         A PyPan mesh object about which to calculate the flow.
 
+    low_memory : bool, optional
+        If True, only the component of the panel influence matrix normal to each panel is stored, requiring a third of the memory. Surface velocities are then recovered after each solve by recalculating the panel influences block by block. Defaults to False.
+
+    n_workers : int, optional
+        Number of processes to use for calculating the panel influence matrix. Each process writes blocks of columns directly into a shared memory buffer. Defaults to 1.
+
+    scratch_dir : str, optional
+        Directory in which to store the influence and system matrices for meshes too large for these to fit in memory. If given, the matrices are stored as memory-mapped files (in a temporary subdirectory which is removed when the solver is deleted) and are built and solved tile by tile. This implies "low_memory" and only the 'direct' method may be used with solve(). Defaults to None, in which case all matrices are held in memory.
+
+    tile_memory : float, optional
+        Approximate amount of memory (in MB) to use for each tile of the matrices when "scratch_dir" is given. Peak memory use during the solve is a small multiple of this. Defaults to 512.
+
+    precision : str, optional
+        May be 'double' or 'mixed'. If 'mixed', the panel influence matrix is stored in single precision, halving its memory, and a double-precision copy of its normal components is kept on disk. The 'direct' method then factors the system matrix in single precision and refines the solution against the double-precision copy, while the other methods solve the double-precision system directly. May not be used with "scratch_dir" or the 'gmres' method. Defaults to 'double'.
+
+    matrix_type : str, optional
+        May be 'dense', 'fmm', or 'hmatrix'. 'dense' stores the full panel influence matrix. 'fmm' approximates distant panel influences with a multipole expansion stored in sparse matrices. 'hmatrix' stores the normal influence matrix as a hierarchical matrix with low-rank blocks. 'fmm' requires the 'gmres' method, and 'hmatrix' the 'gmres' or 'lu' method. Only 'dense' may be used with "low_memory", "n_workers", "scratch_dir", and "precision". Defaults to 'dense'.
+
+    fmm_order : int, optional
+        Order of the multipole expansion for the 'fmm' matrix type. An order of 0 treats each distant cluster of panels as a point doublet. Defaults to 2.
+
+    fmm_theta : float, optional
+        Opening criterion for the 'fmm' matrix type. Two clusters of panels are approximated using the multipole expansion if the sum of their radii is less than "fmm_theta" times the distance between them. Smaller values are more accurate but more expensive. Defaults to 0.5.
+
+    fmm_leaf_size : int, optional
+        Maximum number of panels in the smallest clusters for the 'fmm' matrix type. Defaults to 32.
+
+    hmatrix_tolerance : float, optional
+        Relative accuracy to which each low-rank block is approximated for the 'hmatrix' matrix type, which sets the error of the solution. Its H-LU factorization is slower than the 'dense' matrix type for about 10^4 panels. Defaults to 1e-6.
+
+    cache_dir : str, optional
+        Directory in which to cache panel influence matrices between runs. Before calculating the influence matrix, the solver looks for one calculated previously for a mesh with the same geometry (and with the same storage options) and memory-maps it if found. Otherwise, the newly calculated matrix is saved to the cache. The factorization of the system without the wake used by the 'direct' and 'lu' methods (see "low_rank_wake" in solve()) is cached in the same way. May be shared between processes. Only used with the 'dense' matrix type. Defaults to None, in which case nothing is cached.
+
+    cache_max_size : float, optional
+        Maximum total size of the cache in MB. The least recently used matrices are removed to stay within this limit. Defaults to no limit.
+
+    cache_max_age : float, optional
+        Matrices not used for this many days are removed from the cache. Defaults to no limit.
+
+    far_field_ratio : float, optional
+        Panels further from a control point than this multiple of their diameter are approximated as point doublets, which speeds up assembly; the error falls as the square of the ratio (about 1e-3 for a ratio of 5). Only used with the 'dense' matrix type. Defaults to None.
+
+    history_size : int, optional
+        Number of previously solved conditions (freestream velocity and angular rate) for which the doublet strengths are kept. The iterative methods of solve() start from the solution for the nearest of these conditions. Defaults to 10.
+
     verbose : bool, optional
     """
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        if self._verbose:
-            print()
-            prog = OneLineProgress(self._N_panels, msg="Calculating panel influence matrix")
+        # Get kwargs
+        self._low_memory = kwargs.get("low_memory", False)
+        self._n_workers = kwargs.get("n_workers", 1)
+        scratch_dir = kwargs.get("scratch_dir", None)
+        precision = kwargs.get("precision", "double")
+        self._far_field_ratio = kwargs.get("far_field_ratio", None)
+        self._history_size = kwargs.get("history_size", 10)
+        cache_dir = kwargs.get("cache_dir", None)
+
+        # Set storage precision
+        if precision == "double":
+            self._dtype = np.float64
+        elif precision == "mixed":
+            if scratch_dir is not None:
+                raise IOError("'precision' may not be 'mixed' when a scratch directory is given.")
+            self._dtype = np.float32
+        else:
+            raise IOError("{0} is not a valid precision. Must be 'double' or 'mixed'.".format(precision))
+
+        # Check matrix type
+        self._matrix_type = kwargs.get("matrix_type", "dense")
+        if self._matrix_type not in ["dense", "fmm", "hmatrix"]:
+            raise IOError("{0} is not a valid matrix type. Must be 'dense', 'fmm', or 'hmatrix'.".format(self._matrix_type))
+        if self._matrix_type != "dense" and (self._low_memory or self._n_workers > 1 or scratch_dir is not None or precision != "double" or self._far_field_ratio is not None or cache_dir is not None):
+            raise IOError("'low_memory', 'n_workers', 'scratch_dir', 'precision', 'far_field_ratio', and 'cache_dir' may only be used with the 'dense' matrix type.")
+        if self._matrix_type != "dense" and self._mesh.symmetric:
+            raise IOError("A symmetric mesh may only be used with the 'dense' matrix type.")
+
+        # Factorization of the system matrix, kept between solves; stored with the method and wake hash for which it was calculated
+        self._factors = None
+
+        # Double-precision copy of the panel normal influence matrix for mixed precision, and the temporary directory storing it
+        self._double_dir = None
+        self._double_normal_influence_matrix = None
+
+        # Doublet strengths and surface velocities for unit freestream velocity and angular rate components
+        self._basis_mu = None
+        self._basis_v = None
+
+        # Previously solved conditions and their doublet strengths, used as initial guesses for the iterative methods
+        self._history = []
+
+        # Vector orthogonal to the range of the least-squares system from the last 'gmres' solve, used as an initial guess for the next
+        self._range_vector = None
+
+        # H-LU factorization of the panel normal influence matrix for the 'hmatrix' matrix type, and the multiple of the matrix of ones added to it
+        self._hierarchical_lu = None
+
+        # Convergence of the wake shape during the last solve
+        self._wake_convergence_history = []
+
+        # Set up scratch storage
+        if scratch_dir is not None:
+            self._low_memory = True
+            self._scratch = tempfile.TemporaryDirectory(dir=scratch_dir, prefix="pypan_")
+            self._N_tile = max(1, int(kwargs.get("tile_memory", 512.0)*2**20)//(16*self._N_panels))
+            filename = os.path.join(self._scratch.name, "panel_influence_matrix.dat")
+        else:
+            self._scratch = None
+            filename = None
+
+        # Set up multipole approximation of the panel influences; like the low-memory mode, velocities are recalculated after each solve
+        if self._matrix_type == "fmm":
+            self._low_memory = True
+            self._influence_operator = FMMInfluence(self._mesh, order=kwargs.get("fmm_order", 2), theta=kwargs.get("fmm_theta", 0.5), leaf_size=kwargs.get("fmm_leaf_size", 32), verbose=self._verbose)
+
+        # Set up hierarchical matrix; the velocities are recalculated exactly after each solve
+        elif self._matrix_type == "hmatrix":
+            self._low_memory = True
+            self._influence_operator = HMatrix(self._mesh, tolerance=kwargs.get("hmatrix_tolerance", 1e-6), verbose=self._verbose)
 
         # Create panel influence matrix; first index is the influenced panel, second is the influencing panel
-        #N_processes = 8
-        #with mp.Pool(processes=N_processes) as pool:
-        #    N_per_process = self._N_panels//N_processes
-        #    args = []
-        #    for i in range(N_processes):
-        #        if i<N_processes-1:
-        #            panels = self._mesh.panels[i*N_per_process:(i+1)*N_per_process]
-        #        else:
-        #            panels = self._mesh.panels[i*N_per_process:]
-        #        args.append((copy.deepcopy(panels), copy.deepcopy(self._mesh.cp)))
-
-        #    res = pool.map(get_panel_influences, args)
-        #    if self._verbose:
-        #        prog.display()
-
-        #self._panel_influence_matrix = np.concatenate(res, axis=1)
-        #if self._verbose:
-        #    prog.display()
-        self._panel_influence_matrix = np.zeros((self._N_panels, self._N_panels, 3))
-        for i, panel in enumerate(self._mesh.panels):
-            self._panel_influence_matrix[:,i] = panel.get_ring_influence(self._mesh.cp)
-            if self._verbose:
+        else:
+
+            # Check the cache; the key includes everything which affects the matrix
+            inf_mat = None
+            if cache_dir is not None:
+                self._cache = InfluenceCache(cache_dir, max_size=kwargs.get("cache_max_size", None), max_age=kwargs.get("cache_max_age", None), verbose=self._verbose)
+                inf_mat = self._cache.load(self._get_cache_key())
+            else:
+                self._cache = None
+            self._N_exact_influences = 0
+
+            # For mixed precision, keep a double-precision copy of the normal influence matrix on disk for refining the solution
+            double_filename = None
+            mixed = self._dtype == np.float32
+            if mixed:
+                self._double_dir = tempfile.TemporaryDirectory(prefix="pypan_")
+                if self._cache is not None:
+                    self._double_normal_influence_matrix = self._cache.load(self._get_cache_key(True, np.float64))
+                if self._double_normal_influence_matrix is None:
+                    double_filename = os.path.join(self._double_dir.name, "panel_normal_influence_matrix.dat")
+
+            # Calculate only the double-precision normal influences; with low memory, the single-precision matrix is rounded from them
+            if double_filename is not None and (inf_mat is not None or self._low_memory):
+                if self._n_workers > 1:
+                    self._get_panel_influences_in_parallel(normal_only=True, filename=double_filename, dtype=np.float64, verbose=self._verbose)
+                else:
+                    self._get_panel_normal_influences(filename=double_filename, dtype=np.float64, verbose=self._verbose)
+
+            # Calculate; for mixed precision, the full influences are calculated in double precision and rounded, and the normal influences are stored in double precision at the same time if needed
+            elif inf_mat is None and not (mixed and self._low_memory):
+                if self._n_workers > 1:
+                    inf_mat = self._get_panel_influences_in_parallel(normal_only=self._low_memory, filename=filename, normal_filename=double_filename, verbose=self._verbose)
+                elif self._low_memory:
+                    inf_mat = self._get_panel_normal_influences(filename=filename, verbose=self._verbose)
+                else:
+                    inf_mat = self._get_panel_influences(self._mesh.cp, normal_filename=double_filename, verbose=self._verbose)
+
+                # Save to the cache
+                if self._cache is not None:
+                    self._cache.store(self._get_cache_key(), inf_mat)
+
+            # Save the double-precision copy
+            if double_filename is not None:
+                self._double_normal_influence_matrix = np.memmap(double_filename, dtype=np.float64, mode='r+', shape=(self._N_panels, self._N_panels))
+                if self._cache is not None:
+                    self._cache.store(self._get_cache_key(True, np.float64), self._double_normal_influence_matrix)
+
+            # Round the single-precision normal influences from the double-precision copy
+            if inf_mat is None:
+                inf_mat = np.zeros((self._N_panels, self._N_panels), dtype=np.float32)
+                for block in get_blocks(self._N_panels, max(1, 2**20//self._N_panels)):
+                    inf_mat[block] = self._double_normal_influence_matrix[block]
+                if self._cache is not None:
+                    self._cache.store(self._get_cache_key(), inf_mat)
+
+            # Display statistics of the far-field approximation
+            if self._verbose and self._far_field_ratio is not None and self._N_exact_influences > 0:
+                max_error, avg_error = self._estimate_far_field_error()
+                print()
+                print("    Far-Field Approximation:")
+                print("        Distance/diameter ratio: {0}".format(self._far_field_ratio))
+                print("        Fraction of influences approximated: {0}".format(1.0-self._N_exact_influences/self._N_panels**2))
+                print("        Estimated maximum error of approximated influences: {0}".format(max_error))
+                print("        Estimated average error of approximated influences: {0}".format(avg_error))
+
+            # Store
+            if self._low_memory:
+                self._panel_normal_influence_matrix = inf_mat
+            else:
+                self._panel_influence_matrix = inf_mat
+
+
+    def __del__(self):
+
+        # Release shared memory or scratch files used to store the influence matrix; the array must be deleted first as it references the storage
+        if hasattr(self, "_shm") or getattr(self, "_scratch", None) is not None:
+            self._panel_influence_matrix = None
+            self._panel_normal_influence_matrix = None
+        if hasattr(self, "_shm"):
+            self._shm.close()
+        if getattr(self, "_scratch", None) is not None:
+            self._scratch.cleanup()
+
+        # Release the double-precision copies of the influence and system matrices kept for mixed precision
+        if getattr(self, "_double_dir", None) is not None:
+            self._double_normal_influence_matrix = None
+            self._factors = None
+            self._double_dir.cleanup()
+
+
+    def _get_cache_key(self, normal_only=None, dtype=None):
+        # Returns the key under which the panel influence matrix is cached; this includes everything which affects the matrix. The storage and precision default to those of the solver.
+
+        normal_only = self._low_memory if normal_only is None else normal_only
+        dtype = self._dtype if dtype is None else dtype
+        return self._cache.get_key(self._mesh.get_hash(), "normal" if normal_only else "full", np.dtype(dtype).name, self._far_field_ratio)
+
+
+    def _get_point_blocks(self, N_points):
+        # Divides the points into blocks which can be processed at once without creating overly large temporary arrays
+
+        N_block = max(1, 2**17//self._N_panels)
+        return [slice(i, min(i+N_block, N_points)) for i in range(0, N_points, N_block)]
+
+
+    def _get_block_influences(self, points, normals=None):
+        # Determines the influence of every panel on a block of nearby points, using the far-field approximation if requested; if normals are given, only the normal component is returned
+
+        if self._far_field_ratio is not None:
+            inf, near = self._mesh.get_far_field_ring_influences(points, self._far_field_ratio, normals=normals)
+            self._N_exact_influences += np.sum(near)
+            return inf
+
+        self._N_exact_influences += len(points)*self._N_panels
+        if normals is not None:
+            return np.einsum('ijk,ik->ij', self._mesh.get_ring_influences(points), normals)
+        return self._mesh.get_ring_influences(points)
+
+
+    def _estimate_far_field_error(self):
+        # Estimates the error of the far-field approximation by comparing the approximate and exact influences for a sample of blocks of control points; returns the maximum and average relative error of the approximated influences
+
+        blocks = self._get_point_blocks(self._N_panels)
+        sample = np.random.default_rng(0).choice(len(blocks), size=min(10, len(blocks)), replace=False)
+        errors = []
+        for i in sample:
+            points = self._mesh.cp[blocks[i]]
+            approx, near = self._mesh.get_far_field_ring_influences(points, self._far_field_ratio)
+            exact = self._mesh.get_ring_influences(points)
+
+            # Get relative error of each approximated influence
+            far = ~near
+            errors.append(vec_norm(approx[far]-exact[far])/vec_norm(exact[far]))
+
+        errors = np.concatenate(errors)
+        if len(errors) == 0:
+            return 0.0, 0.0
+        return np.max(errors), np.average(errors)
+
+
+    def _get_panel_influences(self, points, normal_filename=None, verbose=False):
+        # Determines the influence of every panel on the given points; first index is the point, second is the panel, third is the velocity component. If normal_filename is given, the normal influences on the control points are also written in double precision to that file.
+
+        # Get blocks
+        blocks = self._get_point_blocks(len(points))
+        if verbose:
+            print()
+            prog = OneLineProgress(len(blocks), msg="Calculating panel influence matrix")
+
+        # Loop through blocks of points
+        inf_mat = np.zeros((len(points), self._N_panels, 3), dtype=self._dtype)
+        if normal_filename is not None:
+            normal_inf_mat = np.memmap(normal_filename, dtype=np.float64, mode='w+', shape=(len(points), self._N_panels))
+        for block in blocks:
+            inf = self._get_block_influences(points[block])
+            inf_mat[block] = inf
+            if normal_filename is not None:
+                normal_inf_mat[block] = np.einsum('ijk,ik->ij', inf, self._mesh.n[block])
+            if verbose:
+                prog.display()
+        if normal_filename is not None:
+            normal_inf_mat.flush()
+
+        return inf_mat
+
+
+    def _get_panel_influences_in_parallel(self, normal_only=False, filename=None, dtype=None, normal_filename=None, verbose=False):
+        # Determines the panel influence matrix for the control points using multiple processes; it is stored in the given precision, which defaults to that of the solver. If normal_filename is given, the normal influences are also written in double precision to that file.
+
+        # Create shared storage
+        dtype = self._dtype if dtype is None else dtype
+        shape = (self._N_panels, self._N_panels) if normal_only else (self._N_panels, self._N_panels, 3)
+        if filename is not None:
+            inf_mat = np.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+            inf_mat.flush()
+            shm_name = None
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*np.dtype(dtype).itemsize)
+            inf_mat = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+            shm_name = self._shm.name
+        if normal_filename is not None:
+            np.memmap(normal_filename, dtype=np.float64, mode='w+', shape=shape[:2]).flush()
+
+        # Divide panels into blocks of columns; several per process helps balance the load
+        N_block = max(1, -(-self._N_panels//(4*self._n_workers)))
+        blocks = [slice(i, min(i+N_block, self._N_panels)) for i in range(0, self._N_panels, N_block)]
+
+        if verbose:
+            print()
+            prog = OneLineProgress(len(blocks), msg="Calculating panel influence matrix")
+
+        # Send off processes
+        try:
+            far_field = None if self._far_field_ratio is None else (*self._mesh.get_far_field_data(), self._far_field_ratio)
+            initargs = (shm_name, filename, shape, dtype, normal_filename, self._mesh.cp, self._mesh.n, far_field, self._mesh.symmetric, *self._mesh.get_edge_data())
+            with mp.Pool(processes=self._n_workers, initializer=_init_influence_worker, initargs=initargs) as pool:
+                for N_exact in pool.imap_unordered(_calc_panel_influence_columns, blocks):
+                    self._N_exact_influences += N_exact
+                    if verbose:
+                        prog.display()
+
+        # The name is no longer needed once the workers are done; the memory stays mapped in this process
+        finally:
+            if filename is None:
+                self._shm.unlink()
+
+        return inf_mat
+
+
+    def _get_panel_normal_influences(self, filename=None, dtype=None, verbose=False):
+        # Determines the influence of every panel on the velocity normal to each panel at its control point; first index is the influenced panel, second is the influencing panel. If a filename is given, the matrix is memory-mapped to that file. The matrix is stored in the given precision, which defaults to that of the solver.
+
+        # Get blocks
+        blocks = self._get_point_blocks(self._N_panels)
+        if verbose:
+            print()
+            prog = OneLineProgress(len(blocks), msg="Calculating panel influence matrix")
+
+        # Initialize storage
+        dtype = self._dtype if dtype is None else dtype
+        if filename is not None:
+            inf_mat = np.memmap(filename, dtype=dtype, mode='w+', shape=(self._N_panels, self._N_panels))
+        else:
+            inf_mat = np.zeros((self._N_panels, self._N_panels), dtype=dtype)
+
+        # Loop through blocks of control points, only keeping the normal component
+        for block in blocks:
+            inf_mat[block] = self._get_block_influences(self._mesh.cp[block], normals=self._mesh.n[block])
+            if verbose:
                 prog.display()
 
+        return inf_mat
+
+
+    def _get_velocity_from_panels(self, points, mu):
+        # Determines the velocity induced by the panels at the given points without storing the full influence matrix
+
+        if self._matrix_type == "fmm":
+            return self._influence_operator.get_velocities(points, mu)
+
+        v = np.zeros((len(points), 3))
+        for block in self._get_point_blocks(len(points)):
+            v[block] = np.einsum('ijk,j', self._mesh.get_ring_influences(points[block]), mu)
+
+        return v
+
+
+    def _get_velocity_from_wake(self, points, mu):
+        # Determines the velocity induced by the wake at the given points without storing the full influence matrix
+
+        v = np.zeros((len(points), 3))
+        for block in self._get_point_blocks(len(points)):
+            kutta_panels, inf = self._get_wake_influences(points[block])
+            v[block] = np.einsum('ijk,j', inf, mu[kutta_panels])
+
+        return v
+
+
+    def _get_wake_influences(self, points):
+        # Determines the influence of the wake (and its mirror image for a symmetric mesh) on the given points; only the nonzero columns, belonging to the panels bordering Kutta edges, are calculated. Returns the indices of these panels and the influences; first index is the point, second is the column, third is the velocity component
+
+        kutta_panels, inf_mat = self._mesh.wake.get_compact_influence_matrix(points=points)
+        if self._mesh.symmetric:
+            inf_mat += mirror_xz(self._mesh.wake.get_compact_influence_matrix(points=mirror_xz(points))[1])
+        return kutta_panels, inf_mat
+
+
+    def _get_wake_normal_influence(self, wake_influence_matrix):
+        # Determines the normal influence of the wake on each control point; only the columns of panels bordering Kutta edges are nonzero, so only these are returned, along with the panel indices; if the wake influences (as returned by _get_wake_influences()) are not given, they are calculated block by block
+
+        if wake_influence_matrix is not None:
+            kutta_panels, inf = wake_influence_matrix
+            return kutta_panels, np.einsum('ijk,ik->ij', inf, self._mesh.n)
+
+        wake_normal_influence = []
+        for block in self._get_point_blocks(self._N_panels):
+            kutta_panels, inf = self._get_wake_influences(self._mesh.cp[block])
+            wake_normal_influence.append(np.einsum('ijk,ik->ij', inf, self._mesh.n[block]))
+        return kutta_panels, np.concatenate(wake_normal_influence)
+
+
+    def _get_system_matrix(self, wake_influence_matrix, dtype, include_wake=True):
+        # Assembles the normal influence of the panels and (optionally) wake on each control point, with an extra row of ones setting the sum of the doublet strengths; if the wake influence matrix is not given, it is calculated block by block so it is never stored in full. In double precision, the double-precision copy kept for mixed precision is used if there is one.
+
+        A = np.zeros((self._N_panels+1,self._N_panels), dtype=dtype)
+        if dtype == np.float64 and self._double_normal_influence_matrix is not None:
+            A[:-1] = self._double_normal_influence_matrix
+        elif wake_influence_matrix is None:
+            A[:-1] = self._panel_normal_influence_matrix
+        else:
+            A[:-1] = np.einsum('ijk,ik->ij', self._panel_influence_matrix, self._mesh.n.astype(self._dtype))
+        if include_wake:
+            kutta_panels, wake_normal_influence = self._get_wake_normal_influence(wake_influence_matrix)
+            A[:-1,kutta_panels] += wake_normal_influence
+        A[-1] = 1.0
+
+        return A
+
+
+    def _get_double_system_matrix(self, wake_influence_matrix):
+        # Assembles the system matrix (see _get_system_matrix()) in double precision from the double-precision copy of the normal influence matrix kept for mixed precision; it is memory-mapped to a temporary file
+
+        A = np.memmap(os.path.join(self._double_dir.name, "system_matrix.dat"), dtype=np.float64, mode='w+', shape=(self._N_panels+1, self._N_panels))
+        kutta_panels, wake_normal_influence = self._get_wake_normal_influence(wake_influence_matrix)
+        for block in get_blocks(self._N_panels, max(1, 2**20//self._N_panels)):
+            A_block = np.array(self._double_normal_influence_matrix[block])
+            A_block[:,kutta_panels] += wake_normal_influence[block]
+            A[block] = A_block
+        A[-1] = 1.0
+        A.flush()
+
+        return A
+
+
+    def _solve_with_factors(self, b, method, mixed, wake_influence_matrix, solve_kwargs):
+        # Solves the system using the 'direct' or 'lu' method, reusing the factorization until the mesh or wake changes; returns the solution, whether the factorization was reused, and the mixed-precision refinement history
+
+        # Include the wake as a low-rank update
+        if not mixed and solve_kwargs.get("low_rank_wake", True):
+            mu, reused = self._solve_with_wake_update(b, method, wake_influence_matrix)
+            return mu, reused, None
+
+        # Factor
+        system_key = (method, self._mesh.wake.get_hash())
+        reused = self._factors is not None and self._factors[0] == system_key
+        if not reused:
+            self._factors = None
+            A = self._get_system_matrix(wake_influence_matrix, np.float32 if mixed else np.float64)
+
+            # Single-precision QR factor for the mixed-precision direct method; the solution is refined using the system matrix in double precision
+            if mixed:
+                R = qr_factor(A)
+                del A
+                self._factors = (system_key, self._get_double_system_matrix(wake_influence_matrix), R)
+
+            # Normal equations
+            elif method == "direct":
+                self._factors = (system_key, A, sl.lu_factor(np.matmul(A.T, A), overwrite_a=True))
+
+            # Square system formed by enforcing the sum of the doublet strengths using a Lagrange multiplier
+            else:
+                A_square = np.zeros((self._N_panels+1, self._N_panels+1))
+                A_square[:,:-1] = A
+                A_square[:-1,-1] = 1.0
+                del A
+                factor = sl.lu_factor(A_square, overwrite_a=True)
+                z, h = self._get_range_projection(lambda r: sl.lu_solve(factor, r), lambda r: sl.lu_solve(factor, r, trans=1))
+                self._factors = (system_key, factor, z, h)
+
+        # Solve
+        if mixed:
+            mu, refinement_history = refine_least_squares(self._factors[1], b, self._factors[2], tolerance=solve_kwargs.get("refinement_convergence", 1e-12), max_iterations=solve_kwargs.get("refinement_max_iterations", 50))
+            return mu, reused, refinement_history
+        elif method == "direct":
+            return sl.lu_solve(self._factors[2], np.matmul(self._factors[1].T, b)), reused, None
+        factor, z, h = self._factors[1:]
+        return (sl.lu_solve(factor, b)-np.inner(z, b)*h)[:-1], reused, None
+
+
+    def _get_range_projection(self, solve, solve_transposed):
+        # Determines the unit vector z orthogonal to the range of the least-squares system [A; 1*] from the square system formed by enforcing the sum of the doublet strengths using a Lagrange multiplier, given functions solving the square system and its transpose. As the square system is [A; 1*] with an added last column, the solution of its transpose for the last unit vector is orthogonal to every other column. Once the part of a right-hand side along z is removed, the right-hand side is in the range of the least-squares system, so the square system gives the least-squares solution with a zero multiplier. Also returns the solution h of the square system for z; the least-squares solution is then the solution of the square system for b less (z*b)h, which requires no additional solves for each right-hand side
+
+        e = np.zeros(self._N_panels+1)
+        e[-1] = 1.0
+        z = solve_transposed(e)
+        z /= np.linalg.norm(z)
+        return z, solve(z)
+
+
+    def _get_body_factor_keys(self, method):
+        # Returns the keys under which the LU factor and pivots of the system without the wake are cached for the given method; these include everything which affects the influence matrix
+
+        key = self._get_cache_key()
+        return self._cache.get_key(key, method, "body", "lu"), self._cache.get_key(key, method, "body", "piv")
+
+
+    def _load_body_factor(self, method):
+        # Loads the LU factorization of the system without the wake for the given method from the cache, if there is one; returns None if it is not found
+
+        if self._cache is None:
+            return None
+        lu_key, piv_key = self._get_body_factor_keys(method)
+        lu = self._cache.load(lu_key)
+        piv = self._cache.load(piv_key) if lu is not None else None
+        if piv is None:
+            return None
+        return lu, piv
+
+
+    def _store_body_factor(self, method, factor):
+        # Stores the LU factorization of the system without the wake for the given method in the cache, if there is one
+
+        if self._cache is not None:
+            lu_key, piv_key = self._get_body_factor_keys(method)
+            self._cache.store(lu_key, factor[0])
+            self._cache.store(piv_key, factor[1])
+
+
+    def _solve_with_wake_update(self, b, method, wake_influence_matrix):
+        # Solves the system using the 'direct' or 'lu' method by factoring only the system without the wake and including the wake as a low-rank (Woodbury) update; returns the solution and whether the factorization was reused
+
+        # Factor system without the wake
+        system_key = (method, "body")
+        reused = self._factors is not None and self._factors[0] == system_key
+        if not reused:
+            self._factors = None
+
+            # Like the influence matrix, the factorization depends only on the mesh, so it may be in the cache
+            factor = self._load_body_factor(method)
+
+            # Normal equations
+            if method == "direct":
+                B = self._get_system_matrix(wake_influence_matrix, np.float64, include_wake=False)
+                if factor is None:
+                    factor = sl.lu_factor(np.matmul(B.T, B))
+                    self._store_body_factor(method, factor)
+                self._factors = (system_key, B, factor, None)
+
+            # Square system formed by enforcing the sum of the doublet strengths using a Lagrange multiplier
+            else:
+                if factor is None:
+                    B_square = np.zeros((self._N_panels+1, self._N_panels+1))
+                    B_square[:,:-1] = self._get_system_matrix(wake_influence_matrix, np.float64, include_wake=False)
+                    B_square[:-1,-1] = 1.0
+                    factor = sl.lu_factor(B_square, overwrite_a=True)
+                    self._store_body_factor(method, factor)
+                self._factors = (system_key, None, factor, None)
+        B, factor, update = self._factors[1:]
+
+        # Determine the low-rank update for the current wake
+        wake_key = self._mesh.wake.get_hash()
+        if update is None or update[0] != wake_key:
+            kutta_panels, W = self._get_wake_normal_influence(wake_influence_matrix)
+            k = len(kutta_panels)
+
+            # The normal matrix with the wake is (B*)B+UCU*, where U=[S P], C=[[W*W I] [I 0]], S selects the Kutta panel columns, and P=(B*)W
+            if method == "direct":
+                U = np.zeros((self._N_panels, 2*k))
+                U[kutta_panels,np.arange(k)] = 1.0
+                U[:,k:] = np.matmul(B[:-1].T, W)
+                C_inv = np.zeros((2*k, 2*k))
+                C_inv[:k,k:] = np.identity(k)
+                C_inv[k:,:k] = np.identity(k)
+                C_inv[k:,k:] = -np.matmul(W.T, W)
+                Z = sl.lu_solve(factor, U)
+                capacitance = sl.lu_factor(C_inv+np.matmul(U.T, Z)) if k > 0 else None
+
+            # The square system with the wake is the square system without it plus [W 0]S*
+            else:
+                U = np.zeros((self._N_panels+1, k))
+                U[:-1] = W
+                Z = sl.lu_solve(factor, U)
+                capacitance = sl.lu_factor(np.identity(k)+Z[kutta_panels]) if k > 0 else None
+
+            update = (wake_key, kutta_panels, W, U, Z, capacitance, None)
+            self._factors = self._factors[:3]+(update,)
+        wake_key, kutta_panels, W, U, Z, capacitance, projection = update
+
+        # Solve normal equations
+        if method == "direct":
+
+            def solve_normal(r):
+                # Solves the normal equations with the wake for the given right-hand side of the least-squares system
+                rhs = np.matmul(B.T, r)
+                rhs[kutta_panels] += np.matmul(W.T, r[:-1])
+                y = sl.lu_solve(factor, rhs)
+                if capacitance is not None:
+                    y -= np.matmul(Z, sl.lu_solve(capacitance, np.matmul(U.T, y)))
+                return y
+
+            # The update amplifies rounding error in the normal equations, so the solution is refined once using the residual of the full system
+            x = solve_normal(b)
+            if capacitance is not None:
+                r = b-np.matmul(B, x)
+                r[:-1] -= np.matmul(W, x[kutta_panels])
+                x += solve_normal(r)
+            return x, reused
+
+        def solve_square(r):
+            # Solves the square system with the wake
+            y = sl.lu_solve(factor, r)
+            if capacitance is not None:
+                y -= np.matmul(Z, sl.lu_solve(capacitance, y[kutta_panels]))
+            return y
+
+        def solve_square_transposed(r):
+            # Solves the transpose of the square system with the wake, which is the transpose without it plus S[W* 0]
+            y = sl.lu_solve(factor, r, trans=1)
+            if capacitance is not None:
+                s = np.zeros(self._N_panels+1)
+                s[kutta_panels] = sl.lu_solve(capacitance, np.matmul(U.T, y), trans=1)
+                y -= sl.lu_solve(factor, s, trans=1)
+            return y
+
+        # Get projection onto the range of the least-squares system for the current wake
+        if projection is None:
+            projection = self._get_range_projection(solve_square, solve_square_transposed)
+            self._factors = self._factors[:3]+(update[:-1]+(projection,),)
+        z, h = projection
+
+        return (solve_square(b)-np.inner(z, b)*h)[:-1], reused
+
+
+    def _get_surface_velocities(self, v_free, mu, wake_influence_matrix, prog=None):
+        # Determines the velocity at each control point given the freestream velocity there and the doublet strengths; if the wake influence matrix is not given, the wake influence is calculated block by block
+
+        # Determine velocities at each control point induced by panels
+        if self._low_memory:
+            v = v_free+self._get_velocity_from_panels(self._mesh.cp, mu)
+        else:
+            v = np.copy(v_free)
+            for block in self._get_point_blocks(self._N_panels):
+                v[block] += np.einsum('ijk,j', self._panel_influence_matrix[block], mu)
+        if prog is not None: prog.display()
+
+        # Determine wake induced velocities
+        if wake_influence_matrix is None:
+            v += self._get_velocity_from_wake(self._mesh.cp, mu)
+        else:
+            kutta_panels, inf = wake_influence_matrix
+            v += np.einsum('ijk,j', inf, mu[kutta_panels])
+        if prog is not None: prog.display()
+
+        # Include doublet sheet principal value in the velocity
+        v += -0.5*self._mesh.get_gradient(mu)
+        if prog is not None: prog.display()
+
+        return v
+
+
+    def _solve_out_of_core(self, b):
+        # Solves the least-squares system for the given right-hand side through the normal equations with all matrices stored in the scratch directory; only a few tiles are held in memory at once. The system matrix and the Cholesky factor of the normal equations are kept in the scratch directory and reused if the system has not changed. Returns the solution and whether the factor was reused.
+
+        system_key = ("direct", self._mesh.wake.get_hash())
+        A_filename = os.path.join(self._scratch.name, "system_matrix.dat")
+        C_filename = os.path.join(self._scratch.name, "normal_matrix.dat")
+
+        # Reuse factor
+        if self._factors is not None and self._factors[0] == system_key:
+            A = np.memmap(A_filename, dtype=np.float64, mode='r', shape=(self._N_panels, self._N_panels))
+            Atb = np.zeros(self._N_panels)
+            for I in get_blocks(self._N_panels, self._N_tile):
+                Atb += np.matmul(np.array(A[I]).T, b[I])
+            del A
+            return cholesky_solve(np.memmap(C_filename, dtype=np.float64, mode='r', shape=(self._N_panels, self._N_panels)), Atb, self._N_tile), True
+
+        # Assemble system matrix from the panel and wake normal influences
+        self._factors = None
+        A = np.memmap(A_filename, dtype=np.float64, mode='w+', shape=(self._N_panels, self._N_panels))
+        for block in self._get_point_blocks(self._N_panels):
+            kutta_panels, inf = self._get_wake_influences(self._mesh.cp[block])
+            A_block = np.array(self._panel_normal_influence_matrix[block])
+            A_block[:,kutta_panels] += np.einsum('ijk,ik->ij', inf, self._mesh.n[block])
+            A[block] = A_block
+
+        # Form normal equations
+        C = np.memmap(C_filename, dtype=np.float64, mode='w+', shape=(self._N_panels, self._N_panels))
+        Atb = normal_equations(A, b, C, self._N_tile, verbose=self._verbose)
+        A.flush()
+        del A
+
+        # Add the row of ones which sets the sum of the doublet strengths to zero
+        for J in get_blocks(self._N_panels, self._N_tile):
+            C[J.start:,J] += 1.0
+
+        # Solve
+        cholesky(C, self._N_tile, verbose=self._verbose)
+        C.flush()
+        self._factors = (system_key,)
+        return cholesky_solve(C, Atb, self._N_tile), False
+
+
+    def _get_dense_normal_operator(self):
+        # Returns functions applying the stored normal influence matrix of the panels and its transpose to a vector, along with the sparse part of the matrix giving the influence of each panel and the panels touching it on its control point
+
+        # Get normal influence matrix
+        if self._low_memory:
+            inf_mat = self._panel_normal_influence_matrix
+        else:
+            inf_mat = np.einsum('ijk,ik->ij', self._panel_influence_matrix, self._mesh.n.astype(self._dtype))
+
+        # Apply by blocks of rows so single-precision storage is only upcast a block at a time
+        blocks = get_blocks(self._N_panels, max(1, 2**22//self._N_panels))
+        def apply(mu):
+            v = np.zeros(self._N_panels)
+            for I in blocks:
+                v[I] = np.matmul(inf_mat[I], mu)
+            return v
+
+        def apply_transposed(v):
+            mu = np.zeros(self._N_panels)
+            for I in blocks:
+                mu += np.matmul(inf_mat[I].T, v[I])
+            return mu
+
+        # Get near-field part from the neighbors of each panel
+        rows = []
+        cols = []
+        for i, panel in enumerate(self._mesh.panels):
+            neighbors = [i]+panel.touching_panels
+            rows += [i]*len(neighbors)
+            cols += neighbors
+        near = sp.csr_matrix((inf_mat[rows,cols].astype(np.float64), (rows, cols)), shape=(self._N_panels, self._N_panels))
+
+        return apply, apply_transposed, near
+
+
+    def _solve_pivoted_qr(self, A, b, tolerance):
+        # Solves the least-squares system using a QR decomposition with column pivoting, which reveals the numerical rank of the system at a fraction of the cost of the singular value decomposition. Columns whose diagonal entry of R is less than the tolerance relative to the first are treated as dependent and given zero doublet strength. Returns the solution, the rank, and an estimate of the condition number (in the 1-norm) of the independent part of the system
+
+        # Decompose
+        Q, R, P = sl.qr(A, mode='economic', pivoting=True, overwrite_a=True)
+
+        # Determine rank
+        d = np.abs(np.diag(R))
+        if tolerance is None:
+            tolerance = np.finfo(np.float64).eps*max(A.shape)
+        rank = max(1, np.sum(d > tolerance*d[0]))
+
+        # Solve independent part
+        mu = np.zeros(self._N_panels)
+        mu[P[:rank]] = sl.solve_triangular(R[:rank,:rank], np.matmul(Q[:,:rank].T, b))
+
+        # Estimate condition number
+        rcond, info = lapack.dtrcon(R[:rank,:rank])
+        return mu, rank, 1.0/rcond if rcond > 0.0 else np.inf
+
+
+    def _check_condition(self, rank, condition_number, max_condition_number):
+        # Warns if the system is rank deficient or its condition number is too large
+
+        if rank < self._N_panels or condition_number > max_condition_number:
+            warnings.warn("The panel equations are ill-conditioned (rank {0} of {1}, estimated condition number {2:e}). Check that the panel normals of the mesh are consistent and that no panels are degenerate or duplicated.".format(rank, self._N_panels, condition_number))
+
+
+    def _solve_matrix_free(self, tolerance, max_iterations, wake_influence_matrix=None, mu_guess=None):
+        # Solves the square system with GMRES, preconditioned by an ILU of the near-field influences (or the H-LU), after projecting the right-hand side; returns the solution and residual histories
+
+        # Get normal influence of the wake; only the columns of panels bordering Kutta edges are nonzero
+        kutta_panels, wake_normal_influence = self._get_wake_normal_influence(wake_influence_matrix)
+
+        # Get panel influence operator and its near-field part
+        if self._matrix_type == "dense":
+            get_normal_influence, get_transposed_normal_influence, near_matrix = self._get_dense_normal_operator()
+        else:
+            get_normal_influence = self._influence_operator.get_normal_influence
+            get_transposed_normal_influence = self._influence_operator.get_transposed_normal_influence
+            near_matrix = self._influence_operator.get_near_field_matrix()
+
+        # Set up operator
+        matvec, rmatvec = self._get_square_operators(kutta_panels, wake_normal_influence, get_normal_influence, get_transposed_normal_influence)
+        A = spl.LinearOperator((self._N_panels+1, self._N_panels+1), matvec=matvec)
+        b = np.zeros(self._N_panels+1)
+        b[:-1] = self._b
+
+        # Set up preconditioner; for the 'hmatrix' matrix type, this is the H-LU factorization of the whole square system
+        if self._matrix_type == "hmatrix":
+            solve_square, solve_square_transposed = self._get_hierarchical_lu_solvers(kutta_panels, wake_normal_influence)[:2]
+        else:
+            W = sp.csr_matrix((wake_normal_influence.flatten(), (np.repeat(np.arange(self._N_panels), len(kutta_panels)), np.tile(kutta_panels, self._N_panels))), shape=(self._N_panels, self._N_panels))
+            ones = np.ones((self._N_panels, 1))
+            A_near = sp.bmat([[near_matrix+W, ones], [ones.T, None]], format='csc')
+            ilu = spl.spilu(A_near, drop_tol=1e-3, fill_factor=5)
+            solve_square = ilu.solve
+            solve_square_transposed = lambda x: ilu.solve(x, trans='T')
+        M = spl.LinearOperator((self._N_panels+1, self._N_panels+1), matvec=solve_square)
+
+        # Set up transposed operator
+        A_T = spl.LinearOperator((self._N_panels+1, self._N_panels+1), matvec=rmatvec)
+        M_T = spl.LinearOperator((self._N_panels+1, self._N_panels+1), matvec=solve_square_transposed)
+
+        # Project the right-hand side onto the range of the least-squares system by solving the transposed system for the last unit vector, starting from the last projection vector found
+        e = np.zeros(self._N_panels+1)
+        e[-1] = 1.0
+        projection_history = []
+        z, info = _gmres(A_T, e, tolerance, x0=self._range_vector, restart=min(self._N_panels+1, 200), maxiter=max_iterations, M=M_T, callback=projection_history.append, callback_type='pr_norm')
+        if info > 0:
+            warnings.warn("GMRES did not converge to a relative residual of {0} in {1} iterations when projecting the right-hand side.".format(tolerance, len(projection_history)))
+        self._range_vector = z
+        b -= np.inner(z, b)/np.inner(z, z)*z
+
+        # Get initial guess; the Lagrange multiplier is zero once the right-hand side is projected
+        if mu_guess is not None:
+            x0 = np.zeros(self._N_panels+1)
+            x0[:-1] = mu_guess
+        else:
+            x0 = None
+
+        # Solve
+        history = []
+        x, info = _gmres(A, b, tolerance, x0=x0, restart=min(self._N_panels+1, 200), maxiter=max_iterations, M=M, callback=history.append, callback_type='pr_norm')
+        if info > 0:
+            warnings.warn("GMRES did not converge to a relative residual of {0} in {1} iterations.".format(tolerance, len(history)))
+
+        return x[:-1], history, np.linalg.norm(b-matvec(x))/np.linalg.norm(b), projection_history
+
+
+    def _get_square_operators(self, kutta_panels, wake_normal_influence, get_normal_influence, get_transposed_normal_influence):
+        # Returns functions applying the square system (formed by enforcing the sum of the doublet strengths using a Lagrange multiplier) and its transpose, given functions applying the panel normal influences and their transpose
+
+        def matvec(x):
+            y = np.zeros(self._N_panels+1)
+            y[:-1] = get_normal_influence(x[:-1])+np.matmul(wake_normal_influence, x[kutta_panels])+x[-1]
+            y[-1] = np.sum(x[:-1])
+            return y
+
+        def rmatvec(x):
+            y = np.zeros(self._N_panels+1)
+            y[:-1] = get_transposed_normal_influence(x[:-1])+x[-1]
+            y[kutta_panels] += np.matmul(wake_normal_influence.T, x[:-1])
+            y[-1] = np.sum(x[:-1])
+            return y
+
+        return matvec, rmatvec
+
+
+    def _get_hierarchical_lu_solvers(self, kutta_panels, wake_normal_influence):
+        # Returns functions solving the square system and its transpose using the H-LU factorization of A+c11* (A is singular), with the wake as a low-rank update, and the range projection vector if found
+
+        # Factor the panel normal influence matrix; the shift is chosen to be comparable to its diagonal
+        if self._hierarchical_lu is None:
+            c = np.average(np.abs(self._influence_operator.get_near_field_matrix().diagonal()))/self._N_panels
+            self._hierarchical_lu = (self._influence_operator.get_lu(c), c)
+        hlu, c = self._hierarchical_lu
+
+        # Reuse the update for the current wake
+        wake_key = ("hmatrix", self._mesh.wake.get_hash())
+        if self._factors is not None and self._factors[0] == wake_key:
+            return self._factors[1:]
+
+        # Determine the low-rank update for the wake; B' is B plus the wake columns
+        k = len(kutta_panels)
+        Z = hlu.solve(wake_normal_influence)
+        capacitance = sl.lu_factor(np.identity(k)+Z[kutta_panels]) if k > 0 else None
+
+        def solve_updated(r):
+            # Solves B'x=r
+            y = hlu.solve(r)
+            if capacitance is not None:
+                y -= np.matmul(Z, sl.lu_solve(capacitance, y[kutta_panels]))
+            return y
+
+        def solve_updated_transposed(r):
+            # Solves (B'*)x=r
+            y = hlu.solve(r, trans=True)
+            if capacitance is not None:
+                s = np.zeros(self._N_panels)
+                s[kutta_panels] = sl.lu_solve(capacitance, np.matmul(wake_normal_influence.T, y), trans=1)
+                y -= hlu.solve(s, trans=True)
+            return y
+
+        # Solve for the vector of ones
+        ones = np.ones(self._N_panels)
+        g = solve_updated(ones)
+        g_T = solve_updated_transposed(ones)
+
+        def solve_square(r, solve=solve_updated, g=g):
+            # Solves the square system, or its transpose given the corresponding functions
+            x = np.zeros(self._N_panels+1)
+            x[:-1] = solve(r[:-1])
+            m = (r[-1]-np.sum(x[:-1]))/np.sum(g)
+            x[:-1] += m*g
+            x[-1] = c*r[-1]-m
+            return x
+
+        def solve_square_transposed(r):
+            # Solves the transpose of the square system
+            return solve_square(r, solve=solve_updated_transposed, g=g_T)
+
+        self._factors = (wake_key, solve_square, solve_square_transposed, None)
+        return self._factors[1:]
+
+
+    def _solve_hierarchical_lu(self, b, wake_influence_matrix, tolerance, max_iterations):
+        # Solves the system for the given right-hand side (including the final zero for the sum of the doublet strengths) using the H-LU factorization for the 'hmatrix' matrix type, refined against the hierarchical matrix. Returns the solution and whether the factorization was reused.
+
+        reused = self._hierarchical_lu is not None
+        kutta_panels, wake_normal_influence = self._get_wake_normal_influence(wake_influence_matrix)
+        solve_square, solve_square_transposed, z = self._get_hierarchical_lu_solvers(kutta_panels, wake_normal_influence)
+        matvec, rmatvec = self._get_square_operators(kutta_panels, wake_normal_influence, self._influence_operator.get_normal_influence, self._influence_operator.get_transposed_normal_influence)
+
+        # Get the vector orthogonal to the range of the least-squares system for the current wake (see _get_range_projection())
+        if z is None:
+            e = np.zeros(self._N_panels+1)
+            e[-1] = 1.0
+            z = self._refine_square_solution(solve_square_transposed, rmatvec, e, tolerance, max_iterations)
+            z /= np.linalg.norm(z)
+            self._factors = self._factors[:3]+(z,)
+
+        return self._refine_square_solution(solve_square, matvec, b-np.inner(z, b)*z, tolerance, max_iterations)[:-1], reused
+
+
+    def _refine_square_solution(self, solve, matvec, b, tolerance, max_iterations):
+        # Solves a system given a function applying it and an approximate solver, refining the approximate solution using GMRES preconditioned by the approximate solver until the residual relative to b is below the tolerance
+
+        N = len(b)
+        A = spl.LinearOperator((N, N), matvec=matvec)
+        M = spl.LinearOperator((N, N), matvec=solve)
+        history = []
+        x, info = _gmres(A, b, tolerance, x0=solve(b), restart=min(N, 200), maxiter=max_iterations, M=M, callback=history.append, callback_type='pr_norm')
+        if info > 0:
+            warnings.warn("Refinement of the H-LU solution did not converge to a relative residual of {0} in {1} iterations.".format(tolerance, len(history)))
+        return x
+
+
+    def _get_condition_vector(self):
+        # Returns the freestream velocity and angular rate as a single vector; the angular rate is scaled by the size of the mesh so both parts are velocities
+
+        L = np.max(vec_norm(self._mesh.r_CG))
+        return np.concatenate((self._v_inf, self._omega*L))
+
+
+    def _get_nearest_solution(self):
+        # Returns the doublet strengths for the previously solved condition nearest the current one, or None if no condition has been solved; as the doublet strengths are linear in the condition (for a given wake), they are scaled by the projection of the current condition onto the previous one
+
+        if len(self._history) == 0:
+            return None
+        condition = self._get_condition_vector()
+        distances = [np.linalg.norm(condition-c) for c, mu in self._history]
+        c, mu = self._history[np.argmin(distances)]
+        return np.inner(condition, c)/np.inner(c, c)*mu
+
+
+    def move_vertices(self, vertex_indices, positions):
+        """Moves the given vertices of the mesh and updates only the affected rows and columns of the panel influence matrix. Only available for the 'dense' matrix type; set_condition() must be called again before solving.
+
+        Parameters
+        ----------
+        vertex_indices : ndarray
+            Indices of the vertices to move, as in Mesh.vertices.
+
+        positions : ndarray
+            New position of each vertex.
+
+        Returns
+        -------
+        ndarray
+            Indices of the panels which moved.
+        """
+
+        if self._matrix_type != "dense":
+            raise IOError("move_vertices() may only be used with the 'dense' matrix type.")
+
+        # Update mesh
+        panels = self._mesh.move_vertices(vertex_indices, positions)
+        self._solved = False
+        if len(panels) == 0:
+            return panels
+        self._factors = None
+        self._basis_mu = None
+        self._basis_v = None
+        self._history = []
+        self._range_vector = None
+
+        if self._verbose:
+            print()
+            prog = OneLineProgress(2, msg="Updating panel influence matrix for {0} moved panels".format(len(panels)))
+
+        # Get matrices to update
+        inf_mat = self._panel_normal_influence_matrix if self._low_memory else self._panel_influence_matrix
+        double_inf_mat = self._double_normal_influence_matrix
+
+        def store(rows, cols, inf):
+            # Stores the given block of influences (only normal components if low-memory) in the influence matrix and its double-precision copy, if any
+            inf_mat[rows,cols] = inf
+            if double_inf_mat is not None:
+                double_inf_mat[rows,cols] = inf if self._low_memory else np.einsum('ijk,ik->ij', inf, self._mesh.n[rows])
+
+        # Update rows for the control points of the moved panels
+        for block in self._get_point_blocks(len(panels)):
+            rows = panels[block]
+            store(rows, slice(None), self._get_block_influences(self._mesh.cp[rows], normals=self._mesh.n[rows] if self._low_memory else None))
+        if self._verbose:
+            prog.display()
+
+        # Update columns for the moved panels
+        N_block = max(1, 2**17//len(panels))
+        for block in get_blocks(self._N_panels, N_block):
+            normals = self._mesh.n[block] if self._low_memory else None
+            if self._far_field_ratio is not None:
+                store(block, panels, self._mesh.get_far_field_ring_influences(self._mesh.cp[block], self._far_field_ratio, normals=normals, panels=panels)[0])
+            elif self._low_memory:
+                store(block, panels, np.einsum('ijk,ik->ij', self._mesh.get_ring_influences(self._mesh.cp[block], panels=panels), normals))
+            else:
+                store(block, panels, self._mesh.get_ring_influences(self._mesh.cp[block], panels=panels))
+        if self._verbose:
+            prog.display()
+
+        # Make sure results are written to disk
+        for matrix in [inf_mat, double_inf_mat]:
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+
+        # The cached matrices for the original geometry are still valid, so the updated matrices are cached under the new geometry
+        if self._cache is not None:
+            self._cache.store(self._get_cache_key(), inf_mat)
+            if double_inf_mat is not None:
+                self._cache.store(self._get_cache_key(True, np.float64), double_inf_mat)
+
+        return panels
+
 
     def set_condition(self, **kwargs):
         """Sets the atmospheric conditions for the computation.
@@ -101,6 +1177,10 @@ class VortexRingSolver(Solver):
         # Get solid body rotation
         self._omega = np.array(kwargs.get("angular_rate", [0.0, 0.0, 0.0]))
 
+        # The mirrored half sees the mirrored flow, so the flow must itself be symmetric
+        if self._mesh.symmetric and (self._v_inf[1] != 0.0 or self._omega[0] != 0.0 or self._omega[2] != 0.0):
+            raise IOError("A symmetric mesh may not be used with sideslip, roll rate, or yaw rate.")
+
         # Finish Kutta edge search on mesh
         self._mesh.finalize_kutta_edge_search(self._u_inf)
 
@@ -114,11 +1194,14 @@ class VortexRingSolver(Solver):
         Parameters
         ----------
         method : str, optional
-            Method for computing the least-squares solution to the system of equations. May be 'direct', 'gauss-seidel', or 'svd'. 'direct' solves the equation (A*)Ax=(A*)b using a standard linear algebra solver. 'gauss-seidel' solves the same equation using the Gauss-Seidel iterative method. 'svd' solves the equation Ax=b in a least-squares sense using the singular value decomposition. 'direct' is much faster but may be susceptible to numerical error due to a poorly conditioned system. 'svd' is more reliable at producing a stable solution. Defaults to 'direct'.
+            Method for computing the least-squares solution to the system of equations. May be 'direct', 'lu', 'gauss-seidel', 'svd', 'qr', 'gmres', or 'superposition'. 'direct' solves (A*)Ax=(A*)b by LU decomposition; 'lu' solves the square system with a Lagrange multiplier; 'gauss-seidel' iterates on (A*)Ax=(A*)b but does not converge for typical closed meshes; 'svd' and 'qr' solve Ax=b by least squares; 'gmres' iterates on the square system; 'superposition' combines the solutions from compute_basis_solutions(). Defaults to 'direct', or 'gmres' for the 'fmm' and 'hmatrix' matrix types.
 
         wake_iterations : int, optional
             How many times the shape of the wake should be updated and the flow resolved. Only used if the mesh has been set with a "full_streamline" or "relaxed" wake. For "marching_streamline" wakes, the number of iterations is equal to the number of filament segments in the wake and this setting is ignored. Defaults to 2.
 
+        wake_tolerance : float, optional
+            Stops the wake iterations once the largest relative filament vertex displacement and the relative change in force from an update are both below this value, making "wake_iterations" a maximum. The history is given by get_wake_convergence_history(). Defaults to None.
+
         export_wake_series : bool, optional
             Whether to export a vtk of the solver results after each wake iteration. Only used if the mesh has been set with an iterative wake. Defaults to False.
 
@@ -126,10 +1209,40 @@ class VortexRingSolver(Solver):
             Gives a common file name and location for the wake series export files. Each file will be stored as "<wake_series_title>_<iteration_number>.vtk". May include a file path. Required if "export_wake_series" is True.
 
         gs_max_iterations : int, optional
-            Maximum iterations for the 'gauss-seidel' method. Defaults to 10000.
+            Maximum iterations for the 'gauss-seidel' method. Each iteration is a forward and a backward sweep. Defaults to 10000.
 
         gs_convergence : float, optional
-            Convergence threshold for the 'gauss-seidel' method. Defaults to 1e-10.
+            Convergence threshold on the relative residual of the normal equations for the 'gauss-seidel' method. A warning is issued if it is not reached. Defaults to 1e-10.
+
+        gs_relaxation : float, optional
+            Relaxation factor for the 'gauss-seidel' method. Values between 1 and 2 give symmetric successive over-relaxation, which may converge faster. Defaults to 1.0.
+
+        gs_block_size : int, optional
+            Number of rows updated together by the 'gauss-seidel' method. Defaults to 256.
+
+        gs_initial_guess : ndarray, optional
+            Initial guess of the doublet strengths for the 'gauss-seidel' method. Defaults to the solution of the previous wake iteration or, for the first iteration, the solution for the nearest previously solved condition (see "history_size"). If no condition has been solved, defaults to zero.
+
+        refinement_max_iterations : int, optional
+            Maximum iterations for refining the solution of the 'direct' method when the solver precision is 'mixed', or of the 'lu' method for the 'hmatrix' matrix type. Defaults to 50.
+
+        gmres_max_iterations : int, optional
+            Maximum number of restart cycles for the 'gmres' method. Defaults to 10.
+
+        gmres_convergence : float, optional
+            Convergence threshold on the relative residual for the 'gmres' method. Defaults to 1e-10.
+
+        refinement_convergence : float, optional
+            Convergence threshold on the relative residual for refining the solution of the 'direct' method when the solver precision is 'mixed' (of the normal equations), or of the 'lu' method for the 'hmatrix' matrix type. A warning is issued if it is not reached. Defaults to 1e-12.
+
+        rank_tolerance : float, optional
+            Relative tolerance for determining the rank of the system with the 'qr' method. Columns whose diagonal entry in the triangular factor is smaller than this fraction of the largest are considered dependent. Defaults to machine precision times the number of rows.
+
+        max_condition_number : float, optional
+            Condition number of the system above which the 'svd' and 'qr' methods issue a warning. For 'qr', the condition number is estimated from the triangular factor. Defaults to 1e12.
+
+        low_rank_wake : bool, optional
+            If True, the 'direct' and 'lu' methods factor only the system without the wake. As the wake influences only the panels bordering Kutta edges, it is included as a low-rank update using the Sherman-Morrison-Woodbury identity. The factorization is then reused whenever only the wake changes (e.g. on each wake iteration, or for a wake which follows the freestream), so later solves cost little more than those with a fixed wake. Not used when the solver precision is 'mixed'. Defaults to True.
 
         verbose : bool, optional
 
@@ -146,13 +1259,23 @@ class VortexRingSolver(Solver):
         self._verbose = kwargs.get("verbose", False)
 
         # Get kwargs
-        method = kwargs.get("method", "direct")
-        dont_iterate_on_wake = not (isinstance(self._mesh.wake, VelocityRelaxedWake) or isinstance(self._mesh.wake, FullStreamlineWake) or isinstance(self._mesh.wake, MarchingStreamlineWake))
+        method = kwargs.get("method", "direct" if self._matrix_type == "dense" else "gmres")
+        if method != "gmres" and self._matrix_type == "fmm":
+            raise IOError("The 'gmres' method must be used with the 'fmm' matrix type.")
+        if method not in ["gmres", "lu"] and self._matrix_type == "hmatrix":
+            raise IOError("The 'gmres' or 'lu' method must be used with the 'hmatrix' matrix type.")
+        mixed = method == "direct" and self._dtype == np.float32
+        if method == "gmres" and self._dtype == np.float32:
+            raise IOError("The 'gmres' method may not be used when the solver precision is 'mixed'.")
+        if method == "superposition" and self._basis_mu is None:
+            raise IOError("compute_basis_solutions() must be called before using the 'superposition' method.")
+        dont_iterate_on_wake = method == "superposition" or not (isinstance(self._mesh.wake, VelocityRelaxedWake) or isinstance(self._mesh.wake, FullStreamlineWake) or isinstance(self._mesh.wake, MarchingStreamlineWake))
 
         # Non-iterative wake options
         if dont_iterate_on_wake:
             wake_iterations = 0
             export_wake_series = False
+            check_wake_convergence = False
 
         # Iterative wake options
         else:
@@ -162,6 +1285,10 @@ class VortexRingSolver(Solver):
             if isinstance(self._mesh.wake, MarchingStreamlineWake):
                 wake_iterations = self._mesh.wake.N_segments_final
 
+            # Convergence of the wake shape; the marching wake grows by a segment on each iteration, so it is never converged before the last
+            wake_tolerance = kwargs.get("wake_tolerance", None)
+            check_wake_convergence = not isinstance(self._mesh.wake, MarchingStreamlineWake)
+
             # Wake series export
             export_wake_series = kwargs.get("export_wake_series", False)
             if export_wake_series:
@@ -169,7 +1296,14 @@ class VortexRingSolver(Solver):
                 if wake_series_title is None:
                     raise IOError("'wake_series_title' is required if 'export_wake_series' is true.")
 
+        # Initial guess for the iterative methods; the solution for the nearest previously solved condition unless one is given
+        mu_guess = kwargs.get("gs_initial_guess", None) if method == "gauss-seidel" else None
+        if mu_guess is None:
+            mu_guess = self._get_nearest_solution()
+
         # Iterate on wake
+        self._wake_convergence_history = []
+        wake_displacement = None
         for i in range(wake_iterations+1):
             if self._verbose and not dont_iterate_on_wake:
                 print("\nWake Iteration {0}/{1}".format(i, wake_iterations))
@@ -179,39 +1313,64 @@ class VortexRingSolver(Solver):
                 start_time = time.time()
                 print("    Solving singularity strengths (this may take a while)...", flush=True, end='')
 
-            # Get wake influence matrix
-            wake_influence_matrix = self._mesh.wake.get_influence_matrix(points=self._mesh.cp, u_inf=self._u_inf, omega=self._omega, N_panels=self._N_panels)
-
-            # Specify A matrix
-            A = np.zeros((self._N_panels+1,self._N_panels))
-            A[:-1] = np.einsum('ijk,ik->ij', self._panel_influence_matrix, self._mesh.n)
-            if not isinstance(wake_influence_matrix, float):
-                A[:-1] += np.einsum('ijk,ik->ij', wake_influence_matrix, self._mesh.n)
-            A[-1] = 1.0
-
-            # Specify b vector
-            b = np.zeros(self._N_panels+1)
-            b[:-1] = self._b
-
-            # Direct method
-            if method=='direct':
-                b = np.matmul(A.T, b[:,np.newaxis])
-                A = np.matmul(A.T, A)
-                self._mu = np.linalg.solve(A, b).flatten()
-
-            # Singular value decomposition
-            elif method == "svd":
-                self._mu, res, rank, s_a = np.linalg.lstsq(A, b, rcond=None)
-
-            # Gauss-Seidel
-            elif method == "gauss-seidel":
-                b = np.matmul(A.T, b[:,np.newaxis])
-                A = np.matmul(A.T, A)
-                self._mu = gauss_seidel(A, b, **kwargs).flatten()
-
-            # Clear up memory
-            del A
-            del b
+            # Combine basis solutions; the freestream velocity and angular rate components are the weights
+            if method == "superposition":
+                weights = np.concatenate((self._v_inf, self._omega))
+                self._mu = np.matmul(weights, self._basis_mu)
+
+            # Solve using matrices stored on disk
+            elif self._scratch is not None:
+                if method != "direct":
+                    raise IOError("Only the 'direct' method may be used when a scratch directory is given.")
+                self._mu, reused_factors = self._solve_out_of_core(self._b)
+
+            # Solve iteratively without forming the normal equations
+            elif method == "gmres":
+                if not self._low_memory:
+                    wake_influence_matrix = self._get_wake_influences(self._mesh.cp)
+                self._mu, gmres_history, gmres_residual, projection_history = self._solve_matrix_free(kwargs.get("gmres_convergence", 1e-10), kwargs.get("gmres_max_iterations", 10), wake_influence_matrix if not self._low_memory else None, mu_guess)
+
+            else:
+
+                # Get wake influence matrix; this is needed for the velocities even if the system matrix is not
+                if not self._low_memory:
+                    wake_influence_matrix = self._get_wake_influences(self._mesh.cp)
+
+                # Specify b vector
+                b = np.zeros(self._N_panels+1)
+                b[:-1] = self._b
+
+                # H-LU factorization of the hierarchical matrix
+                if self._matrix_type == "hmatrix":
+                    self._mu, reused_factors = self._solve_hierarchical_lu(b, wake_influence_matrix if not self._low_memory else None, kwargs.get("refinement_convergence", 1e-12), kwargs.get("refinement_max_iterations", 50))
+
+                # Direct methods, reusing the factorization of the system matrix if possible
+                elif method in ["direct", "lu"]:
+                    self._mu, reused_factors, refinement_history = self._solve_with_factors(b, method, mixed, wake_influence_matrix if not self._low_memory else None, kwargs)
+
+                else:
+                    A = self._get_system_matrix(wake_influence_matrix if not self._low_memory else None, np.float64)
+
+                    # Singular value decomposition
+                    if method == "svd":
+                        self._mu, res, rank, s_a = np.linalg.lstsq(A, b, rcond=None)
+                        condition_number = np.max(s_a)/np.min(s_a) if np.min(s_a) > 0.0 else np.inf
+                        self._check_condition(rank, condition_number, kwargs.get("max_condition_number", 1e12))
+
+                    # QR decomposition with column pivoting
+                    elif method == "qr":
+                        self._mu, rank, condition_number = self._solve_pivoted_qr(A, b, kwargs.get("rank_tolerance", None))
+                        self._check_condition(rank, condition_number, kwargs.get("max_condition_number", 1e12))
+
+                    # Gauss-Seidel
+                    elif method == "gauss-seidel":
+                        b = np.matmul(A.T, b[:,np.newaxis])
+                        A = np.matmul(A.T, A)
+                        self._mu = gauss_seidel(A, b, **dict(kwargs, gs_initial_guess=mu_guess)).flatten()
+
+                    # Clear up memory
+                    del A
+                del b
 
             # Print computation results
             if self._verbose:
@@ -227,41 +1386,101 @@ class VortexRingSolver(Solver):
                 except:
                     pass
 
+                if method in ["direct", "lu"]:
+                    print("        Reused factorization of system matrix: {0}".format(reused_factors))
+
+                if method=="gmres":
+                    print("        GMRES iterations: {0}".format(len(gmres_history)))
+                    print("        Final GMRES residual: {0}".format(gmres_history[-1] if len(gmres_history) > 0 else 0.0))
+                    print("        Relative residual of square system: {0}".format(gmres_residual))
+                    print("        GMRES iterations for projection of right-hand side: {0}".format(len(projection_history)))
+
+                if mixed:
+                    print("        Refinement residual history:")
+                    for j, res_j in enumerate(refinement_history):
+                        print("            {0:>4}: {1:e}".format(j, res_j))
+
                 if method=="svd":
                     print("        Rank of A matrix: {0}".format(rank))
                     print("        Max singular value of A: {0}".format(np.max(s_a)))
                     print("        Min singular value of A: {0}".format(np.min(s_a)))
+                    print("        Condition number of A: {0}".format(condition_number))
                     del s_a
 
+                if method=="qr":
+                    print("        Rank of A matrix: {0}".format(rank))
+                    print("        Estimated condition number of A: {0}".format(condition_number))
+
             if self._verbose:
                 print()
-                prog = OneLineProgress(4, msg="    Calculating derived quantities")
-
-            # Determine velocities at each control point induced by panels
-            self._v = self._v_inf_and_rot+np.einsum('ijk,j', self._panel_influence_matrix, self._mu)
-            if self._verbose: prog.display()
-
-            # Determine wake induced velocities
-            self._v += np.sum(wake_influence_matrix*self._mu[np.newaxis,:,np.newaxis], axis=1)
-            del wake_influence_matrix
-            if self._verbose: prog.display()
+                prog = OneLineProgress(2 if method == "superposition" else 4, msg="    Calculating derived quantities")
 
-            # Include doublet sheet principal value in the velocity
-            self._v += -0.5*self._mesh.get_gradient(self._mu)
-            if self._verbose: prog.display()
+            # Determine velocities at each control point
+            if method == "superposition":
+                self._v = np.einsum('i,ijk->jk', weights, self._basis_v)
+                if self._verbose: prog.display()
+            else:
+                self._v = self._get_surface_velocities(self._v_inf_and_rot, self._mu, wake_influence_matrix if not self._low_memory else None, prog=prog if self._verbose else None)
+                if not self._low_memory:
+                    del wake_influence_matrix
 
             # Determine coefficients of pressure
             V = vec_norm(self._v)
             self._C_P = 1.0-(V*V)/self._V_inf**2
             if self._verbose: prog.display()
 
+            # Determine forces and moments
+            self._calc_forces_and_moments()
+
             # export vtk
             if export_wake_series:
                 self.export_vtk(wake_series_title+"_{0}.vtk".format(i+1))
 
-            # Update wake
+            # Check convergence of the wake shape, given the change due to the last update
+            if wake_displacement is not None:
+                F_mag = np.linalg.norm(self._F)
+                force_change = np.linalg.norm(self._F-F_prev)/F_mag if F_mag > 0.0 else 0.0
+                self._wake_convergence_history.append([wake_displacement[0], wake_displacement[1], force_change])
+                converged = wake_tolerance is not None and wake_displacement[0] < wake_tolerance and force_change < wake_tolerance
+
+                if self._verbose:
+                    print()
+                    print("    Wake Convergence:")
+                    print("        Maximum vertex displacement: {0}".format(wake_displacement[0]))
+                    print("        RMS vertex displacement: {0}".format(wake_displacement[1]))
+                    print("        Relative change in force: {0}".format(force_change))
+                    if converged:
+                        print("        Converged after {0} wake iterations.".format(i))
+
+                if converged:
+                    break
+
+            # Update wake; the next iteration starts from this solution
             if not dont_iterate_on_wake and i < wake_iterations: # Don't update the wake if this is the last iteration
+                if check_wake_convergence:
+                    vertices_prev = self._mesh.wake.get_vertices()
+                    F_prev = np.copy(self._F)
                 self._mesh.wake.update(self.get_velocity_induced_by_body, self._mu, self._v_inf, self._omega, self._verbose)
+                mu_guess = self._mu
+
+                # Determine displacement of the filament vertices relative to the segment length
+                if check_wake_convergence:
+                    d = vec_norm(self._mesh.wake.get_vertices()-vertices_prev)/self._mesh.wake.l
+                    wake_displacement = (np.max(d), np.sqrt(np.average(d*d)))
+
+        # Store solution for use as an initial guess
+        self._history.append((self._get_condition_vector(), np.copy(self._mu)))
+        if len(self._history) > self._history_size:
+            self._history.pop(0)
+
+        # Set solved flag
+        self._solved = True
+
+        return self._F, self._M
+
+
+    def _calc_forces_and_moments(self):
+        # Determines the force and moment acting on each panel and on the whole mesh from the pressure coefficients
 
         # Determine force acting on each panel
         self._dF = -(0.5*self._rho*self._V_inf**2*self._mesh.dA*self._C_P)[:,np.newaxis]*self._mesh.n
@@ -281,12 +1500,83 @@ class VortexRingSolver(Solver):
         self._M[1] = np.sum(self._dM[:,1])
         self._M[2] = np.sum(self._dM[:,2])
 
-        # Set solved flag
-        self._solved = True
-
-        return self._F, self._M
+        # Add the mirrored half; the moment is a pseudovector, so it is reflected with the opposite sign
+        if self._mesh.symmetric:
+            self._F += mirror_xz(self._F)
+            self._M -= mirror_xz(self._M)
 
     
+    def compute_basis_solutions(self, **kwargs):
+        """Calculates the doublet strengths and surface velocities for a unit freestream velocity along, and a unit angular rate about, each axis, which solve() with the 'superposition' method combines for any condition without solving. The wake is frozen as last set, so this is exact only for a wake which does not depend on the condition. Only available for the 'dense' matrix type.
+
+        Parameters
+        ----------
+        method : str, optional
+            Method for solving the system of equations for each basis solution. May be 'direct' or 'lu' (see solve()). The factorization of the system matrix is shared by all six solutions. Defaults to 'direct'.
+
+        low_rank_wake : bool, optional
+            Whether the wake is included as a low-rank update to the factorization of the system without it (see solve()). Defaults to True.
+
+        verbose : bool, optional
+        """
+
+        # Get kwargs
+        method = kwargs.get("method", "direct")
+        verbose = kwargs.get("verbose", False)
+        if self._matrix_type != "dense":
+            raise IOError("compute_basis_solutions() may only be used with the 'dense' matrix type.")
+        if method not in ["direct", "lu"]:
+            raise IOError("{0} is not a valid method for compute_basis_solutions(). Must be 'direct' or 'lu'.".format(method))
+        if self._scratch is not None and method != "direct":
+            raise IOError("Only the 'direct' method may be used when a scratch directory is given.")
+        if not hasattr(self, "_u_inf"):
+            raise IOError("set_condition() must be called before compute_basis_solutions().")
+        mixed = method == "direct" and self._dtype == np.float32
+
+        # Determine the freestream velocity at each control point for each basis; the first three are unit freestream velocities and the last three unit angular rates
+        v_free = np.zeros((6, self._N_panels, 3))
+        for k in range(3):
+            v_free[k,:,k] = 1.0
+            v_free[k+3] = -vec_cross(np.identity(3)[k], self._mesh.cp)
+
+        if verbose:
+            print()
+            prog = OneLineProgress(6, msg="Calculating basis solutions")
+
+        # Get wake influence matrix
+        wake_influence_matrix = None if self._low_memory else self._get_wake_influences(self._mesh.cp)
+
+        # Solve for each basis
+        self._basis_mu = np.zeros((6, self._N_panels))
+        self._basis_v = np.zeros((6, self._N_panels, 3))
+        for k in range(6):
+
+            # Sideslip, roll, and yaw are not possible for a symmetric mesh
+            if not (self._mesh.symmetric and k in [1, 3, 5]):
+                b = np.zeros(self._N_panels+1)
+                b[:-1] = -vec_inner(v_free[k], self._mesh.n)
+                if self._scratch is not None:
+                    self._basis_mu[k] = self._solve_out_of_core(b[:-1])[0]
+                else:
+                    self._basis_mu[k] = self._solve_with_factors(b, method, mixed, wake_influence_matrix, kwargs)[0]
+                self._basis_v[k] = self._get_surface_velocities(v_free[k], self._basis_mu[k], wake_influence_matrix)
+
+            if verbose:
+                prog.display()
+
+
+    def get_wake_convergence_history(self):
+        """Returns the convergence history of the wake shape from the last call to solve(). Only recorded for "full_streamline" and "relaxed" wakes.
+
+        Returns
+        -------
+        ndarray
+            One row for each update of the wake shape. The columns are the maximum and RMS displacement of the filament vertices (relative to the filament segment length) and the resulting change in the total force vector (relative to its magnitude).
+        """
+
+        return np.array(self._wake_convergence_history).reshape((-1, 3))
+
+
     def get_velocity_off_body(self, points):
         """Determines the velocity at the given points off the body. Considers the influence of both the body, wake, and freestream. Should not be used for points close to the body or wake.
 
@@ -301,17 +1591,7 @@ class VortexRingSolver(Solver):
             Array of velocities at each point.
         """
 
-        # Assemble influence matrix
-        inf_mat = np.zeros((points.shape[0], self._N_panels, 3))
-
-        # Panels
-        for i, panel in enumerate(self._mesh.panels):
-            inf_mat[:,i] = panel.get_ring_influence(points)
-
-        # Wake
-        inf_mat += self._mesh.wake.get_influence_matrix(points=points, u_inf=self._u_inf, omega=self._omega, N_panels=self._N_panels)
-
-        return np.einsum('ijk,j', inf_mat, self._mu)+self._v_inf[np.newaxis,:]
+        return self._get_velocity_from_panels(points, self._mu)+self._get_velocity_from_wake(points, self._mu)+self._v_inf[np.newaxis,:]
 
 
     def get_velocity_induced_by_body(self, points):
@@ -328,14 +1608,7 @@ class VortexRingSolver(Solver):
             Array of velocities at each point.
         """
 
-        # Assemble influence matrix
-        inf_mat = np.zeros((points.shape[0], self._N_panels, 3))
-
-        # Panels
-        for i, panel in enumerate(self._mesh.panels):
-            inf_mat[:,i] = panel.get_ring_influence(points)
-
-        return np.einsum('ijk,j', inf_mat, self._mu)
+        return self._get_velocity_from_panels(points, self._mu)
 
 
     def _export_potential(self, filename, **kwargs):
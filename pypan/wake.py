@@ -1,9 +1,11 @@
 import copy
+import hashlib
 
 import numpy as np
+import scipy.sparse as sp
 
 from abc import abstractmethod
-from pypan.pp_math import vec_cross, vec_inner, vec_norm, norm, cross
+from pypan.pp_math import vec_cross, vec_inner, vec_norm, norm, cross, mirror_xz
 from pypan.helpers import OneLineProgress
 
 class Wake:
@@ -13,6 +15,9 @@ class Wake:
     ----------
     kutta_edges : list of KuttaEdge
         List of Kutta edges which define this wake.
+
+    symmetric : bool, optional
+        Whether the wake belongs to a half model which is mirrored about the xz plane (see Mesh). If True, the mirror image of the wake is included when updating the wake shape, and filaments on the plane of symmetry are given no strength, as they are cancelled by their images. Defaults to False.
     """
 
     def __init__(self, **kwargs):
@@ -20,62 +25,117 @@ class Wake:
         # Store Kutta edges
         self._kutta_edges = kwargs["kutta_edges"]
         self._N_edges = len(self._kutta_edges)
+        self._symmetric = kwargs.get("symmetric", False)
         self.filaments = []
         self.N = 0
         self.N_segments = 0
 
+        # Get panels bordering the Kutta edges and the column of each edge's panels among them
+        self._kutta_panels = np.unique(np.array([edge.panel_indices for edge in self._kutta_edges], dtype=int).flatten())
+        self._edge_columns = np.searchsorted(self._kutta_panels, np.array([edge.panel_indices for edge in self._kutta_edges], dtype=int).reshape((-1, 2)))
+        self._incidence = sp.csr_matrix((0, len(self._kutta_panels)))
+
+        # Get array of the endpoints of all Kutta edges and the incidence matrix giving the strength of each bound vortex; each carries the difference in strength across its edge
+        self._edge_vertices = np.array([edge.vertices for edge in self._kutta_edges], dtype=float).reshape((self._N_edges, 2, 3))
+        self._edge_incidence = sp.csr_matrix((np.tile([-1.0, 1.0], self._N_edges), (np.repeat(np.arange(self._N_edges), 2), self._edge_columns.flatten())), shape=(self._N_edges, len(self._kutta_panels)))
+
 
     def _arrange_kutta_vertices(self):
         # Determines a unique list of the vertices defining all Kutta edges for the wake and the panels associated with each vertex
 
-        if self._N_edges>0:
+        if self._N_edges==0:
+            return np.zeros((0,3)), [], []
+
+        # Get array of all vertices; even rows are the first vertex of each edge and odd rows the second
+        vertices = self._edge_vertices.reshape((2*self._N_edges, 3))
 
-            # Get array of all vertices
-            vertices = np.zeros((2*self._N_edges,3))
-            for i, edge in enumerate(self._kutta_edges):
+        # Determine unique vertices
+        unique_vertices, inverse_indices = np.unique(vertices, return_inverse=True, axis=0)
+        inverse_indices = inverse_indices.flatten()
 
-                # Store vertices
-                vertices[2*i] = edge.vertices[0]
-                vertices[2*i+1] = edge.vertices[1]
+        # Determine associated panels; the first vertex of an edge is the inbound node for its panels and the second is the outbound node
+        inbound_panels = [[] for vertex in unique_vertices]
+        outbound_panels = [[] for vertex in unique_vertices]
+        for j, ind in enumerate(inverse_indices):
+            if j%2==0:
+                inbound_panels[ind] = copy.copy(self._kutta_edges[j//2].panel_indices)
+            else:
+                outbound_panels[ind] = copy.copy(self._kutta_edges[j//2].panel_indices)
 
-            # Determine unique vertices
-            unique_vertices, inverse_indices = np.unique(vertices, return_inverse=True, axis=0)
+        # A filament on the plane of symmetry is cancelled by its mirror image, so it has no strength
+        if self._symmetric:
+            for i in np.flatnonzero(np.abs(unique_vertices[:,1]) <= 1e-10*np.max(np.abs(unique_vertices))):
+                inbound_panels[i] = []
+                outbound_panels[i] = []
 
-            # Initialize filaments
-            inbound_panels = []
-            outbound_panels = []
-            for i, vertex in enumerate(unique_vertices):
+        return unique_vertices, inbound_panels, outbound_panels
 
-                # Determine associated panels
-                ip = []
-                op = []
-                for j, ind in enumerate(inverse_indices):
-                    if ind==i:
-                        if j%2==0: # Inbound node for these panels
-                            ip = copy.copy(self._kutta_edges[j//2].panel_indices)
-                        else: # Outbound node
-                            op = copy.copy(self._kutta_edges[j//2].panel_indices)
 
-                # Store panels
-                inbound_panels.append(ip)
-                outbound_panels.append(op)
+    def _get_incidence_matrix(self):
+        # Determines the sparse signed incidence matrix of the filaments and the panels bordering Kutta edges, which gives the strength of each filament from the doublet strengths of these panels; each filament carries the difference in strength across the edges it bounds
 
-        return unique_vertices, inbound_panels, outbound_panels
+        rows = []
+        cols = []
+        data = []
+        for i in range(self.N):
+            for panels, sign in [(self.outbound_panels[i], -1.0), (self.inbound_panels[i], 1.0)]:
+                if len(panels)>0:
+                    rows += [i, i]
+                    cols += [panels[0], panels[1]]
+                    data += [sign, -sign]
+
+        return sp.csr_matrix((data, (rows, np.searchsorted(self._kutta_panels, cols))), shape=(self.N, len(self._kutta_panels)))
+
+
+    def get_filament_strengths(self, mu):
+        """Determines the vortex strength of each filament.
+
+        Parameters
+        ----------
+        mu : ndarray
+            Doublet strength of each panel of the mesh.
+
+        Returns
+        -------
+        ndarray
+            Strength of each filament.
+        """
+
+        return self._incidence.dot(mu[self._kutta_panels])
+
+
+    def get_compact_influence_matrix(self, **kwargs):
+        """Create the nonzero columns of the wake influence matrix. Only the panels bordering Kutta edges determine the strength of the wake, so all other columns of the full influence matrix are zero.
+
+        Parameters
+        ----------
+        points : ndarray
+            Array of points at which to calculate the influence.
+
+        Returns
+        -------
+        panel_indices : ndarray
+            Sorted indices of the panels to which the columns belong.
+
+        ndarray
+            Trailing vortex influences; first index is the influenced point, second is the column, third is the velocity component.
+        """
+
+        # This dummy wake has no influence
+        points = kwargs.get("points")
+        return np.zeros(0, dtype=int), np.zeros((len(points), 0, 3))
 
 
     def get_influence_matrix(self, **kwargs):
-        """Create wake influence matrix; first index is the influenced panels (bordering the horseshoe vortex), second is the influencing panel, third is the velocity component.
+        """Create wake influence matrix; first index is the influenced points, second is the influencing panel, third is the velocity component. This is mostly zeros; get_compact_influence_matrix() returns only the nonzero columns.
 
         Parameters
         ----------
         points : ndarray
             Array of points at which to calculate the influence.
 
-        u_inf : ndarray
-            Freestream direction vector.
-        
-        omega : ndarray
-            Body-fixed rotation rates.
+        N_panels : int
+            Number of panels in the mesh to which this wake belongs.
 
         Returns
         -------
@@ -83,12 +143,97 @@ class Wake:
             Trailing vortex influences.
         """
 
-        return 0.0
+        panel_indices, inf = self.get_compact_influence_matrix(**kwargs)
+        vortex_influence_matrix = np.zeros((len(inf), kwargs["N_panels"], 3))
+        vortex_influence_matrix[:,panel_indices] = inf
+        return vortex_influence_matrix
+
+
+    def _get_kutta_edge_vortex_influences(self, points):
+        # Determines the velocity induced at the given points by a bound vortex of unit strength along each Kutta edge; first index is the point, second is the edge, third is the velocity component
+
+        # Determine displacement vectors
+        r0 = points[:,np.newaxis,:]-self._edge_vertices[np.newaxis,:,0,:]
+        r1 = points[:,np.newaxis,:]-self._edge_vertices[np.newaxis,:,1,:]
+
+        # Determine displacement vector magnitudes
+        r0_mag = vec_norm(r0)
+        r1_mag = vec_norm(r1)
+
+        # Calculate influence of bound segments
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n = 0.25/np.pi*(r0_mag+r1_mag)/(r0_mag*r1_mag*(r0_mag*r1_mag+vec_inner(r0, r1)))
+        n = np.nan_to_num(n, copy=False)
+        return n[:,:,np.newaxis]*vec_cross(r0, r1)
+
+
+    def _get_kutta_edge_influences(self, points):
+        # Determines the compact influence matrix of the bound vortices along the Kutta edges on the given points
+
+        inf = np.zeros((len(points), len(self._kutta_panels), 3))
+        self._add_influences(inf, self._get_kutta_edge_vortex_influences(points), self._edge_incidence)
+        return inf
+
+
+    def _get_kutta_edge_velocity(self, points, mu):
+        # Determines the velocity induced at the given points by the bound vortices along the Kutta edges
+        return np.einsum('ijk,j', self._get_kutta_edge_vortex_influences(points), self._edge_incidence.dot(mu[self._kutta_panels]))
+
+
+    def _add_influences(self, inf, V, incidence):
+        # Adds the unit influence of each vortex (filament or bound vortex) to the columns of the compact influence matrix belonging to the panels which determine its strength, using the given incidence matrix
+
+        N_points, N_vortices = V.shape[:2]
+        inf += incidence.T.dot(V.transpose((1,0,2)).reshape((N_vortices, 3*N_points))).reshape((-1, N_points, 3)).transpose((1,0,2))
+
+
+    def _get_image_velocity(self, points, mu):
+        # Determines the velocity induced at the given points by the mirror image of the wake about the xz plane
+
+        # Filaments on the plane of symmetry coincide with their images, so points on them lie on the image filaments; these warnings can safely be ignored, as the non-finite influences are zeroed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            panel_indices, inf = self.get_compact_influence_matrix(points=mirror_xz(points))
+        return mirror_xz(np.einsum('ijk,j', inf, mu[panel_indices]))
+
+
+    def get_kutta_panel_indices(self):
+        """Returns the indices of the panels which border the Kutta edges. These are the only panels whose doublet strengths determine the strength of the wake, so all other columns of the wake influence matrix are zero.
+
+        Returns
+        -------
+        ndarray
+            Sorted panel indices.
+        """
+
+        return np.copy(self._kutta_panels)
+
+
+    def get_hash(self):
+        """Returns a hash of the Kutta edges and current filament geometry of this wake, which together determine its influence matrix. This may be used to detect whether the wake has changed.
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-256 digest of the Kutta edges and filament geometry.
+        """
+
+        h = hashlib.sha256()
+        for edge in self._kutta_edges:
+            h.update(np.array(edge.panel_indices, dtype=np.int64).tobytes())
+            h.update(np.ascontiguousarray(edge.vertices, dtype=np.float64).tobytes())
+        for array in self._get_geometry():
+            h.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+
+    def _get_geometry(self):
+        # Returns the arrays which define the shape of the filaments
+        return []
 
 
     def get_vtk_data(self, **kwargs):
         """Returns a list of vertices and line indices describing this wake.
-        
+
         Parameters
         ----------
         length : float, optional
@@ -130,6 +275,7 @@ class StraightFixedWake(Wake):
         # Store number of filaments and segments
         self.N = len(self._vertices)
         self.N_segments = 1
+        self._incidence = self._get_incidence_matrix()
 
         # Initialize filament directions
         self.filament_dirs = np.zeros((self.N, 3))
@@ -167,42 +313,33 @@ class StraightFixedWake(Wake):
             self.filament_dirs /= vec_norm(self.filament_dirs)[:,np.newaxis]
 
 
-    def get_influence_matrix(self, **kwargs):
-        """Create wake influence matrix; first index is the influenced panels, second is the influencing panel, third is the velocity component.
+    def _get_geometry(self):
+        # Returns the arrays which define the shape of the filaments
+        return [self._vertices, self.filament_dirs]
+
+
+    def get_compact_influence_matrix(self, **kwargs):
+        """Create the nonzero columns of the wake influence matrix. Only the panels bordering Kutta edges determine the strength of the wake, so all other columns of the full influence matrix are zero.
 
         Parameters
         ----------
         points : ndarray
             Array of points at which to calculate the influence.
 
-        N_panels : int
-            Number of panels in the mesh to which this wake belongs.
-
         Returns
         -------
+        panel_indices : ndarray
+            Sorted indices of the panels to which the columns belong.
+
         ndarray
-            Trailing vortex influences.
+            Trailing vortex influences; first index is the influenced point, second is the column, third is the velocity component.
         """
 
         # Get kwargs
         points = kwargs.get("points")
 
-        # Initialize storage
-        N = len(points)
-        vortex_influence_matrix = np.zeros((N, kwargs["N_panels"], 3))
-
         # Get influence of edges
-        for edge in self._kutta_edges:
-
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
-
-            # Get infulence
-            V = edge.get_vortex_influence(points)
-
-            # Store
-            vortex_influence_matrix[:,p_ind[0]] = -V
-            vortex_influence_matrix[:,p_ind[1]] = V
+        vortex_influence_matrix = self._get_kutta_edge_influences(points)
 
         # Determine displacement vector magnitudes
         r = points[:,np.newaxis,:]-self._vertices[np.newaxis,:,:]
@@ -210,21 +347,9 @@ class StraightFixedWake(Wake):
 
         # Calculate influences
         V = 0.25/np.pi*vec_cross(self.filament_dirs[np.newaxis,:,:], r)/(r_mag*(r_mag-vec_inner(self.filament_dirs[np.newaxis,:,:], r)))[:,:,np.newaxis]
-        for i in range(self.N):
+        self._add_influences(vortex_influence_matrix, V, self._incidence)
 
-            # Add for outbound panels
-            outbound_panels = self.outbound_panels[i]
-            if len(outbound_panels)>0:
-                vortex_influence_matrix[:,outbound_panels[0],:] -= V[:,i,:]
-                vortex_influence_matrix[:,outbound_panels[1],:] += V[:,i,:]
-
-            # Add for inbound panels
-            inbound_panels = self.inbound_panels[i]
-            if len(inbound_panels)>0:
-                vortex_influence_matrix[:,inbound_panels[0],:] += V[:,i,:]
-                vortex_influence_matrix[:,inbound_panels[1],:] -= V[:,i,:]
-        
-        return vortex_influence_matrix
+        return self.get_kutta_panel_indices(), vortex_influence_matrix
 
 
     def get_vtk_data(self, **kwargs):
@@ -276,6 +401,9 @@ class SegmentedWake(Wake):
 
     end_segment_infinite : bool, optional
         Whether the final segment of the filament should be treated as infinite. Defaults to False.
+
+    chunk_memory : float, optional
+        Approximate amount of memory (in MB) to use for the temporary arrays when calculating the influence of the filaments. The points and filaments are processed in chunks of this size, so memory use does not grow with the number of filaments and segments. Defaults to 256.
     """
 
 
@@ -286,12 +414,14 @@ class SegmentedWake(Wake):
         self.l = kwargs.get('segment_length', 1.0)
         self.N_segments = kwargs.get('N_segments', 20)
         self._end_infinite = kwargs.get("end_segment_infinite", False)
+        self._chunk_memory = kwargs.get("chunk_memory", 256.0)
 
         # Initialize filaments
         vertices, self.inbound_panels, self.outbound_panels = self._arrange_kutta_vertices()
+        self.N = vertices.shape[0]
+        self._incidence = self._get_incidence_matrix()
 
         # Initialize filament points
-        self.N = vertices.shape[0]
         self._vertices = np.zeros((self.N, self.N_segments+1, 3))
         self._vertices[:,0,:] = vertices
 
@@ -317,6 +447,23 @@ class SegmentedWake(Wake):
         self._vertices = origins[:,np.newaxis,:]+np.linspace(0.0, self.N_segments*self.l, self.N_segments+1)[np.newaxis,:,np.newaxis]*self._filament_dirs[:,np.newaxis,:]
 
 
+    def _get_geometry(self):
+        # Returns the arrays which define the shape of the filaments; the number of segments in use may change while the wake is iterated
+        return [self._vertices, [self.N_segments]]
+
+
+    def get_vertices(self):
+        """Returns the vertices of the filaments currently in use.
+
+        Returns
+        -------
+        ndarray
+            Filament vertices; first index is the filament, second is the vertex along the filament, third is the coordinate.
+        """
+
+        return np.copy(self._vertices[:,:self.N_segments+1])
+
+
     def get_vtk_data(self, **kwargs):
         """Returns a list of vertices and line indices describing this wake.
         
@@ -357,72 +504,71 @@ class SegmentedWake(Wake):
         return vertices, line_vertex_indices, self.N*self.N_segments
 
 
-    def get_influence_matrix(self, **kwargs):
-        """Create wake influence matrix; first index is the influenced points, second is the influencing panel, third is the velocity component.
+    def get_compact_influence_matrix(self, **kwargs):
+        """Create the nonzero columns of the wake influence matrix. Only the panels bordering Kutta edges determine the strength of the wake, so all other columns of the full influence matrix are zero.
 
         Parameters
         ----------
         points : ndarray
             Array of points at which to calculate the influence.
 
-        N_panels : int
-            Number of panels in the mesh to which this wake belongs.
-
         Returns
         -------
+        panel_indices : ndarray
+            Sorted indices of the panels to which the columns belong.
+
         ndarray
-            Trailing vortex influences.
+            Trailing vortex influences; first index is the influenced point, second is the column, third is the velocity component.
         """
 
         # Get kwargs
         points = kwargs.get("points")
 
-        # Initialize storage
-        N = len(points)
-        vortex_influence_matrix = np.zeros((N, kwargs["N_panels"], 3))
-
         # Get influence of edges
-        for edge in self._kutta_edges:
+        vortex_influence_matrix = self._get_kutta_edge_influences(points)
 
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
+        # Get influence of filaments
+        self._add_influences(vortex_influence_matrix, self._get_filament_influences(points), self._incidence)
 
-            # Get infulence
-            V = edge.get_vortex_influence(points)
+        return self.get_kutta_panel_indices(), vortex_influence_matrix
 
-            # Store
-            vortex_influence_matrix[:,p_ind[0]] = -V
-            vortex_influence_matrix[:,p_ind[1]] = V
 
-        # Get influence of filaments
-        V = self._get_filament_influences(points)
-        for i in range(self.N):
-
-            # Add for outbound panels
-            outbound_panels = self.outbound_panels[i]
-            if len(outbound_panels)>0:
-                vortex_influence_matrix[:,outbound_panels[0]] -= V[:,i]
-                vortex_influence_matrix[:,outbound_panels[1]] += V[:,i]
-
-            # Add for inbound panels
-            inbound_panels = self.inbound_panels[i]
-            if len(inbound_panels)>0:
-                vortex_influence_matrix[:,inbound_panels[0]] += V[:,i]
-                vortex_influence_matrix[:,inbound_panels[1]] -= V[:,i]
-        
-        return vortex_influence_matrix
+    def _get_filament_vertices(self):
+        # Returns the vertices of the filaments which are currently in use and whether the last segment is infinite
+        return self._vertices, self._end_infinite
 
 
     def _get_filament_influences(self, points):
-        # Determines the unit vortex influence from the wake filaments on the given points
+        # Determines the unit vortex influence from the wake filaments on the given points; first index is the point, second is the filament, third is the velocity component. The points and filaments are processed in chunks so the temporary arrays stay within the memory budget
+
+        vertices, end_infinite = self._get_filament_vertices()
+
+        # Each pair of point and filament requires about 16 temporary values per segment
+        N_pairs = max(1, int(self._chunk_memory*2**20)//(128*max(1, vertices.shape[1]-1)))
+        N_filaments = max(1, min(self.N, N_pairs))
+        N_points = max(1, N_pairs//N_filaments)
+
+        # Loop through chunks
+        inf = np.zeros((len(points), self.N, 3))
+        for i in range(0, len(points), N_points):
+            I = slice(i, min(i+N_points, len(points)))
+            for j in range(0, self.N, N_filaments):
+                J = slice(j, min(j+N_filaments, self.N))
+                inf[I,J] = self._get_chunk_influences(points[I], vertices[J], end_infinite)
+
+        return inf
+
+
+    def _get_chunk_influences(self, points, vertices, end_infinite):
+        # Determines the unit vortex influence of the filaments with the given vertices on the given points
 
         # Determine displacement vectors: first index is point, second is filament, third is segment, fourth is vector component
-        if self._end_infinite:
-            r0 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,:-2,:] # Don't add the last segment at this point
-            r1 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,1:-1,:]
+        if end_infinite:
+            r0 = points[:,np.newaxis,np.newaxis,:]-vertices[np.newaxis,:,:-2,:] # Don't add the last segment at this point
+            r1 = points[:,np.newaxis,np.newaxis,:]-vertices[np.newaxis,:,1:-1,:]
         else:
-            r0 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,:-1,:]
-            r1 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,1:,:]
+            r0 = points[:,np.newaxis,np.newaxis,:]-vertices[np.newaxis,:,:-1,:]
+            r1 = points[:,np.newaxis,np.newaxis,:]-vertices[np.newaxis,:,1:,:]
 
         # Determine displacement vector magnitudes
         r0_mag = vec_norm(r0)
@@ -432,12 +578,12 @@ class SegmentedWake(Wake):
         inf = np.sum(((r0_mag+r1_mag)/(r0_mag*r1_mag*(r0_mag*r1_mag+vec_inner(r0, r1))))[:,:,:,np.newaxis]*vec_cross(r0, r1), axis=2)
 
         # Add influence of last segment, if needed
-        if self._end_infinite:
+        if end_infinite:
 
             # Determine displacement vector magnitudes
-            r = r1[:,:,-1,:]
+            r = points[:,np.newaxis,:]-vertices[np.newaxis,:,-2,:]
             r_mag = vec_norm(r)
-            u = self._vertices[:,-1,:]-self._vertices[:,-2,:]
+            u = vertices[:,-1,:]-vertices[:,-2,:]
             u /= vec_norm(u)[:,np.newaxis]
 
             # Calculate influence
@@ -446,6 +592,27 @@ class SegmentedWake(Wake):
         return 0.25/np.pi*np.nan_to_num(inf)
 
 
+    def _get_velocity_from_other_filaments_and_edges(self, points, mu):
+        # Determines the velocity at each point (assumed to be one on each filament in order) induced by all other filaments and Kutta edges
+
+        # Get filament influences
+        with np.errstate(divide='ignore', invalid='ignore'):
+            V = self._get_filament_influences(points) # On the first segment of the first iteration, this will throw warnings because the initial point is on the filament; these can safely be ignored
+
+        # Remove the influence of each filament on its own point and add the influence of the others
+        V[np.arange(self.N),np.arange(self.N)] = 0.0
+        v_ind = np.einsum('ijk,j', V, self.get_filament_strengths(mu))
+
+        # Add influence of edges
+        v_ind += self._get_kutta_edge_velocity(points, mu)
+
+        # Add influence of the mirror image
+        if self._symmetric:
+            v_ind += self._get_image_velocity(points, mu)
+
+        return v_ind
+
+
 class FullStreamlineWake(SegmentedWake):
     """Defines a segmented wake which is updated to trace out entire streamlines beginning at the Kutta edges on each iteration.
 
@@ -463,6 +630,9 @@ class FullStreamlineWake(SegmentedWake):
     end_segment_infinite : bool, optional
         Whether the final segment of the filament should be treated as infinite. Defaults to False.
 
+    chunk_memory : float, optional
+        Approximate amount of memory (in MB) to use for the temporary arrays when calculating the influence of the filaments. The points and filaments are processed in chunks of this size, so memory use does not grow with the number of filaments and segments. Defaults to 256.
+
     corrector_iterations : int, optional
         How many times to correct the streamline (velocity) prediction for each segment. Defaults to 1.
     """
@@ -540,50 +710,6 @@ class FullStreamlineWake(SegmentedWake):
         self._vertices[:,1:,:] = new_locs
 
 
-    def _get_velocity_from_other_filaments_and_edges(self, points, mu):
-        # Determines the velocity at each point (assumed to be one on each filament in order) induced by all other filaments and Kutta edges
-
-        # Initialize storage
-        v_ind = np.zeros((self.N, 3))
-
-        # Get filament influences
-        with np.errstate(divide='ignore', invalid='ignore'):
-            V = self._get_filament_influences(points) # On the first segment of the first iteration, this will throw warnings because the initial point is on the filament; these can safely be ignored
-
-        # Loop through filaments
-        for i in range(self.N):
-
-            # Get indices of points not belonging to this filament
-            ind = [j for j in range(self.N) if j!=i]
-
-            # Add for outbound panels
-            outbound_panels = self.outbound_panels[i]
-            if len(outbound_panels)>0:
-                v_ind[ind] -= V[ind,i]*mu[outbound_panels[0]]
-                v_ind[ind] += V[ind,i]*mu[outbound_panels[1]]
-
-            # Add for inbound panels
-            inbound_panels = self.inbound_panels[i]
-            if len(inbound_panels)>0:
-                v_ind[ind] += V[ind,i]*mu[inbound_panels[0]]
-                v_ind[ind] -= V[ind,i]*mu[inbound_panels[1]]
-
-        # Get influence of edges
-        for edge in self._kutta_edges:
-
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
-
-            # Get infulence
-            v = edge.get_vortex_influence(points)
-
-            # Store
-            v_ind += -v*mu[p_ind[0]]
-            v_ind += v*mu[p_ind[1]]
-
-        return v_ind
-
-
 class VelocityRelaxedWake(SegmentedWake):
     """Defines a segmented wake which is updated by shifting the segment vertices by the induced velocity on each iteration.
 
@@ -601,6 +727,9 @@ class VelocityRelaxedWake(SegmentedWake):
     end_segment_infinite : bool, optional
         Whether the final segment of the filament should be treated as infinite. Defaults to False.
 
+    chunk_memory : float, optional
+        Approximate amount of memory (in MB) to use for the temporary arrays when calculating the influence of the filaments. The points and filaments are processed in chunks of this size, so memory use does not grow with the number of filaments and segments. Defaults to 256.
+
     K : float
         Time stepping factor for shifting the filament vertices based on the local induced velocity and distance from the trailing edge.
     """
@@ -670,33 +799,15 @@ class VelocityRelaxedWake(SegmentedWake):
         with np.errstate(divide='ignore', invalid='ignore'):
             V = self._get_filament_influences(points)
 
-        # Loop through filaments
-        for i in range(self.N):
+        # Add influence of filaments
+        v_ind += np.einsum('ijk,j', V, self.get_filament_strengths(mu))
 
-            # Add for outbound panels
-            outbound_panels = self.outbound_panels[i]
-            if len(outbound_panels)>0:
-                v_ind[:] -= V[:,i]*mu[outbound_panels[0]]
-                v_ind[:] += V[:,i]*mu[outbound_panels[1]]
+        # Add influence of edges
+        v_ind += self._get_kutta_edge_velocity(points, mu)
 
-            # Add for inbound panels
-            inbound_panels = self.inbound_panels[i]
-            if len(inbound_panels)>0:
-                v_ind[:] += V[:,i]*mu[inbound_panels[0]]
-                v_ind[:] -= V[:,i]*mu[inbound_panels[1]]
-
-        # Get influence of edges
-        for edge in self._kutta_edges:
-
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
-
-            # Get infulence
-            v = edge.get_vortex_influence(points)
-
-            # Store
-            v_ind += -v*mu[p_ind[0]]
-            v_ind += v*mu[p_ind[1]]
+        # Add influence of the mirror image
+        if self._symmetric:
+            v_ind += self._get_image_velocity(points, mu)
 
         return v_ind
 
@@ -718,6 +829,9 @@ class MarchingStreamlineWake(SegmentedWake):
     end_segment_infinite : bool, optional
         Whether the final segment of the filament should be treated as infinite. Defaults to False.
 
+    chunk_memory : float, optional
+        Approximate amount of memory (in MB) to use for the temporary arrays when calculating the influence of the filaments. The points and filaments are processed in chunks of this size, so memory use does not grow with the number of filaments and segments. Defaults to 256.
+
     corrector_iterations : int, optional
         How many times to correct the streamline (velocity) prediction for each segment. Defaults to 1.
     """
@@ -787,78 +901,39 @@ class MarchingStreamlineWake(SegmentedWake):
         return vertices, line_vertex_indices, self.N*self.N_segments
 
 
-    def get_influence_matrix(self, **kwargs):
-        """Create wake influence matrix; first index is the influenced points, second is the influencing panel, third is the velocity component.
+    def get_compact_influence_matrix(self, **kwargs):
+        """Create the nonzero columns of the wake influence matrix. Only the panels bordering Kutta edges determine the strength of the wake, so all other columns of the full influence matrix are zero.
 
         Parameters
         ----------
         points : ndarray
             Array of points at which to calculate the influence.
 
-        N_panels : int
-            Number of panels in the mesh to which this wake belongs.
-
         Returns
         -------
+        panel_indices : ndarray
+            Sorted indices of the panels to which the columns belong.
+
         ndarray
-            Trailing vortex influences.
+            Trailing vortex influences; first index is the influenced point, second is the column, third is the velocity component.
         """
 
         # Get kwargs
         points = kwargs.get("points")
 
-        # Initialize storage
-        N = len(points)
-        vortex_influence_matrix = np.zeros((N, kwargs["N_panels"], 3))
-
         # Get influence of edges
-        for edge in self._kutta_edges:
-
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
-
-            # Get infulence
-            V = edge.get_vortex_influence(points)
-
-            # Store
-            vortex_influence_matrix[:,p_ind[0]] = -V
-            vortex_influence_matrix[:,p_ind[1]] = V
+        vortex_influence_matrix = self._get_kutta_edge_influences(points)
 
         # Get influence of filaments
         if self.N_segments > 0:
-            V = self._get_filament_influences(points)
-            for i in range(self.N):
-
-                # Add for outbound panels
-                outbound_panels = self.outbound_panels[i]
-                if len(outbound_panels)>0:
-                    vortex_influence_matrix[:,outbound_panels[0]] -= V[:,i]
-                    vortex_influence_matrix[:,outbound_panels[1]] += V[:,i]
-
-                # Add for inbound panels
-                inbound_panels = self.inbound_panels[i]
-                if len(inbound_panels)>0:
-                    vortex_influence_matrix[:,inbound_panels[0]] += V[:,i]
-                    vortex_influence_matrix[:,inbound_panels[1]] -= V[:,i]
-        
-        return vortex_influence_matrix
-
-
-    def _get_filament_influences(self, points):
-        # Determines the unit vortex influence from the wake filaments on the given points
+            self._add_influences(vortex_influence_matrix, self._get_filament_influences(points), self._incidence)
 
-        # Determine displacement vectors: first index is point, second is filament, third is segment, fourth is vector component
-        r0 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,:self.N_segments,:]
-        r1 = points[:,np.newaxis,np.newaxis,:]-self._vertices[np.newaxis,:,1:self.N_segments+1,:]
-
-        # Determine displacement vector magnitudes
-        r0_mag = vec_norm(r0)
-        r1_mag = vec_norm(r1)
+        return self.get_kutta_panel_indices(), vortex_influence_matrix
 
-        # Calculate influence of each segment
-        inf = np.sum(((r0_mag+r1_mag)/(r0_mag*r1_mag*(r0_mag*r1_mag+vec_inner(r0, r1))))[:,:,:,np.newaxis]*vec_cross(r0, r1), axis=2)
 
-        return 0.25/np.pi*np.nan_to_num(inf)
+    def _get_filament_vertices(self):
+        # Returns the vertices of the segments which have been added so far; the last segment is never infinite
+        return self._vertices[:,:self.N_segments+1], False
 
 
 
@@ -929,47 +1004,3 @@ class MarchingStreamlineWake(SegmentedWake):
 
         # Store the new locations
         self._vertices[:,1:self.N_segments+1,:] = new_locs
-
-
-    def _get_velocity_from_other_filaments_and_edges(self, points, mu):
-        # Determines the velocity at each point (assumed to be one on each filament in order) induced by all other filaments and Kutta edges
-
-        # Initialize storage
-        v_ind = np.zeros((self.N, 3))
-
-        # Get filament influences
-        with np.errstate(divide='ignore', invalid='ignore'):
-            V = self._get_filament_influences(points) # On the first segment of the first iteration, this will throw warnings because the initial point is on the filament; these can safely be ignored
-
-        # Loop through filaments
-        for i in range(self.N):
-
-            # Get indices of points not belonging to this filament
-            ind = [j for j in range(self.N) if j!=i]
-
-            # Add for outbound panels
-            outbound_panels = self.outbound_panels[i]
-            if len(outbound_panels)>0:
-                v_ind[ind] -= V[ind,i]*mu[outbound_panels[0]]
-                v_ind[ind] += V[ind,i]*mu[outbound_panels[1]]
-
-            # Add for inbound panels
-            inbound_panels = self.inbound_panels[i]
-            if len(inbound_panels)>0:
-                v_ind[ind] += V[ind,i]*mu[inbound_panels[0]]
-                v_ind[ind] -= V[ind,i]*mu[inbound_panels[1]]
-
-        # Get influence of edges
-        for edge in self._kutta_edges:
-
-            # Get indices of panels defining the edge
-            p_ind = edge.panel_indices
-
-            # Get infulence
-            v = edge.get_vortex_influence(points)
-
-            # Store
-            v_ind += -v*mu[p_ind[0]]
-            v_ind += v*mu[p_ind[1]]
-
-        return v_ind
\ No newline at end of file
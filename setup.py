@@ -11,7 +11,7 @@ setup(name = 'PyPan',
     author = 'usuaero',
     author_email = 'doug.hunsaker@usu.edu',
     install_requires = ['numpy>=1.18', 'scipy>=1.4', 'pytest', 'matplotlib', 'numpy-stl', 'pyvista'],
-    python_requires ='>=3.6.0',
+    python_requires ='>=3.8',
     license = 'MIT',
     packages = ['pypan', 'panair'],
     zip_safe = False)
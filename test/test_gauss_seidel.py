@@ -0,0 +1,60 @@
+import os
+
+import pytest
+import numpy as np
+import pypan.gauss_seidel as gs
+
+from pypan.gauss_seidel import gauss_seidel, gauss_seidel_multiprocess
+
+
+def get_system(N=40):
+    # Returns a symmetric positive-definite system
+
+    rng = np.random.default_rng(0)
+    M = rng.standard_normal((N, N))
+    A = np.matmul(M.T, M)+N*np.identity(N)
+    x = rng.standard_normal(N)
+    return A, np.matmul(A, x), x
+
+
+def test_gauss_seidel_converges():
+
+    A, b, x = get_system()
+    assert np.allclose(gauss_seidel(A, b, gs_block_size=8), x, rtol=0.0, atol=1e-8)
+
+
+def test_gauss_seidel_warns_if_not_converged():
+
+    A, b, x = get_system()
+    with pytest.warns(UserWarning, match="did not converge"):
+        gauss_seidel(A, b, gs_block_size=8, gs_max_iterations=1)
+
+
+def test_parallel_gauss_seidel_converges():
+
+    A, b, x = get_system()
+    assert np.allclose(gauss_seidel_multiprocess(A, b, gs_block_size=8, gs_n_workers=2), x, rtol=0.0, atol=1e-8)
+
+
+def test_parallel_gauss_seidel_stops_when_updates_fail():
+
+    # This system is not positive definite, so the block Jacobi update is not a descent direction and iteration stops at once
+    A = np.array([[1.0, 3.0], [3.0, 1.0]])
+    b = np.array([1.0, -1.0])
+    with pytest.warns(UserWarning, match="stopped reducing the residual"):
+        x = gauss_seidel_multiprocess(A, b, gs_block_size=1, gs_n_workers=2)
+    assert np.allclose(x, 0.0)
+
+
+def _crashing_worker(connection, *args):
+    # Exits without replying, as if killed
+
+    os._exit(1)
+
+
+def test_parallel_gauss_seidel_raises_if_worker_dies(monkeypatch):
+
+    A, b, x = get_system()
+    monkeypatch.setattr(gs, "_gauss_seidel_worker", _crashing_worker)
+    with pytest.raises(RuntimeError, match="exited unexpectedly"):
+        gauss_seidel_multiprocess(A, b, gs_block_size=8, gs_n_workers=2)
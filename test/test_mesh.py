@@ -0,0 +1,17 @@
+import os
+
+import numpy as np
+import pypan as pp
+
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def test_ring_influences_match_panel_loop():
+
+    # The vectorized edge kernel should give the same influences as summing the influence of each panel, both at and away from the control points
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    points = np.concatenate((mesh.cp[::40], mesh.cp[::40]+0.1*mesh.n[::40]))
+    inf = mesh.get_ring_influences(points)
+    inf_loop = np.stack([panel.get_ring_influence(points) for panel in mesh.panels], axis=1)
+    assert np.allclose(inf, inf_loop, rtol=0.0, atol=1e-10*np.max(np.abs(inf_loop)))
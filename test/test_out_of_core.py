@@ -0,0 +1,19 @@
+import pytest
+import numpy as np
+
+from pypan.out_of_core import normal_equations, cholesky, cholesky_solve
+
+
+@pytest.mark.parametrize("N_block", [7, 16, 40])
+def test_blocked_cholesky_gives_least_squares_solution(N_block, tmp_path):
+
+    # Block sizes which do and do not divide the number of columns, and a single block
+    rng = np.random.default_rng(0)
+    A = np.memmap(str(tmp_path / "A.dat"), dtype=np.float64, mode='w+', shape=(60, 40))
+    A[:] = rng.standard_normal((60, 40))
+    b = rng.standard_normal(60)
+    C = np.memmap(str(tmp_path / "C.dat"), dtype=np.float64, mode='w+', shape=(40, 40))
+    Atb = normal_equations(A, b, C, N_block)
+    cholesky(C, N_block)
+    x = cholesky_solve(C, Atb, N_block)
+    assert np.allclose(x, np.linalg.lstsq(A, b, rcond=None)[0], rtol=0.0, atol=1e-12)
@@ -0,0 +1,245 @@
+import os
+import warnings
+
+import pytest
+import numpy as np
+import pypan as pp
+
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def solve_swept_wing(solve_kwargs={}, **kwargs):
+    # Solves for the flow around the swept wing with the given solver and solve() options
+
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    mesh.set_wake(type="fixed")
+    solver = pp.VortexRingSolver(mesh=mesh, **kwargs)
+    solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+    F, M = solver.solve(**solve_kwargs)
+    return F, M, solver._mu
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_far_field_serial_and_parallel_assembly_match(low_memory):
+
+    # The points at which influences are approximated should not depend on how the rows are divided
+    F_serial, M_serial, mu_serial = solve_swept_wing(far_field_ratio=5.0, low_memory=low_memory)
+    F_parallel, M_parallel, mu_parallel = solve_swept_wing(far_field_ratio=5.0, low_memory=low_memory, n_workers=2)
+    assert np.allclose(mu_parallel, mu_serial, rtol=0.0, atol=1e-10*np.max(np.abs(mu_serial)))
+    assert np.allclose(F_parallel, F_serial, rtol=1e-10, atol=1e-10*np.linalg.norm(F_serial))
+
+
+@pytest.mark.parametrize("low_rank_wake", [True, False])
+def test_lu_gives_least_squares_solution(low_rank_wake):
+
+    # The panel equations of the closed wing cannot all be satisfied, so this checks the right-hand side is projected onto the range of the least-squares system
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    F_lu, M_lu, mu_lu = solve_swept_wing(solve_kwargs={"method" : "lu", "low_rank_wake" : low_rank_wake})
+    assert np.allclose(mu_lu, mu_svd, rtol=0.0, atol=1e-8*np.max(np.abs(mu_svd)))
+    assert np.allclose(F_lu, F_svd, rtol=0.0, atol=1e-8*np.linalg.norm(F_svd))
+
+
+@pytest.mark.parametrize("method", ["direct", "lu"])
+def test_low_rank_wake_update_matches_full_factorization(method):
+
+    # The wake follows the freestream, so the second condition needs a new update; the normal equations of the full system are poorly conditioned, so the difference may be as large as the error of the full factorization
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    mesh.set_wake(type="fixed")
+    solver = pp.VortexRingSolver(mesh=mesh)
+    for V_inf in [[-100.0, 0.0, -10.0], [-100.0, 5.0, 0.0]]:
+        solver.set_condition(V_inf=V_inf, rho=1.0)
+        solver.solve(method=method, low_rank_wake=True)
+        mu_update = np.copy(solver._mu)
+        solver.solve(method=method, low_rank_wake=False)
+        mu_full = np.copy(solver._mu)
+        solver.solve(method="svd")
+        full_error = np.max(np.abs(mu_full-solver._mu))
+        assert np.max(np.abs(mu_update-mu_full)) <= 1e-8*np.max(np.abs(mu_full))+1.1*full_error
+
+
+def test_out_of_core_matches_direct(tmp_path):
+
+    # The tiles are smaller than the mesh, so the off-diagonal blocks are used; both solve the poorly conditioned normal equations, so the doublet strengths only agree to about the error of 'direct'
+    F_direct, M_direct, mu_direct = solve_swept_wing(solve_kwargs={"method" : "direct", "low_rank_wake" : False})
+    F, M, mu = solve_swept_wing(solve_kwargs={"method" : "direct"}, scratch_dir=str(tmp_path), tile_memory=5.0)
+    assert np.allclose(mu, mu_direct, rtol=0.0, atol=1e-2*np.max(np.abs(mu_direct)))
+    assert np.allclose(F, F_direct, rtol=0.0, atol=1e-5*np.linalg.norm(F_direct))
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_dense_gmres_gives_least_squares_solution(low_memory):
+
+    # For the dense matrix type, GMRES should find the same least-squares solution as the other methods rather than one with a nonzero multiplier
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    F_gmres, M_gmres, mu_gmres = solve_swept_wing(solve_kwargs={"method" : "gmres", "gmres_convergence" : 1e-12}, low_memory=low_memory)
+    assert np.allclose(mu_gmres, mu_svd, rtol=0.0, atol=1e-6*np.max(np.abs(mu_svd)))
+    assert np.allclose(F_gmres, F_svd, rtol=0.0, atol=1e-6*np.linalg.norm(F_svd))
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+@pytest.mark.parametrize("method", ["direct", "lu", "svd", "qr"])
+def test_mixed_precision_gives_least_squares_solution(method, low_memory):
+
+    # Every method should give the double-precision least-squares solution, not that of the rounded system
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    F_mixed, M_mixed, mu_mixed = solve_swept_wing(solve_kwargs={"method" : method, "refinement_convergence" : 1e-14}, precision="mixed", low_memory=low_memory)
+    assert np.allclose(mu_mixed, mu_svd, rtol=0.0, atol=1e-9*np.max(np.abs(mu_svd)))
+    assert np.allclose(F_mixed, F_svd, rtol=0.0, atol=1e-6*np.linalg.norm(F_svd))
+
+
+def test_mixed_precision_warns_if_refinement_not_converged():
+
+    with pytest.warns(UserWarning, match="did not converge"):
+        solve_swept_wing(solve_kwargs={"method" : "direct", "refinement_max_iterations" : 1, "refinement_convergence" : 1e-30}, precision="mixed")
+
+
+def test_mixed_precision_rejects_gmres():
+
+    with pytest.raises(IOError):
+        solve_swept_wing(solve_kwargs={"method" : "gmres"}, precision="mixed")
+
+
+@pytest.mark.parametrize("matrix_type,method,option,coarse,fine", [("fmm", "gmres", "fmm_theta", 0.5, 0.2), ("hmatrix", "gmres", "hmatrix_tolerance", 1e-6, 1e-10), ("hmatrix", "lu", "hmatrix_tolerance", 1e-6, 1e-10)])
+def test_matrix_free_converges_to_least_squares_solution(matrix_type, method, option, coarse, fine):
+
+    # The approximations should approach the least-squares solution of the exact panel equations as they are refined
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    errors = []
+    for value in [coarse, fine]:
+        F, M, mu = solve_swept_wing(solve_kwargs={"method" : method, "gmres_convergence" : 1e-12}, matrix_type=matrix_type, **{option : value})
+        errors.append(np.max(np.abs(mu-mu_svd))/np.max(np.abs(mu_svd)))
+    assert errors[1] < 0.1*errors[0]
+    assert errors[1] < 1e-4
+    assert np.allclose(F, F_svd, rtol=0.0, atol=1e-4*np.linalg.norm(F_svd))
+
+
+@pytest.mark.parametrize("tolerance", [1e-4, 1e-6, 1e-8])
+def test_hierarchical_lu_meets_tolerance(tolerance):
+
+    # The H-LU solution is refined against the hierarchical matrix, so its error should be set by the accuracy of the hierarchical matrix
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    F, M, mu = solve_swept_wing(solve_kwargs={"method" : "lu"}, matrix_type="hmatrix", hmatrix_tolerance=tolerance)
+    assert np.max(np.abs(mu-mu_svd))/np.max(np.abs(mu_svd)) < 100.0*tolerance
+
+
+def get_influence_matrix(solver):
+    # Returns the stored panel influence matrix of the solver
+
+    return np.array(solver._panel_normal_influence_matrix if solver._low_memory else solver._panel_influence_matrix)
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_move_vertices_matches_new_solver(low_memory, tmp_path):
+
+    # Moving no distance should not change the matrix
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    solver = pp.VortexRingSolver(mesh=mesh, far_field_ratio=5.0, low_memory=low_memory, cache_dir=str(tmp_path))
+    vertices = np.arange(100, 110)
+    inf_mat = get_influence_matrix(solver)
+    solver.move_vertices(vertices, mesh.vertices[vertices])
+    assert np.array_equal(get_influence_matrix(solver), inf_mat)
+
+    # The updated matrix should be the same as that calculated for the moved mesh, which should be found in the cache
+    positions = mesh.vertices[vertices]+np.array([0.0, 0.0, 0.01])
+    solver.move_vertices(vertices, positions)
+    moved_mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    moved_mesh.move_vertices(vertices, positions)
+    new_solver = pp.VortexRingSolver(mesh=moved_mesh, far_field_ratio=5.0, low_memory=low_memory, cache_dir=str(tmp_path))
+    assert new_solver._cache.hits == 1
+    uncached_solver = pp.VortexRingSolver(mesh=moved_mesh, far_field_ratio=5.0, low_memory=low_memory)
+    assert np.allclose(get_influence_matrix(solver), get_influence_matrix(uncached_solver), rtol=0.0, atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["direct", "lu"])
+def test_body_factorization_is_cached(method, tmp_path):
+
+    # A second solver for the same mesh should load both the influence matrix and the factorization of the system without the wake from the cache
+    F, M, mu = solve_swept_wing(solve_kwargs={"method" : method}, cache_dir=str(tmp_path))
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    mesh.set_wake(type="fixed")
+    solver = pp.VortexRingSolver(mesh=mesh, cache_dir=str(tmp_path))
+    solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+    F_cached, M_cached = solver.solve(method=method)
+    assert solver._cache.hits == 3
+    assert solver._cache.misses == 0
+    assert np.allclose(solver._mu, mu, rtol=0.0, atol=1e-12*np.max(np.abs(mu)))
+    assert np.allclose(F_cached, F, rtol=0.0, atol=1e-12*np.linalg.norm(F))
+
+
+@pytest.mark.parametrize("method", ["direct", "lu"])
+def test_superposition_matches_solve(method):
+
+    # The wake does not depend on the condition, so superposing the basis solutions should be exact
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    mesh.set_wake(type="fixed", fixed_direction_type="custom", custom_dir=[-1.0, 0.0, -0.1])
+    solver = pp.VortexRingSolver(mesh=mesh)
+    solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+    solver.compute_basis_solutions(method=method)
+    solver.set_condition(V_inf=[-80.0, 7.0, -15.0], rho=1.2, angular_rate=[0.3, -0.2, 0.5])
+    F_superposed, M_superposed = solver.solve(method="superposition")
+    mu_superposed = np.copy(solver._mu)
+    F, M = solver.solve(method=method)
+    assert np.allclose(mu_superposed, solver._mu, rtol=0.0, atol=1e-9*np.max(np.abs(solver._mu)))
+    assert np.allclose(F_superposed, F, rtol=0.0, atol=1e-10*np.linalg.norm(F))
+    assert np.allclose(M_superposed, M, rtol=0.0, atol=1e-10*np.linalg.norm(M))
+
+
+def solve_gmres_counting_iterations(solver, V_inf):
+    # Solves the given condition using GMRES, returning the total number of GMRES iterations including those for the projection of the right-hand side
+
+    iterations = []
+    solve_matrix_free = solver._solve_matrix_free
+    def counting_solve_matrix_free(*args):
+        result = solve_matrix_free(*args)
+        iterations.append(len(result[1])+len(result[3]))
+        return result
+    solver._solve_matrix_free = counting_solve_matrix_free
+    solver.set_condition(V_inf=V_inf, rho=1.0)
+    solver.solve(method="gmres")
+    del solver._solve_matrix_free
+    return sum(iterations)
+
+
+def test_warm_start_reduces_iterations():
+
+    # Starting from the scaled solution of a nearby condition should take fewer iterations to reach the same solution
+    solvers = []
+    for i in range(2):
+        mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+        mesh.set_wake(type="fixed", fixed_direction_type="custom", custom_dir=[-1.0, 0.0, -0.1])
+        solvers.append(pp.VortexRingSolver(mesh=mesh))
+    cold, warm = solvers
+    cold_iterations = solve_gmres_counting_iterations(cold, [-100.0, 0.0, -12.0])
+    solve_gmres_counting_iterations(warm, [-100.0, 0.0, -10.0])
+    warm_iterations = solve_gmres_counting_iterations(warm, [-100.0, 0.0, -12.0])
+    assert warm_iterations < cold_iterations
+    assert np.allclose(warm._mu, cold._mu, rtol=0.0, atol=1e-7*np.max(np.abs(cold._mu)))
+
+
+def test_qr_gives_least_squares_solution():
+
+    # The swept wing is well conditioned, so this should not warn
+    F_svd, M_svd, mu_svd = solve_swept_wing(solve_kwargs={"method" : "svd"})
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        F_qr, M_qr, mu_qr = solve_swept_wing(solve_kwargs={"method" : "qr"})
+    assert np.allclose(mu_qr, mu_svd, rtol=0.0, atol=1e-8*np.max(np.abs(mu_svd)))
+    assert np.allclose(F_qr, F_svd, rtol=0.0, atol=1e-8*np.linalg.norm(F_svd))
+
+
+@pytest.mark.parametrize("method", ["qr", "svd"])
+def test_rank_deficient_system_warns(method):
+
+    # Giving two panels the same influence makes the system rank deficient, as if a panel were duplicated
+    mesh = pp.Mesh(name="swept_wing", mesh_file=os.path.join(EXAMPLES_DIR, "swept_wing.vtk"))
+    mesh.set_wake(type="fixed")
+    solver = pp.VortexRingSolver(mesh=mesh)
+    solver._panel_influence_matrix[:,1] = solver._panel_influence_matrix[:,0]
+    solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+    with pytest.warns(UserWarning, match="ill-conditioned"):
+        solver.solve(method=method)
+
+    # The dependent column is given zero doublet strength
+    if method == "qr":
+        assert solver._mu[0] == 0.0 or solver._mu[1] == 0.0
@@ -0,0 +1,88 @@
+import os
+import warnings
+
+import numpy as np
+import pypan as pp
+
+from pypan.kutta_edges import KuttaEdge
+from pypan.wake import StraightFixedWake
+
+
+MESH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dev", "meshes")
+
+
+def test_symmetric_relaxed_wake_no_warnings():
+
+    # Load half wing
+    mesh = pp.Mesh(name="half_wing", mesh_file=os.path.join(MESH_DIR, "half_wing.vtk"), symmetric=True)
+    mesh.set_wake(type="relaxed", N_segments=5, segment_length=0.5, K=0.1)
+    solver = pp.VortexRingSolver(mesh=mesh)
+    solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+
+    # Filaments on the plane of symmetry coincide with their images, which should not raise warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        F, M = solver.solve(wake_iterations=2)
+
+    assert np.all(np.isfinite(F))
+    assert abs(F[1]) < 1e-12
+
+
+def test_panel_bordering_two_kutta_edges():
+
+    # Panel 0 borders both edges, which are far enough apart that their filaments are separate
+    edges = [KuttaEdge([0.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0, 1]), KuttaEdge([0.0, 3.0, 0.0], [0.0, 4.0, 0.0], [0, 2])]
+    points = np.array([[0.5, 0.5, 0.2], [-0.3, 2.0, -0.1], [1.0, 3.5, 0.5]])
+
+    # Get influence of each edge alone and of both together
+    influences = []
+    for kutta_edges in [edges[:1], edges[1:], edges]:
+        wake = StraightFixedWake(kutta_edges=kutta_edges, fixed_direction_type="custom", custom_dir=[1.0, 0.0, 0.0])
+        influences.append(wake.get_influence_matrix(points=points, N_panels=3))
+
+    # The influences of both edges on panel 0 should add
+    assert np.allclose(influences[2], influences[0]+influences[1], rtol=0.0, atol=1e-14)
+    assert not np.allclose(influences[2][:,0], influences[1][:,0])
+
+
+def test_chunked_filament_influences_are_exact():
+
+    # Get influences of the relaxed wake on the control points with the given number of point-filament pairs per chunk
+    def get_filament_influences(N_pairs):
+        mesh = pp.Mesh(name="half_wing", mesh_file=os.path.join(MESH_DIR, "half_wing.vtk"), symmetric=True)
+        mesh.set_wake(type="relaxed", N_segments=5, segment_length=0.5, K=0.1, chunk_memory=N_pairs*128*5/2**20)
+        solver = pp.VortexRingSolver(mesh=mesh)
+        solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+        return mesh.wake.N, mesh.wake._get_filament_influences(mesh.cp)
+
+    # One chunk holds everything
+    N, inf_single = get_filament_influences(10**8)
+
+    # 4 pairs splits the filaments into chunks with a partial last chunk; 3N+2 pairs splits the points likewise
+    for N_pairs in [4, 3*N+2]:
+        _, inf_chunked = get_filament_influences(N_pairs)
+        assert np.allclose(inf_chunked, inf_single, rtol=0.0, atol=1e-14)
+
+
+def test_wake_tolerance_stops_iterations():
+
+    # Get convergence history of the relaxed wake on the half wing
+    def get_history(**kwargs):
+        mesh = pp.Mesh(name="half_wing", mesh_file=os.path.join(MESH_DIR, "half_wing.vtk"), symmetric=True)
+        mesh.set_wake(type="relaxed", N_segments=5, segment_length=0.5, K=0.1)
+        solver = pp.VortexRingSolver(mesh=mesh)
+        solver.set_condition(V_inf=[-100.0, 0.0, -10.0], rho=1.0)
+        solver.solve(wake_iterations=10, **kwargs)
+        return solver.get_wake_convergence_history()
+
+    # Without a tolerance, every update is recorded
+    full_history = get_history()
+    assert full_history.shape == (10, 3)
+
+    # With a tolerance, the iterations stop at the first update which meets it
+    history = get_history(wake_tolerance=0.05)
+    meets_tolerance = np.all(full_history[:,[0,2]] < 0.05, axis=1)
+    N_updates = np.argmax(meets_tolerance)+1
+    assert meets_tolerance.any() and 1 < N_updates < 10
+    assert history.shape == (N_updates, 3)
+    assert np.allclose(history, full_history[:N_updates], rtol=1e-12, atol=0.0)